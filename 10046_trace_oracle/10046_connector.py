@@ -4,32 +4,72 @@
 Author: Luca.Canali@cern.ch  |  Modernized for Python 3
 
 Emits *cumulative* power-of-two bucket counts so LatencyMap.py can compute per-interval deltas.
+Reads stdin, or with --follow every .trc file of a trace directory (or glob) as it grows
+(from the end of the files already there, as tail -f, unless --from-start).
+Several --event options (or --event='*') extract many wait events in one pass, one record stream each.
+--file parses a large archived trace in parallel, in chunks of a memory-mapped file.
 """
 
+import os
 import sys
+import bisect
+import glob
+import json
 import math
+import mmap
 import time
 import argparse
 import re
-from typing import Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 WAIT_RE = re.compile(
-    r"^WAIT\s+#.*?\b(?:nam|name)='(?P<name>[^']+)'.*?\bela=\s*(?P<ela>\d+)\b.*?\btim=\s*(?P<tim>\d+)\b",
+    rb"^WAIT\s+#.*?\b(?:nam|name)='(?P<name>[^']+)'.*?\bela=\s*(?P<ela>\d+)\b.*?\btim=\s*(?P<tim>\d+)\b",
     re.IGNORECASE,
 )
+NAME_TAGS = (b" nam='", b" name='")
+ALL_EVENTS = "*"
+
+def positive_int(text: str) -> int:
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {text}")
+    return value
 
 def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     p = argparse.ArgumentParser(
         description="Connector: Oracle 10046 trace → PyLatencyMap (cumulative histogram records)"
     )
-    p.add_argument("-e", "--event", default="db file sequential read",
-                   help='Wait event name to include (default: "db file sequential read")')
+    p.add_argument("-e", "--event", action="append",
+                   help='Wait event name to include, repeat for several events or "*" for all; '
+                        'each event is a separate record stream (default: "db file sequential read")')
     p.add_argument("-i", "--interval", type=float, default=3.0,
                    help="Sampling interval in seconds (default: 3.0)")
     p.add_argument("--case-sensitive", action="store_true",
                    help="Match event name case-sensitively (default: case-insensitive)")
+    p.add_argument("--binary", action="store_true",
+                   help="Emit records in the PyLatencyMap binary format (default: text)")
+    p.add_argument("-f", "--follow", metavar="DIR_OR_GLOB",
+                   help="Follow all .trc files in a directory (or matching a glob) instead of stdin")
+    p.add_argument("--from-start", action="store_true",
+                   help="With --follow: read the trace files that already exist from their start "
+                        "(default: from their end, as tail -f; files created later are read whole)")
+    p.add_argument("--offsets", metavar="FILE",
+                   help="With --follow: save per-file read offsets to FILE and resume from them on restart")
+    p.add_argument("--file", metavar="TRACE",
+                   help="Parse an archived trace file in parallel chunks instead of reading stdin")
+    p.add_argument("-j", "--jobs", type=positive_int, default=os.cpu_count() or 1,
+                   help="With --file: number of parser processes (default: number of CPUs)")
+    p.add_argument("--poll", type=float, default=1.0,
+                   help="With --follow: seconds between directory scans (default: 1.0)")
     return p.parse_args(argv)
 
+def binary_writer():
+    """BinaryRecordWriter on stdout, from the installed LatencyMap or the repo checkout."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    from LatencyMap import BinaryRecordWriter
+    return BinaryRecordWriter(sys.stdout.buffer)
+
 class RunningHistogram:
     """Cumulative power-of-two histogram with Oracle-style bucketting (floor(log2(µs)) + 1)."""
     def __init__(self) -> None:
@@ -41,66 +81,305 @@ class RunningHistogram:
         bucket = int(math.log2(value_us)) + 1
         self.totals[bucket] = self.totals.get(bucket, 0) + 1
 
-    def emit_record(self, ts_usecs: int, label: str, out=sys.stdout) -> None:
+    def merge(self, totals: Dict[int, int]) -> None:
+        for bucket, count in totals.items():
+            self.totals[bucket] = self.totals.get(bucket, 0) + count
+
+    def emit_record(self, ts_usecs: int, label: str, out=sys.stdout, writer=None, stream: str = "") -> None:
+        human_ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts_usecs / 1_000_000))
+        if writer is not None:
+            # use Oracle intensity convention
+            writer.write_record(ts_usecs, self.totals, label, "microsec", "oracle", stream, human_ts)
+            return
         print("<begin record>", file=out)
         for b in sorted(self.totals):
             print(f"{2**b},{self.totals[b]}", file=out)
-        human_ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts_usecs / 1_000_000))
         print(f"timestamp,microsec,{ts_usecs}, {human_ts}", file=out)
         print(f"label,{label}", file=out)
         print("latencyunit,microsec", file=out)
         print("datasource,oracle", file=out)  # use Oracle intensity convention
+        if stream:
+            print(f"stream,{stream}", file=out)
         print("<end record>", file=out)
         out.flush()
 
-def main(argv: Optional[list[str]] = None) -> int:
-    args = parse_args(argv)
-    event_filter = args.event if args.case_sensitive else args.event.lower()
-    interval_us = int(args.interval * 1_000_000)
+class IntervalRecords:
+    """
+    Accumulate waits into one RunningHistogram per event and emit the cumulative totals of all
+    events at each interval boundary. With streams=True each event's records carry a stream tag.
+    """
+    def __init__(self, interval_us: int, events: Optional[Dict[bytes, str]], writer=None,
+                 allow_late: bool = False, streams: bool = False) -> None:
+        # normalized event name -> name for labels; None when extracting all events
+        self.events = events
+        self.hists: Dict[bytes, RunningHistogram] = {}
+        self.interval_us = interval_us
+        self.writer = writer
+        self.streams = streams
+        # following many files, a session may flush its trace after a newer one: count late waits
+        # in the current interval instead of failing
+        self.allow_late = allow_late
+        self.window_start: Optional[int] = None
+
+    def _emit(self, ts_usecs: int, hists: Dict[bytes, RunningHistogram]) -> None:
+        for key in sorted(hists):
+            event = self.events[key] if self.events is not None else key.decode("utf-8", "replace")
+            hists[key].emit_record(ts_usecs, f"10046 trace data for event: {event}", writer=self.writer,
+                                   stream=event if self.streams else "")
+
+    def window(self, tim_us: int) -> int:
+        # Align to interval window
+        return tim_us - (tim_us % self.interval_us)
+
+    def _hist(self, event: bytes) -> RunningHistogram:
+        hist = self.hists.get(event)
+        if hist is None:
+            hist = self.hists[event] = RunningHistogram()
+        return hist
+
+    def _advance(self, sample_bucket: int) -> None:
+        if self.window_start is None:
+            self.window_start = sample_bucket
+
+        # New window → emit cumulative so far (no reset!), then advance window
+        if sample_bucket > self.window_start:
+            self._emit(self.window_start, self.hists)
+            self.window_start = sample_bucket
+        elif sample_bucket < self.window_start and not self.allow_late:
+            raise RuntimeError(f"Out-of-order timestamp: {sample_bucket} < {self.window_start}")
+
+    def add(self, tim_us: int, ela_us: int, event: bytes) -> None:
+        self._advance(self.window(tim_us))
+        # Accumulate into cumulative totals
+        self._hist(event).add_us(ela_us)
+
+    def add_partial(self, sample_bucket: int, totals: Dict[bytes, Dict[int, int]]) -> None:
+        """Merge the per-event bucket counts of one interval, as parsed by parse_chunk()."""
+        self._advance(sample_bucket)
+        for event, buckets in totals.items():
+            self._hist(event).merge(buckets)
+
+    def finish(self) -> None:
+        # EOF: emit final snapshot if we ever saw data
+        if self.window_start is not None:
+            self._emit(self.window_start, self.hists)
+        else:
+            # no data — still emit an empty frame to keep downstream happy
+            ts = int(time.time() * 1_000_000)
+            keys = list(self.events) if self.events is not None else [ALL_EVENTS.encode()]
+            empty = {key: RunningHistogram() for key in keys}
+            if self.events is None:
+                self.events = {keys[0]: "all events"}
+            self._emit(ts, empty)
+
+class TraceDirectoryFollower:
+    """
+    Incremental reader for all trace files matching a directory or glob, rescanned on every poll.
+    Only complete lines are consumed; the offset of each file stays at its last newline.
+    Offsets are keyed by path and checked against the inode and size, so a rotated or truncated
+    file is read again from the start. Files found by the first scan start at their end, unless
+    from_start or a saved offset; files created later are read from their start.
+    A poll reads at most READ_CHUNK bytes of each file and POLL_BUDGET bytes in all, so a
+    directory of large traces is consumed in bounded batches; `backlog` tells that data was left
+    for the next poll, which then starts with the file where this one stopped.
+    """
+    READ_CHUNK = 1 << 20
+    POLL_BUDGET = 32 << 20
 
-    hist = RunningHistogram()
-    window_start: Optional[int] = None
+    def __init__(self, target: str, offsets_path: Optional[str] = None, from_start: bool = False) -> None:
+        self.pattern = os.path.join(target, "*.trc") if os.path.isdir(target) else target
+        self.offsets_path = offsets_path
+        self.from_start = from_start
+        self.first_scan = True
+        self.backlog = False
+        self.next_path = ""
+        self.offsets: Dict[str, Tuple[int, int]] = {}   # path -> (inode, offset)
+        if offsets_path and os.path.exists(offsets_path):
+            with open(offsets_path) as f:
+                self.offsets = {path: (ino, off) for path, (ino, off) in json.load(f).items()}
 
-    for raw in sys.stdin:
+    def poll(self) -> Iterator[str]:
+        """Yield the new complete lines of the matching files, up to the read limits."""
+        paths = sorted(glob.glob(self.pattern))
+        if self.first_scan and not self.from_start:
+            for path in paths:
+                if path not in self.offsets:
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    self.offsets[path] = (st.st_ino, st.st_size)  # tail -f: from the end
+        self.first_scan = False
+        first = bisect.bisect_left(paths, self.next_path)
+        budget = self.POLL_BUDGET
+        self.backlog = False
+        self.next_path = ""
+        for path in paths[first:] + paths[:first]:
+            if budget <= 0:
+                self.backlog = True
+                self.next_path = path
+                break
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # removed between glob and stat
+            ino, offset = self.offsets.get(path, (st.st_ino, 0))
+            if ino != st.st_ino or st.st_size < offset:
+                offset = 0
+            if st.st_size == offset:
+                self.offsets[path] = (st.st_ino, offset)
+                continue
+            length = min(st.st_size - offset, self.READ_CHUNK, budget)
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+                end = data.rfind(b"\n") + 1
+                while not end and offset + len(data) < st.st_size:
+                    data += f.read(self.READ_CHUNK)  # a line longer than the chunk
+                    end = data.rfind(b"\n") + 1
+            if offset + len(data) < st.st_size:
+                self.backlog = True
+            budget -= len(data)
+            self.offsets[path] = (st.st_ino, offset + end)
+            yield from data[:end].splitlines()
+
+        # forget files that are gone (trace directory housekeeping)
+        for path in [p for p in self.offsets if not os.path.exists(p)]:
+            del self.offsets[path]
+
+    def save(self) -> None:
+        if not self.offsets_path:
+            return
+        tmp = self.offsets_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.offsets, f)
+        os.replace(tmp, self.offsets_path)
+
+def event_name(line: bytes) -> Optional[bytes]:
+    """Wait event name of a WAIT line, sliced from the raw bytes without running WAIT_RE."""
+    for tag in NAME_TAGS:
+        start = line.find(tag)
+        if start >= 0:
+            start += len(tag)
+            end = line.find(b"'", start)
+            return line[start:end] if end >= 0 else None
+    return None
+
+def matching_waits(lines: Iterable[bytes], events: Optional[Dict[bytes, str]],
+                   case_sensitive: bool) -> Iterator[Tuple[int, int, bytes]]:
+    """
+    (tim_us, ela_us, event) of the WAIT lines for the selected events (events=None: all events).
+    The event name is checked on the raw bytes first, so only the waits that are kept pay for WAIT_RE.
+    """
+    for raw in lines:
         line = raw.strip()
-        if not line.startswith("WAIT"):
+        if not line.startswith(b"WAIT"):
+            continue
+        name = event_name(line)
+        if name is None:
             continue
+        if not case_sensitive:
+            name = name.lower()
+        if events is not None and name not in events:
+            continue
+
         m = WAIT_RE.match(line)
         if not m:
             continue
 
-        name = m.group("name")
-        ela_us = int(m.group("ela"))
-        tim_us = int(m.group("tim"))
+        yield int(m.group("tim")), int(m.group("ela")), name
 
-        name_cmp = name if args.case_sensitive else name.lower()
-        if name_cmp != event_filter:
-            continue
+# A run of consecutive waits in the same interval: (window start, {event: {bucket: count}})
+Partial = Tuple[int, Dict[bytes, Dict[int, int]]]
 
-        # Align to interval window
-        sample_bucket = tim_us - (tim_us % interval_us)
-        if window_start is None:
-            window_start = sample_bucket
+def chunk_bounds(mm: mmap.mmap, chunks: int) -> List[Tuple[int, int]]:
+    """Split the mapped file into about `chunks` byte ranges that end on a line boundary."""
+    size = len(mm)
+    step = max(size // chunks, 1)
+    bounds = []
+    start = 0
+    while start < size:
+        end = mm.find(b"\n", min(start + step, size) - 1)
+        end = size if end < 0 else end + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
 
-        # New window → emit cumulative so far (no reset!), then advance window
-        if sample_bucket > window_start:
-            hist.emit_record(window_start, f"10046 trace data for event: {args.event}")
-            window_start = sample_bucket
-        elif sample_bucket < window_start:
-            raise RuntimeError(f"Out-of-order timestamp: {sample_bucket} < {window_start}")
+def parse_chunk(path: str, start: int, end: int, events: Optional[Dict[bytes, str]],
+                case_sensitive: bool, interval_us: int) -> List[Partial]:
+    """
+    Worker: parse bytes [start, end) of a trace into per-interval partial histograms, in file order.
+    A new partial starts whenever the interval changes, so an interval that goes back in time is
+    kept as a separate entry and still fails the out-of-order check when the partials are merged.
+    """
+    partials: List[Partial] = []
+    window: Optional[int] = None
+    hists: Dict[bytes, RunningHistogram] = {}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for tim_us, ela_us, event in matching_waits(mm[start:end].splitlines(), events, case_sensitive):
+            sample_bucket = tim_us - (tim_us % interval_us)
+            if sample_bucket != window:
+                hists = {}
+                partials.append((sample_bucket, hists))
+                window = sample_bucket
+            hist = hists.get(event)
+            if hist is None:
+                hist = hists[event] = RunningHistogram()
+            hist.add_us(ela_us)
+    return [(w, {event: h.totals for event, h in hs.items()}) for w, hs in partials]
 
-        # Accumulate into cumulative totals
-        hist.add_us(ela_us)
+def parse_file(args: argparse.Namespace, records: IntervalRecords, events: Optional[Dict[bytes, str]]) -> None:
+    """Parse an archived trace in a process pool; the partials are merged back in file (= time) order."""
+    with open(args.file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # a few chunks per process to even out the load
+            bounds = chunk_bounds(mm, args.jobs * 4)
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(parse_chunk, args.file, start, end, events, args.case_sensitive,
+                               records.interval_us) for start, end in bounds]
+        for future in futures:
+            for sample_bucket, totals in future.result():
+                records.add_partial(sample_bucket, totals)
+
+def follow(args: argparse.Namespace, records: IntervalRecords, events: Optional[Dict[bytes, str]]) -> None:
+    """Poll the trace files until interrupted; each batch of new waits is fed in time order."""
+    follower = TraceDirectoryFollower(args.follow, args.offsets, args.from_start)
+    try:
+        while True:
+            for tim_us, ela_us, event in sorted(matching_waits(follower.poll(), events, args.case_sensitive)):
+                records.add(tim_us, ela_us, event)
+            follower.save()
+            if not follower.backlog:
+                time.sleep(args.poll)
+    except KeyboardInterrupt:
+        follower.save()
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    requested = args.event or ["db file sequential read"]
+    if ALL_EVENTS in requested:
+        events = None
+    else:
+        events = {(e if args.case_sensitive else e.lower()).encode(): e for e in requested}
+    interval_us = int(args.interval * 1_000_000)
+    writer = binary_writer() if args.binary else None
+
+    # a single event keeps the plain, untagged record format
+    records = IntervalRecords(interval_us, events, writer, allow_late=bool(args.follow),
+                              streams=events is None or len(events) > 1)
 
-    # EOF: emit final snapshot if we ever saw data
-    if window_start is not None:
-        hist.emit_record(window_start, f"10046 trace data for event: {args.event}")
+    if args.follow:
+        follow(args, records, events)
+    elif args.file:
+        parse_file(args, records, events)
     else:
-        # no data — still emit an empty frame to keep downstream happy
-        empty = RunningHistogram()
-        ts = int(time.time() * 1_000_000)
-        empty.emit_record(ts, f"10046 trace data for event: {args.event}")
+        for tim_us, ela_us, event in matching_waits(sys.stdin.buffer, events, args.case_sensitive):
+            records.add(tim_us, ela_us, event)
 
+    records.finish()
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+awr_loader.py — Bulk load AWR wait event histograms (dba_hist_event_histogram) for PyLatencyMap
+Author: Luca.Canali@cern.ch
+
+Purpose
+  Offline alternative to awr_latency.sql: one query with array fetches for the whole snapshot
+  range, one stream per (dbid, instance_number), and instance restarts handled in the loader.
+  AWR counts are cumulative since instance startup, so they drop at a restart: the loader
+  detects it (new startup_time, or a bucket count going down) and starts a new baseline by
+  carrying the totals before the restart, so the emitted counts stay cumulative and the
+  deltas computed by LatencyMap never go negative.
+
+Usage
+  python3 AWR_oracle/awr_loader.py --dsn mydb --user system -e "db file sequential read" \
+      --begin "2025-09-01" --end "2025-10-01" --binary | python3 LatencyMap.py --replay
+
+  # Straight to an HTML heat map, in-process
+  python3 AWR_oracle/awr_loader.py --sysdba -e "log file sync" --export awr_log_file_sync.html
+
+Notes
+  - Needs the python-oracledb driver (pip install oracledb); --driver names another DB-API module.
+  - The password is read from $ORA_PASSWORD, or prompted for when --user is given without it.
+  - Records are timestamped at the end of each snapshot interval, when the counts were taken.
+"""
+
+from __future__ import annotations
+import argparse
+import datetime
+import getpass
+import importlib
+import os
+import sys
+import time
+from itertools import groupby
+from typing import Dict, Iterator, List, Optional, Tuple
+
+QUERY = (
+    "select sn.snap_id, eh.dbid, eh.instance_number, sn.end_interval_time, sn.startup_time, "
+    "eh.wait_time_milli, eh.wait_count "
+    "from dba_hist_event_histogram eh, dba_hist_snapshot sn "
+    "where eh.snap_id = sn.snap_id and eh.instance_number = sn.instance_number and eh.dbid = sn.dbid "
+    "and eh.event_name = :event"
+)
+ORDER_BY = " order by sn.snap_id, eh.dbid, eh.instance_number, eh.wait_time_milli"
+FETCH_ROWS = 10_000
+
+# (snap_id, dbid, instance_number, end_interval_time, startup_time, {wait_time_milli: wait_count})
+Snapshot = Tuple[int, int, int, datetime.datetime, datetime.datetime, Dict[int, int]]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Connector: AWR dba_hist_event_histogram → PyLatencyMap (one stream per dbid/instance)"
+    )
+    p.add_argument("-e", "--event", default="db file sequential read",
+                   help='Wait event name (default: "db file sequential read")')
+    p.add_argument("--begin", default=None,
+                   help="Snapshots ending at or after this time, 'YYYY-MM-DD[ HH:MM]' (default: all)")
+    p.add_argument("--end", default=None,
+                   help="Snapshots ending at or before this time, 'YYYY-MM-DD[ HH:MM]' (default: all)")
+    p.add_argument("--dsn", default=None,
+                   help="Connect string, e.g. host:1521/service or a tnsnames alias (default: local)")
+    p.add_argument("--user", default=None,
+                   help="Database user (default: OS authentication)")
+    p.add_argument("--sysdba", action="store_true",
+                   help="Connect AS SYSDBA")
+    p.add_argument("--driver", default="oracledb",
+                   help="DB-API module to connect with (default: oracledb)")
+    p.add_argument("--binary", action="store_true",
+                   help="Emit records in the PyLatencyMap binary format (default: text)")
+    p.add_argument("--export", metavar="FILE", default=None,
+                   help="Write the heat maps to FILE (.svg or .html) with LatencyMap, instead of stdout")
+    return p.parse_args(argv)
+
+
+def parse_time(text: str) -> datetime.datetime:
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"Cannot parse time {text!r}: use 'YYYY-MM-DD[ HH:MM[:SS]]'")
+
+
+def latencymap_module():
+    """LatencyMap, installed or from the repo checkout."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import LatencyMap
+    return LatencyMap
+
+
+def connect(args: argparse.Namespace):
+    driver = importlib.import_module(args.driver)
+    kwargs = {}
+    if args.dsn:
+        kwargs["dsn"] = args.dsn
+    if args.user:
+        kwargs["user"] = args.user
+        kwargs["password"] = os.environ.get("ORA_PASSWORD") or getpass.getpass(f"Password for {args.user}: ")
+    if args.sysdba:
+        kwargs["mode"] = getattr(driver, "AUTH_MODE_SYSDBA", getattr(driver, "SYSDBA", None))
+    return driver.connect(**kwargs)
+
+
+def fetch_rows(conn, args: argparse.Namespace) -> Iterator[tuple]:
+    """All the histogram rows of the range with one query, FETCH_ROWS per round trip."""
+    sql = QUERY
+    binds: Dict[str, object] = {"event": args.event}
+    if args.begin:
+        sql += " and sn.end_interval_time >= :begin_time"
+        binds["begin_time"] = parse_time(args.begin)
+    if args.end:
+        sql += " and sn.end_interval_time <= :end_time"
+        binds["end_time"] = parse_time(args.end)
+    cursor = conn.cursor()
+    cursor.arraysize = FETCH_ROWS
+    cursor.execute(sql + ORDER_BY, binds)
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            return
+        yield from rows
+
+
+def snapshots(rows: Iterator[tuple]) -> Iterator[Snapshot]:
+    """Group the rows (ordered by snap_id, dbid, instance_number) into one histogram per snapshot."""
+    for (snap_id, dbid, inst), group in groupby(rows, key=lambda row: (row[0], row[1], row[2])):
+        buckets: Dict[int, int] = {}
+        end_time = startup_time = None
+        for _, _, _, end_time, startup_time, wait_time_milli, wait_count in group:
+            buckets[int(wait_time_milli)] = int(wait_count)
+        yield int(snap_id), int(dbid), int(inst), end_time, startup_time, buckets
+
+
+class RestartSafeCounts:
+    """
+    Cumulative counts of one (dbid, instance) across instance restarts.
+    A restart (new startup_time, or any bucket lower than in the previous snapshot) starts a new
+    baseline: the totals reached before it are carried over and added to the new counts.
+    """
+    def __init__(self) -> None:
+        self.startup_time = None
+        self.last: Dict[int, int] = {}
+        self.carry: Dict[int, int] = {}
+        self.restarts: int = 0
+
+    def adjust(self, startup_time, buckets: Dict[int, int]) -> Dict[int, int]:
+        restarted = self.last and (
+            startup_time != self.startup_time
+            or any(count < self.last.get(bucket, 0) for bucket, count in buckets.items())
+        )
+        if restarted:
+            self.restarts += 1
+            for bucket, count in self.last.items():
+                self.carry[bucket] = self.carry.get(bucket, 0) + count
+        self.startup_time = startup_time
+        self.last = buckets
+        carry = self.carry
+        if not carry:
+            return buckets
+        totals = dict(carry)
+        for bucket, count in buckets.items():
+            totals[bucket] = totals.get(bucket, 0) + count
+        return totals
+
+
+def records(snaps: Iterator[Snapshot], event: str, partitions: Dict[Tuple[int, int], RestartSafeCounts]
+            ) -> Iterator[Tuple[int, str, str, str, Dict[int, int]]]:
+    """(timestamp microsec, date, label, stream, {wait_time_milli: cumulative count}) per snapshot."""
+    for snap_id, dbid, inst, end_time, startup_time, buckets in snaps:
+        counts = partitions.get((dbid, inst))
+        if counts is None:
+            counts = partitions[(dbid, inst)] = RestartSafeCounts()
+        totals = counts.adjust(startup_time, buckets)
+        ts_usecs = int(end_time.timestamp() * 1_000_000)
+        date = end_time.strftime("%Y-%m-%d %H:%M:%S")
+        label = f"{event} histogram historical data from AWR - dbid {dbid} instance {inst} snap_id {snap_id}"
+        yield ts_usecs, date, label, f"dbid {dbid} inst {inst}", totals
+
+
+def emit_text(ts_usecs: int, date: str, label: str, stream: str, totals: Dict[int, int], out=None) -> None:
+    out = out or sys.stdout  # looked up per call, so a redirected stdout is followed
+    print("<begin record>", file=out)
+    print(f"timestamp,microsec,{ts_usecs}, {date}", file=out)
+    print(f"label,{label}", file=out)
+    print("latencyunit,millisec", file=out)
+    print("datasource,oracle", file=out)
+    print(f"stream,{stream}", file=out)
+    for value in sorted(totals):
+        print(f"{value},{totals[value]}", file=out)
+    print("<end record>", file=out)
+
+
+def latency_records(lm, recs) -> Iterator:
+    """LatencyMap.LatencyRecord objects, for the in-process export path."""
+    for ts_usecs, date, label, stream, totals in recs:
+        rec = lm.LatencyRecord()
+        rec.data['timestamp'] = ts_usecs
+        for value, count in totals.items():
+            rec.data[value.bit_length() - 1] = count
+        rec.date, rec.label, rec.stream = date, label.lower(), stream
+        rec.latency_unit, rec.data_source = "millisec", "oracle"
+        yield rec
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    partitions: Dict[Tuple[int, int], RestartSafeCounts] = {}
+    conn = connect(args)
+    start = time.perf_counter()
+    try:
+        recs = records(snapshots(fetch_rows(conn, args)), args.event, partitions)
+        if args.export:
+            lm = latencymap_module()
+            lm.g_params.parse_cli(["--export", args.export])
+            status = lm.export_heat_maps(latency_records(lm, recs), args.export)
+            if status:
+                return status
+        elif args.binary:
+            writer = latencymap_module().BinaryRecordWriter(sys.stdout.buffer)
+            for ts_usecs, date, label, stream, totals in recs:
+                writer.write_record(ts_usecs, {value.bit_length() - 1: count for value, count in totals.items()},
+                                    label, "millisec", "oracle", stream, date)
+        else:
+            for rec in recs:
+                emit_text(*rec)
+            sys.stdout.flush()
+    finally:
+        conn.close()
+
+    restarts = sum(counts.restarts for counts in partitions.values())
+    sys.stderr.write(f"AWR loader: {len(partitions)} instance(s), {restarts} restart(s) handled, "
+                     f"{time.perf_counter() - start:.2f} sec\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,7 +5,8 @@
 # Modified biolatency.py and integrated with PyLatencyMap for heatmap visualization
 # For Linux, uses BCC, eBPF.
 #
-# USAGE: pylatencymap-biolatency.py [-h] [-T] [-Q] [-m] [-D] [-F] [-e] [-j] [-d DISK] [interval] [count]
+# USAGE: pylatencymap-biolatency.py [-h] [-T] [-Q] [-m] [-D] [-F] [-e] [-j] [-d DISK] [--binary]
+#                                     [--percpu] [--overhead] [interval] [count]
 #
 # Copyright (c) 2015 Brendan Gregg.
 # Licensed under the Apache License, Version 2.0 (the "License")
@@ -18,10 +19,10 @@
 # May 2016      Luca Canali     Added integration to PyLatencyMap and
 #                               rename the script to pylatencymap-biolatency.py
 # Sep 2025     Luca Canali      Refactored
+# Per-disk (-D) and per-flags (-F) histograms are emitted as separate PyLatencyMap streams
 #
 
 from __future__ import print_function
-from bcc import BPF
 from time import sleep, strftime
 import argparse
 import ctypes as ct
@@ -35,43 +36,45 @@ examples = """examples:
     ./pylatencymap-biolatency 1 10  # print 1 second summaries, 10 times
     ./pylatencymap-biolatency -d sdc  # Trace sdc only
 """
-parser = argparse.ArgumentParser(
-    description="Summarize block device I/O latency as a histogram",
-    formatter_class=argparse.RawDescriptionHelpFormatter,
-    epilog=examples)
-parser.add_argument("-T", "--timestamp", action="store_true",
-    help="include timestamp on output")
-parser.add_argument("-Q", "--queued", action="store_true",
-    help="include OS queued time in I/O time")
-parser.add_argument("-m", "--milliseconds", action="store_true",
-    help="millisecond histogram")
-parser.add_argument("-D", "--disks", action="store_true",
-    help="print a histogram per disk device")
-parser.add_argument("-F", "--flags", action="store_true",
-    help="print a histogram per set of I/O flags")
-parser.add_argument("-e", "--extension", action="store_true",
-    help="summarize average/total value")
-parser.add_argument("interval", nargs="?", default=99999999,
-    help="output interval, in seconds")
-parser.add_argument("count", nargs="?", default=99999999,
-    help="number of outputs")
-parser.add_argument("--ebpf", action="store_true",
-    help=argparse.SUPPRESS)
-parser.add_argument("-j", "--json", action="store_true",
-    help="json output")
-parser.add_argument("-d", "--disk", type=str,
-    help="Trace this disk only")
-
-args = parser.parse_args()
-countdown = int(args.count)
-debug = 0
-
-if args.flags and args.disks:
-    print("ERROR: can only use -D or -F. Exiting.")
-    exit()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Summarize block device I/O latency as a histogram",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=examples)
+    parser.add_argument("-T", "--timestamp", action="store_true",
+        help="include timestamp on output")
+    parser.add_argument("-Q", "--queued", action="store_true",
+        help="include OS queued time in I/O time")
+    parser.add_argument("-m", "--milliseconds", action="store_true",
+        help="millisecond histogram")
+    parser.add_argument("-D", "--disks", action="store_true",
+        help="print a histogram per disk device")
+    parser.add_argument("-F", "--flags", action="store_true",
+        help="print a histogram per set of I/O flags")
+    parser.add_argument("-e", "--extension", action="store_true",
+        help="summarize average/total value")
+    parser.add_argument("interval", nargs="?", default=99999999,
+        help="output interval, in seconds")
+    parser.add_argument("count", nargs="?", default=99999999,
+        help="number of outputs")
+    parser.add_argument("--ebpf", action="store_true",
+        help=argparse.SUPPRESS)
+    parser.add_argument("-j", "--json", action="store_true",
+        help="json output")
+    parser.add_argument("-d", "--disk", type=str,
+        help="Trace this disk only")
+    parser.add_argument("--binary", action="store_true",
+        help="emit records in the PyLatencyMap binary format (default: text)")
+    parser.add_argument("--percpu", action="store_true",
+        help="per-CPU histogram maps (no shared counters), read with batched lookups")
+    parser.add_argument("--overhead", action="store_true",
+        help="report probe cost per I/O and CPU (user + system) of this process per interval on stderr")
+
+    return parser.parse_args(argv)
 
 # define BPF program
-bpf_text = """
+bpf_text_template = """
 #include <uapi/linux/ptrace.h>
 #include <linux/blk-mq.h>
 
@@ -191,132 +194,16 @@ int trace_req_done_tp(struct tp_args *args)
 }
 """
 
-# code substitutions
-if args.milliseconds:
-    bpf_text = bpf_text.replace('FACTOR', 'delta /= 1000000;')
-    label = "msecs"
-else:
-    bpf_text = bpf_text.replace('FACTOR', 'delta /= 1000;')
-    label = "usecs"
-
-storage_str = ""
-store_str = ""
-if args.disks:
-    storage_str += "BPF_HISTOGRAM(dist, disk_key_t);"
-    disks_str = """
-    disk_key_t dkey = {};
-    dkey.dev = key.dev;
-    dkey.slot = bpf_log2l(delta);
-    dist.atomic_increment(dkey);
-    """
-    store_str += disks_str
-elif args.flags:
-    storage_str += "BPF_HISTOGRAM(dist, flag_key_t);"
-    store_str += """
-    flag_key_t fkey = {.slot = bpf_log2l(delta)};
-    fkey.flags = key.flags;
-    dist.atomic_increment(fkey);
-    """
-else:
-    storage_str += "BPF_HISTOGRAM(dist);"
-    store_str += "dist.atomic_increment(bpf_log2l(delta));"
-
-if args.disk is not None:
-    disk_path = os.path.join('/dev', args.disk)
-    if not os.path.exists(disk_path):
-        print("no such disk '%s'" % args.disk)
-        exit(1)
-
-    stat_info = os.stat(disk_path)
-    dev = os.major(stat_info.st_rdev) << 20 | os.minor(stat_info.st_rdev)
-
-    disk_filter_str = """
-    if(key.dev != %s) {
-        return 0;
-    }
-    """ % (dev)
-
-    bpf_text = bpf_text.replace('DISK_FILTER', disk_filter_str)
-else:
-    bpf_text = bpf_text.replace('DISK_FILTER', '')
-
-if args.extension:
-    storage_str += "BPF_ARRAY(extension, ext_val_t, 1);"
-    store_str += """
-    u32 index = 0;
-    ext_val_t *ext_val = extension.lookup(&index);
-    if (ext_val) {
-        lock_xadd(&ext_val->total, delta);
-        lock_xadd(&ext_val->count, 1);
-    }
-    """
-
-bpf_text = bpf_text.replace("STORAGE", storage_str)
-bpf_text = bpf_text.replace("STORE", store_str)
-if BPF.kernel_struct_has_field(b'request', b'rq_disk') == 1:
-    bpf_text = bpf_text.replace('__RQ_DISK__', 'rq_disk')
-else:
-    bpf_text = bpf_text.replace('__RQ_DISK__', 'q->disk')
-if args.flags:
-    bpf_text = bpf_text.replace('CMD_FLAGS', 'u64 flags;')
-    bpf_text = bpf_text.replace('SET_FLAGS', 'key.flags = req->cmd_flags;')
-else:
-    bpf_text = bpf_text.replace('CMD_FLAGS', '')
-    bpf_text = bpf_text.replace('SET_FLAGS', '')
-
-if debug or args.ebpf:
-    print(bpf_text)
-    if args.ebpf:
-        exit()
-
-# load BPF program
-b = BPF(text=bpf_text)
-if args.queued:
-    if BPF.tracepoint_exists("block", "block_io_start"):
-        b.attach_tracepoint(tp="block:block_io_start", fn_name="trace_req_start_tp")
-    elif BPF.get_kprobe_functions(b'__blk_account_io_start'):
-        b.attach_kprobe(event="__blk_account_io_start", fn_name="trace_req_start")
-    elif BPF.get_kprobe_functions(b'blk_account_io_start'):
-        b.attach_kprobe(event="blk_account_io_start", fn_name="trace_req_start")
-    elif BPF.tracepoint_exists("block", "block_bio_queue"):
-        b.attach_tracepoint(tp="block:block_bio_queue", fn_name="trace_req_start_tp")
-    else:
-        if args.flags:
-            # Some flags are accessible in the rwbs field (RAHEAD, SYNC and META)
-            # but other aren't. Disable the -F option for tracepoint for now.
-            print("ERROR: blk_account_io_start probe not available. Can't use -F.")
-            exit()
-else:
-    if BPF.get_kprobe_functions(b'blk_start_request'):
-        b.attach_kprobe(event="blk_start_request", fn_name="trace_req_start")
-    b.attach_kprobe(event="blk_mq_start_request", fn_name="trace_req_start")
-
-if BPF.tracepoint_exists("block", "block_io_done"):
-    b.attach_tracepoint(tp="block:block_io_done", fn_name="trace_req_done_tp")
-elif BPF.get_kprobe_functions(b'__blk_account_io_done'):
-    b.attach_kprobe(event="__blk_account_io_done", fn_name="trace_req_done")
-elif BPF.get_kprobe_functions(b'blk_account_io_done'):
-    b.attach_kprobe(event="blk_account_io_done", fn_name="trace_req_done")
-elif BPF.tracepoint_exists("block", "block_rq_complete"):
-    b.attach_tracepoint(tp="block:block_rq_complete", fn_name="trace_req_done_tp")
-else:
-    if args.flags:
-        print("ERROR: blk_account_io_done probe not available. Can't use -F.")
-        exit()
-
-
-if not args.json:
-    print("Tracing block device I/O... Hit Ctrl-C to end.")
-
 # cache disk major,minor -> diskname
-diskstats = "/proc/diskstats"
-disklookup = {}
-with open(diskstats) as stats:
-    for line in stats:
-        a = line.split()
-        disklookup[a[0] + "," + a[1]] = a[2]
-
-def disk_print(d):
+def load_disklookup(diskstats="/proc/diskstats"):
+    disklookup = {}
+    with open(diskstats) as stats:
+        for line in stats:
+            a = line.split()
+            disklookup[a[0] + "," + a[1]] = a[2]
+    return disklookup
+
+def disk_print(d, disklookup):
     major = d >> 20
     minor = d & ((1 << 20) - 1)
 
@@ -379,47 +266,336 @@ def flags_print(flags):
     return desc
 
 # --- PyLatencyMap-compatible output (cumulative log2 histogram) ---
-exiting = 0 if args.interval else 1
-countdown = int(args.count) if getattr(args, "count", None) else -1
-dist = b.get_table("dist")
-
-def bucket_lower_us(bucket_key):
-    """Return the lower bound (in microseconds) for a log2 bucket index."""
-    idx = int(bucket_key.value)
-    return 0 if idx == 0 else (1 << (idx - 1))
-
-while True:
-    try:
-        if args.interval:
-            # allow float intervals too
-            sleep(float(args.interval))
-    except KeyboardInterrupt:
-        exiting = 1
-
-    print()
-    print("<begin record>")
-    if getattr(args, "timestamp", False):
-        print(f"timestamp, microsec,{int(time.time()*1_000_000)},{time.strftime('%c')}")
-
-    print("label, Latency of block I/O requests measured with BPF/bcc")
-    print("latencyunit, microsec")
-    # Tell PyLatencyMap to interpret buckets as lower bounds like SystemTap histograms
-    print("datasource, bpf")
-
-    # Emit "bucket,val" lines in ascending bucket order; omit zeros
-    for k, v in sorted(dist.items(), key=lambda kv: kv[0].value):
-        cnt = int(v.value)
-        if cnt != 0:
-            print(f"{bucket_lower_us(k)},{cnt}")
-
-    # NOTE: keep cumulative values for PyLatencyMap → do NOT clear.
-    # If you ever need per-interval histograms instead, uncomment the next line.
-    # dist.clear()
-
-    print("<end record>")
-    sys.stdout.flush()
-
-    if countdown > 0:
-        countdown -= 1
-    if exiting or countdown == 0:
-        break
+LABEL = "Latency of block I/O requests measured with BPF/bcc"
+
+def leaf_counts(items):
+    """
+    (key, count) pairs from the (key, leaf) pairs of one map read. The leaf type is checked
+    once per batch: per-CPU leaves (ctypes arrays, one slot per CPU) are summed with map(sum),
+    one pass over the batch, plain leaves are ctypes integers.
+    """
+    if not items:
+        return []
+    keys, leaves = zip(*items)
+    if isinstance(leaves[0], ct.Array):
+        return list(zip(keys, map(sum, leaves)))
+    return [(k, v.value) for k, v in items]
+
+def read_dist(dist, batch):
+    """
+    Read the dist map as (key, count) pairs.
+    With batch=True use BPF_MAP_LOOKUP_BATCH (kernel 5.6+), a handful of syscalls per interval
+    instead of two per key. Returns (counts, batch) where batch is False when batched lookups
+    are not supported, so the caller falls back to dist.items() from then on.
+    """
+    if batch:
+        try:
+            return leaf_counts(list(dist.items_lookup_batch())), True
+        except Exception:
+            # bcc raises a bare Exception when the syscall fails (old kernel)
+            pass
+    return leaf_counts(list(dist.items())), False
+
+# --- Overhead reporting ---
+BPF_STATS_ENABLED = "/proc/sys/kernel/bpf_stats_enabled"
+
+def bpf_prog_stats(b):
+    """
+    Per-probe (run_time_ns, run_cnt) from /proc/self/fdinfo of the loaded programs.
+    The kernel only accounts them while sysctl kernel.bpf_stats_enabled=1.
+    """
+    stats = {}
+    for name, fn in b.funcs.items():
+        run_time_ns = run_cnt = 0
+        try:
+            with open(f"/proc/self/fdinfo/{fn.fd}") as fdinfo:
+                for line in fdinfo:
+                    field, _, value = line.partition(":")
+                    if field == "run_time_ns":
+                        run_time_ns = int(value)
+                    elif field == "run_cnt":
+                        run_cnt = int(value)
+        except OSError:
+            continue
+        stats[name.decode() if isinstance(name, bytes) else name] = (run_time_ns, run_cnt)
+    return stats
+
+class OverheadReport:
+    """Collection cost per interval: probe ns per I/O and CPU (user + system) of this process."""
+
+    def __init__(self, b, out=sys.stderr):
+        self.b = b
+        self.out = out
+        try:
+            with open(BPF_STATS_ENABLED) as f:
+                self.stats_enabled = f.read().strip() == "1"
+        except OSError:
+            self.stats_enabled = False
+        if not self.stats_enabled:
+            print("overhead: probe cost not available, enable it with sysctl kernel.bpf_stats_enabled=1",
+                  file=out)
+        self.prev_stats = bpf_prog_stats(b)
+        self.prev_cpu = self._cpu()
+
+    @staticmethod
+    def _cpu():
+        t = os.times()
+        return t.user + t.system
+
+    def report(self, read_secs, mode):
+        cpu = self._cpu()
+        stats = bpf_prog_stats(self.b)
+        line = f"overhead [{mode}]: map read {read_secs*1e3:.3f} ms, " \
+               f"CPU {(cpu - self.prev_cpu)*1e3:.1f} ms/interval"
+        if self.stats_enabled:
+            run_time_ns = run_cnt = ios = 0
+            for name, (t, n) in stats.items():
+                t0, n0 = self.prev_stats.get(name, (0, 0))
+                run_time_ns += t - t0
+                run_cnt += n - n0
+                # each completed I/O runs exactly one done probe
+                if name.startswith("trace_req_done"):
+                    ios += n - n0
+            if ios:
+                line += f", {ios} I/Os, probe cost {run_time_ns / ios:.0f} ns/IO ({run_cnt} probe runs)"
+            else:
+                line += ", no I/O in interval"
+        print(line, file=self.out)
+        self.out.flush()
+        self.prev_stats, self.prev_cpu = stats, cpu
+
+def histograms_by_stream(counts, disks=False, flags=False, disklookup=None):
+    """
+    Split the "dist" map into one cumulative histogram per PyLatencyMap stream, in one pass.
+    counts: (key, count) pairs as from read_dist(); keys are the scalar slot, disk_key_t
+    (dev, slot) with -D or flag_key_t (flags, slot) with -F.
+    Returns {stream: {exponent: count}}, stream '' for the plain histogram, else the disk name
+    or the flags description. Exponents are log2 of the bucket lower bound (slot - 1); slot 0
+    (sub-unit latency) is folded into exponent 0. Without -D/-F the '' stream is always there,
+    empty when no I/O completed yet, so that every interval still emits its record.
+    """
+    histograms = {} if disks or flags else {"": {}}
+    for k, cnt in counts:
+        if cnt == 0:
+            continue
+        if disks:
+            stream, slot = disk_print(k.dev, disklookup or {}), k.slot
+        elif flags:
+            stream, slot = flags_print(k.flags), k.slot
+        else:
+            stream, slot = "", k.value
+        exponent = max(int(slot) - 1, 0)
+        hist = histograms.setdefault(stream, {})
+        hist[exponent] = hist.get(exponent, 0) + cnt
+    return histograms
+
+def print_text_records(histograms, ts_usecs, unit, out=sys.stdout):
+    """Emit one text record per stream, buckets in ascending order."""
+    for stream in sorted(histograms):
+        print(file=out)
+        print("<begin record>", file=out)
+        if ts_usecs:
+            print(f"timestamp, microsec,{ts_usecs},{time.strftime('%c', time.localtime(ts_usecs / 1e6))}",
+                  file=out)
+        print(f"label, {LABEL}" + (f" - {stream}" if stream else ""), file=out)
+        print(f"latencyunit, {unit}", file=out)
+        # Tell PyLatencyMap to interpret buckets as lower bounds like SystemTap histograms
+        print("datasource, bpf", file=out)
+        if stream:
+            print(f"stream, {stream}", file=out)
+        hist = histograms[stream]
+        for exponent in sorted(hist):
+            print(f"{1 << exponent},{hist[exponent]}", file=out)
+        print("<end record>", file=out)
+    out.flush()
+
+def write_binary_records(writer, histograms, ts_usecs, unit):
+    for stream in sorted(histograms):
+        label = f"{LABEL} - {stream}" if stream else LABEL
+        writer.write_record(ts_usecs, histograms[stream], label, unit, "bpf", stream)
+
+def main(argv=None):
+    from bcc import BPF
+
+    args = parse_args(argv)
+    countdown = int(args.count)
+    debug = 0
+
+    if args.flags and args.disks:
+        print("ERROR: can only use -D or -F. Exiting.")
+        exit()
+
+    bpf_text = bpf_text_template
+
+    # code substitutions
+    if args.milliseconds:
+        bpf_text = bpf_text.replace('FACTOR', 'delta /= 1000000;')
+        label = "msecs"
+    else:
+        bpf_text = bpf_text.replace('FACTOR', 'delta /= 1000;')
+        label = "usecs"
+
+    storage_str = ""
+    store_str = ""
+    # --percpu: one counter copy per CPU, plain increments, no shared cache lines between CPUs
+    increment = "increment" if args.percpu else "atomic_increment"
+    if args.disks:
+        storage_str += "BPF_PERCPU_HASH(dist, disk_key_t, u64);" if args.percpu \
+            else "BPF_HISTOGRAM(dist, disk_key_t);"
+        disks_str = """
+        disk_key_t dkey = {};
+        dkey.dev = key.dev;
+        dkey.slot = bpf_log2l(delta);
+        dist.%s(dkey);
+        """ % increment
+        store_str += disks_str
+    elif args.flags:
+        storage_str += "BPF_PERCPU_HASH(dist, flag_key_t, u64);" if args.percpu \
+            else "BPF_HISTOGRAM(dist, flag_key_t);"
+        store_str += """
+        flag_key_t fkey = {.slot = bpf_log2l(delta)};
+        fkey.flags = key.flags;
+        dist.%s(fkey);
+        """ % increment
+    else:
+        storage_str += "BPF_PERCPU_ARRAY(dist, u64, 64);" if args.percpu else "BPF_HISTOGRAM(dist);"
+        store_str += "dist.%s(bpf_log2l(delta));" % increment
+
+    if args.disk is not None:
+        disk_path = os.path.join('/dev', args.disk)
+        if not os.path.exists(disk_path):
+            print("no such disk '%s'" % args.disk)
+            exit(1)
+
+        stat_info = os.stat(disk_path)
+        dev = os.major(stat_info.st_rdev) << 20 | os.minor(stat_info.st_rdev)
+
+        disk_filter_str = """
+        if(key.dev != %s) {
+            return 0;
+        }
+        """ % (dev)
+
+        bpf_text = bpf_text.replace('DISK_FILTER', disk_filter_str)
+    else:
+        bpf_text = bpf_text.replace('DISK_FILTER', '')
+
+    if args.extension:
+        storage_str += "BPF_ARRAY(extension, ext_val_t, 1);"
+        store_str += """
+        u32 index = 0;
+        ext_val_t *ext_val = extension.lookup(&index);
+        if (ext_val) {
+            lock_xadd(&ext_val->total, delta);
+            lock_xadd(&ext_val->count, 1);
+        }
+        """
+
+    bpf_text = bpf_text.replace("STORAGE", storage_str)
+    bpf_text = bpf_text.replace("STORE", store_str)
+    if BPF.kernel_struct_has_field(b'request', b'rq_disk') == 1:
+        bpf_text = bpf_text.replace('__RQ_DISK__', 'rq_disk')
+    else:
+        bpf_text = bpf_text.replace('__RQ_DISK__', 'q->disk')
+    if args.flags:
+        bpf_text = bpf_text.replace('CMD_FLAGS', 'u64 flags;')
+        bpf_text = bpf_text.replace('SET_FLAGS', 'key.flags = req->cmd_flags;')
+    else:
+        bpf_text = bpf_text.replace('CMD_FLAGS', '')
+        bpf_text = bpf_text.replace('SET_FLAGS', '')
+
+    if debug or args.ebpf:
+        print(bpf_text)
+        if args.ebpf:
+            exit()
+
+    # load BPF program
+    b = BPF(text=bpf_text)
+    if args.queued:
+        if BPF.tracepoint_exists("block", "block_io_start"):
+            b.attach_tracepoint(tp="block:block_io_start", fn_name="trace_req_start_tp")
+        elif BPF.get_kprobe_functions(b'__blk_account_io_start'):
+            b.attach_kprobe(event="__blk_account_io_start", fn_name="trace_req_start")
+        elif BPF.get_kprobe_functions(b'blk_account_io_start'):
+            b.attach_kprobe(event="blk_account_io_start", fn_name="trace_req_start")
+        elif BPF.tracepoint_exists("block", "block_bio_queue"):
+            b.attach_tracepoint(tp="block:block_bio_queue", fn_name="trace_req_start_tp")
+        else:
+            if args.flags:
+                # Some flags are accessible in the rwbs field (RAHEAD, SYNC and META)
+                # but other aren't. Disable the -F option for tracepoint for now.
+                print("ERROR: blk_account_io_start probe not available. Can't use -F.")
+                exit()
+    else:
+        if BPF.get_kprobe_functions(b'blk_start_request'):
+            b.attach_kprobe(event="blk_start_request", fn_name="trace_req_start")
+        b.attach_kprobe(event="blk_mq_start_request", fn_name="trace_req_start")
+
+    if BPF.tracepoint_exists("block", "block_io_done"):
+        b.attach_tracepoint(tp="block:block_io_done", fn_name="trace_req_done_tp")
+    elif BPF.get_kprobe_functions(b'__blk_account_io_done'):
+        b.attach_kprobe(event="__blk_account_io_done", fn_name="trace_req_done")
+    elif BPF.get_kprobe_functions(b'blk_account_io_done'):
+        b.attach_kprobe(event="blk_account_io_done", fn_name="trace_req_done")
+    elif BPF.tracepoint_exists("block", "block_rq_complete"):
+        b.attach_tracepoint(tp="block:block_rq_complete", fn_name="trace_req_done_tp")
+    else:
+        if args.flags:
+            print("ERROR: blk_account_io_done probe not available. Can't use -F.")
+            exit()
+
+
+    if not args.json:
+        # in binary mode stdout carries only record frames
+        print("Tracing block device I/O... Hit Ctrl-C to end.",
+              file=sys.stderr if args.binary else sys.stdout)
+
+    disklookup = load_disklookup() if args.disks else None
+    unit = "millisec" if args.milliseconds else "microsec"
+
+    writer = None
+    if args.binary:
+        # BinaryRecordWriter from the installed LatencyMap or the repo checkout
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+        from LatencyMap import BinaryRecordWriter
+        writer = BinaryRecordWriter(sys.stdout.buffer)
+
+    exiting = 0 if args.interval else 1
+    countdown = int(args.count) if getattr(args, "count", None) else -1
+    dist = b.get_table("dist")
+    batch = args.percpu
+    overhead = OverheadReport(b) if args.overhead else None
+
+    while True:
+        try:
+            if args.interval:
+                # allow float intervals too
+                sleep(float(args.interval))
+        except KeyboardInterrupt:
+            exiting = 1
+
+        # One pass over the map; with -D/-F one record per disk or flag set (PyLatencyMap streams)
+        read_start = time.perf_counter()
+        counts, batch = read_dist(dist, batch)
+        histograms = histograms_by_stream(counts, args.disks, args.flags, disklookup)
+        read_secs = time.perf_counter() - read_start
+        ts_usecs = int(time.time()*1_000_000) if getattr(args, "timestamp", False) else 0
+        if writer is not None:
+            write_binary_records(writer, histograms, ts_usecs, unit)
+        else:
+            print_text_records(histograms, ts_usecs, unit)
+        if overhead is not None:
+            overhead.report(read_secs, ("percpu" if args.percpu else "shared") +
+                            (", batched" if batch else ""))
+
+        # NOTE: keep cumulative values for PyLatencyMap → do NOT clear.
+        # If you ever need per-interval histograms instead, uncomment the next line.
+        # dist.clear()
+
+        if countdown > 0:
+            countdown -= 1
+        if exiting or countdown == 0:
+            break
+
+if __name__ == "__main__":
+    main()
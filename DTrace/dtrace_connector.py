@@ -7,33 +7,48 @@
 #         visualization as Frequency-Intensity HeatMap
 #
 # Usage:
-#        dtrace -s DTrace/pread_tracedata.d |python DTrace/dtrace_connector.py
+#        dtrace -s DTrace/pread_tracedata.d |python DTrace/dtrace_connector.py [--binary]
+#        --binary emits records in the PyLatencyMap binary format instead of text
 #
 
+import argparse
+import os
 import sys
 
+def binary_writer():
+    # BinaryRecordWriter on stdout, from the installed LatencyMap or the repo checkout
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    from LatencyMap import BinaryRecordWriter
+    return BinaryRecordWriter(sys.stdout.buffer)
+
 def main():
+    parser = argparse.ArgumentParser(description='Connector: DTrace output -> PyLatencyMap records')
+    parser.add_argument('--binary', action='store_true',
+                        help='emit records in the PyLatencyMap binary format (default: text)')
+    args = parser.parse_args()
+    emit = binary_writer().write_text_line if args.binary else print
+
     while True:
         line = sys.stdin.readline()
         if not line:
-            print('\nReached EOF from data source, exiting.')
+            emit('\nReached EOF from data source, exiting.')
             sys.exit(0)
         if line.strip() == '':
             continue
         line = line.strip()
 
         if line.startswith('<begin record>'):
-            print('<begin record>')
+            emit('<begin record>')
             continue
         if line.startswith('<end record>'):
-            print('<end record>')
+            emit('<end record>')
             sys.stdout.flush()
             continue
         if line.startswith('timestamp'):
-            print(line)
+            emit(line)
             continue
         if line.startswith('label'):
-            print(line)
+            emit(line)
             continue
         if 'value' in line:
             continue
@@ -44,9 +59,14 @@ def main():
         line = line.replace('@','')
         line = line.replace('|',',')
 
+        if line.startswith('<'):
+            continue             # llquantize underflow bucket (below its low bound)
+        if line.startswith('>='):
+            line = line[2:]      # llquantize overflow bucket, counted at its lower bound
+
         if line.startswith('-'):
             continue             # filters out point of negative latency, this is a workaround 
-        print(line)              # when using DTrace on Virtualbox 
+        emit(line)               # when using DTrace on Virtualbox 
 
 if __name__ == '__main__':
     sys.exit(main())
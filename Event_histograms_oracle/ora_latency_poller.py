@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+ora_latency_poller.py — Poll gv$event_histogram_micro over one DB-API connection for PyLatencyMap
+Author: Luca.Canali@cern.ch
+
+Purpose
+  Python replacement for sqlplus + ora_latency_micro.sql + wait_and_repeat.sql: keeps one
+  connection and one cursor open, runs the same query with a bind variable every interval
+  (python-oracledb keeps it parsed in its statement cache), on a drift-free schedule and with
+  no limit on the number of samples. Each RAC instance is a separate PyLatencyMap stream
+  (stream "inst_id <n>"), instead of the sum over instances.
+
+Usage
+  python3 Event_histograms_oracle/ora_latency_poller.py --dsn mydb --user system \
+      -e "db file sequential read" -i 3 | python3 LatencyMap.py
+
+  python3 Event_histograms_oracle/ora_latency_poller.py --sysdba -e "log file sync" | python3 LatencyMap.py
+
+Notes
+  - Needs the python-oracledb driver (pip install oracledb) and Oracle 12.1.0.2 or higher.
+  - The password is read from $ORA_PASSWORD, or prompted for when --user is given without it.
+  - --driver names another DB-API module with a compatible connect(), e.g. a stand-in for tests.
+  - --binary emits records in the PyLatencyMap binary format instead of text.
+"""
+
+from __future__ import annotations
+import argparse
+import getpass
+import importlib
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+QUERY = (
+    "select inst_id, wait_time_micro, wait_count from gv$event_histogram_micro "
+    "where event = :event and wait_time_micro <> 4294967295 "
+    "order by inst_id, wait_time_micro"
+)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Connector: poll Oracle gv$event_histogram_micro → PyLatencyMap (one stream per instance)"
+    )
+    p.add_argument("-e", "--event", default="db file sequential read",
+                   help='Wait event name (default: "db file sequential read")')
+    p.add_argument("-i", "--interval", type=float, default=3.0,
+                   help="Sampling interval in seconds (default: 3.0)")
+    p.add_argument("-c", "--count", type=int, default=0,
+                   help="Number of samples, 0 = until interrupted (default: 0)")
+    p.add_argument("--dsn", default=None,
+                   help="Connect string, e.g. host:1521/service or a tnsnames alias (default: local)")
+    p.add_argument("--user", default=None,
+                   help="Database user (default: OS authentication)")
+    p.add_argument("--sysdba", action="store_true",
+                   help="Connect AS SYSDBA")
+    p.add_argument("--driver", default="oracledb",
+                   help="DB-API module to connect with (default: oracledb)")
+    p.add_argument("--binary", action="store_true",
+                   help="Emit records in the PyLatencyMap binary format (default: text)")
+    return p.parse_args(argv)
+
+
+def binary_writer():
+    """BinaryRecordWriter on stdout, from the installed LatencyMap or the repo checkout."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    from LatencyMap import BinaryRecordWriter
+    return BinaryRecordWriter(sys.stdout.buffer)
+
+
+def connect(args: argparse.Namespace):
+    driver = importlib.import_module(args.driver)
+    kwargs = {}
+    if args.dsn:
+        kwargs["dsn"] = args.dsn
+    if args.user:
+        kwargs["user"] = args.user
+        kwargs["password"] = os.environ.get("ORA_PASSWORD") or getpass.getpass(f"Password for {args.user}: ")
+    if args.sysdba:
+        kwargs["mode"] = getattr(driver, "AUTH_MODE_SYSDBA", getattr(driver, "SYSDBA", None))
+    return driver.connect(**kwargs)
+
+
+def histograms_by_instance(rows) -> Dict[int, Dict[int, int]]:
+    """{inst_id: {wait_time_micro: wait_count}} from the rows of QUERY."""
+    histograms: Dict[int, Dict[int, int]] = {}
+    for inst_id, wait_time_micro, wait_count in rows:
+        histograms.setdefault(int(inst_id), {})[int(wait_time_micro)] = int(wait_count)
+    return histograms
+
+
+def emit_records(histograms: Dict[int, Dict[int, int]], ts_usecs: int, event: str, out=None,
+                 writer=None) -> None:
+    """One record per instance; wait_time_micro is the bucket upper bound (Oracle convention)."""
+    out = out or sys.stdout  # looked up per call, so a redirected stdout is followed
+    human_ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts_usecs / 1_000_000))
+    for inst_id in sorted(histograms):
+        label = f"{event} latency data from gv$event_histogram_micro - inst_id {inst_id}"
+        stream = f"inst_id {inst_id}"
+        buckets = histograms[inst_id]
+        if writer is not None:
+            writer.write_record(ts_usecs, {value.bit_length() - 1: count for value, count in buckets.items()},
+                                label, "microsec", "oracle", stream, human_ts)
+            continue
+        print("<begin record>", file=out)
+        print(f"timestamp,microsec,{ts_usecs}, {human_ts}", file=out)
+        print(f"label,{label}", file=out)
+        print("latencyunit,microsec", file=out)
+        print("datasource,oracle", file=out)
+        print(f"stream,{stream}", file=out)
+        for value in sorted(buckets):
+            print(f"{value},{buckets[value]}", file=out)
+        print("<end record>", file=out)
+    out.flush()
+
+
+def poll(conn, args: argparse.Namespace, writer=None, clock=time.monotonic, sleep=time.sleep) -> int:
+    """
+    Sample every args.interval seconds, scheduled from the start time (no drift from the
+    query time); ticks missed while a query was slow are skipped, not bunched up.
+    Returns the number of samples taken.
+    """
+    cursor = conn.cursor()
+    cursor.arraysize = 100
+    binds = {"event": args.event}
+    start = clock()
+    samples = 0
+    while True:
+        ts_usecs = int(time.time() * 1_000_000)
+        cursor.execute(QUERY, binds)
+        emit_records(histograms_by_instance(cursor.fetchall()), ts_usecs, args.event, writer=writer)
+        samples += 1
+        if args.count and samples >= args.count:
+            return samples
+
+        ticks = int((clock() - start) / args.interval) + 1
+        sleep(max(0.0, start + ticks * args.interval - clock()))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    writer = binary_writer() if args.binary else None
+    conn = connect(args)
+    try:
+        poll(conn, args, writer)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,27 +18,65 @@ Input format (unchanged)
     latencyunit,<millisec|microsec|nanosec>
     label,<free text>
     datasource,<bpf|systemtap|dtrace|oracle>
+    stream,<key>                (optional: disk, instance, event, host, ...)
     <power_of_two_value>,<cumulative_count>
     ...
     <end record>
 
+  A compact binary framing of the same records (see BinaryRecordFormat, connectors' --binary
+  option) is auto-detected on stdin.
+
   Notes:
     - 'latencyunit' applies to bucket values; Y-axis labels are always rendered in **ms**.
     - Counts must be cumulative per bucket; the tool computes per-interval deltas → rates.
+    - Records with different 'stream' keys are independent histograms: each stream has its own
+      deltas, latency unit, bucket range and time window, and is rendered as its own chart.
     - Intensity approximation depends on 'datasource':
         oracle    ≈ 0.75 * bucket_value * waits
         bpf       ≈ 1.50 * bucket_value * waits
         systemtap ≈ 1.50 * bucket_value * waits
         dtrace    ≈ 1.50 * bucket_value * waits
+    - Log-linear histograms (values between powers of two, e.g. DTrace llquantize) are accepted:
+      each value counts in its power of two, and is spread over the 8 linear sub-buckets per
+      power of two that its input bucket (up to the next value) covers, which --zoom / key z
+      show as 2, 4 or 8 rows per power of two. Intensity is then estimated at the middle of each
+      covered part. The binary format and session files keep the log2 buckets.
 
 CLI (see --help)
-  --num_records INT       Number of columns (time window). Default: 90
+  --num_records INT       Number of columns (time window). Default: fit the terminal (resizes
+                          re-render at once from retained columns), 90 when not a terminal
   --min_bucket INT        Lower bucket exponent (log2). -1 = autotune
   --max_bucket INT        Upper bucket exponent (log2). 64 = autotune
   --frequency_maxval F    Fix frequency color scale max; -1 = auto
   --intensity_maxval F    Fix intensity color scale max; -1 = auto
   --screen_delay FLOAT    Delay between frames (sec). Default: 0.1
-  --debug_level INT       Verbosity 0..5. Default: 0
+  --stream KEY            Multiplexed input: show only this stream (keys n/p/a switch at runtime)
+  --parser stream|line    Input parser: chunked bytes-level (default) or legacy line reader
+  --diff_repaint          Repaint only changed cells instead of clearing the screen
+  --coalesce              Non-blocking ingest: merge records queued while rendering, show lag
+  --replay                Fast-forward: no delay, render only the last frame, report records/sec
+  --render_every INT      With --replay, also render every Nth record
+  --render_at TS,...      With --replay, also render at these record timestamps (microsec)
+  --record FILE           Append the incoming records to a session file (FILE + FILE.idx)
+  --session FILE          Read records from a session file instead of stdin
+  --start/--end TIME      With --session, only this time range: microsec, as the records' timestamps,
+                          or 'YYYY-MM-DD HH:MM:SS' (sources with epoch timestamps only: not Oracle
+                          ora_latency*.sql, AWR or DTrace)
+  --follow                With --session, keep reading blocks appended by a running --record
+  --export FILE           Write the whole capture as heat maps to FILE (.svg or .html), no terminal output
+  --rollups SEC,...       Also keep coarser windows (e.g. 10,60,600 sec); key r switches resolution
+  --percentiles [P,...]   Footer with percentiles of the latest column and of the window (50,99,99.9)
+  --metrics_port PORT     Serve the latest cumulative histograms in OpenMetrics format on /metrics
+  --metrics_addr ADDR     Address of the metrics endpoint. Default: 127.0.0.1
+  --detect                Detect latency shifts (tail buckets, intensity) against a rolling baseline
+  --detect_threshold F    Shift factor over the baseline that raises an alert. Default: 2.0
+  --alert_cmd CMD         With --detect, run CMD (shell) when an alert starts; details in LATENCYMAP_* env
+  --alert_log FILE        With --detect, append a line per alert to FILE ('-' = stderr)
+  --zoom N                With log-linear input, N rows (1, 2, 4, 8) per power of 2; key z zooms
+  --stats                 Footer line with LatencyMap's own timings (read, deltas, render), frames/sec,
+                          bytes per frame, lag behind the wall clock and input still queued
+  --stats_file FILE       Append the same stats as one JSON object per frame to FILE ('-' = stderr)
+  --debug_level INT       Verbosity 0..5. Default: 0 (1 = show frame bytes and render time)
 
 Examples
   # From a live source
@@ -50,6 +88,16 @@ Examples
   # Replay sample data
   cat SampleData/example_latency_data.txt | latencymap --screen_delay=0.2
 
+  # Fast-forward a recorded capture: final window only, plus every 20th frame
+  cat SampleData/example_latency_data.txt | latencymap --replay --render_every=20
+
+  # Record a live session, later replay only the incident window
+  data_source | latencymap --record=io.lms
+  latencymap --session=io.lms --start='2025-09-20 10:00:00' --end='2025-09-20 10:15:00'
+
+  # Full-resolution heat maps of a long capture for a report
+  latencymap --session=io.lms --export=io.html
+
 Requirements
   Python 3.x and a terminal with ANSI color support.
 """
@@ -57,9 +105,29 @@ Requirements
 from __future__ import annotations
 import sys
 import argparse
+import atexit
+import bisect
+import copy
+import html
+import http.server
+import io
+import json
 import math
+import operator
+import os
+import queue
+import re
+import shutil
+import signal
+import struct
+import subprocess
+import threading
 import time
-from typing import Dict, List
+import zlib
+from array import array
+from collections import deque
+from itertools import accumulate, groupby
+from typing import BinaryIO, Callable, Deque, Dict, Iterator, List, Optional, Tuple
 
 # ----------------------------- Parameters & CLI ----------------------------- #
 
@@ -70,6 +138,8 @@ class GlobalParameters:
     def __init__(self) -> None:
         # Chart/window width (time axis)
         self.num_latency_records: int = 90
+        # Without --num_records on a terminal: width from the terminal, resized on SIGWINCH
+        self.fit_terminal: bool = False
 
         # Buckets are log2(power-of-two value in the given latency unit).
         # -1 means autotune min; 64 was used as a sentinel for autotune max.
@@ -88,6 +158,60 @@ class GlobalParameters:
         # Delay between frames (useful when replaying traces)
         self.screen_delay: float = 0.1
 
+        # Stream shown at startup when the input multiplexes several streams (None = all, stacked)
+        self.stream: str | None = None
+
+        # Input parser: 'stream' (chunked, bytes-level) or 'line' (line-by-line text)
+        self.parser: str = 'stream'
+
+        # Repaint only the terminal cells that changed since the previous frame
+        self.diff_repaint: bool = False
+
+        # Read input in a background thread; when rendering falls behind, the records queued
+        # since the last frame are merged into one column (frames at most every screen_delay)
+        self.coalesce: bool = False
+
+        # Fast-forward replay of recorded data: no delay, render only selected frames.
+        # The last frame is always rendered; render_every=0 means only the last one.
+        self.replay: bool = False
+        self.render_every: int = 0
+        self.render_at: List[int] = []  # record timestamps (microsec) to render at
+
+        # Session files (see SessionWriter): record the input, or replay a time range of one
+        self.record: str | None = None
+        self.session: str | None = None
+        self.session_start: int | None = None  # microsec, None = from the beginning
+        self.session_end: int | None = None    # microsec, None = to the end
+        self.session_by_date: bool = False     # start/end given as dates: epoch timestamps only
+        self.follow: bool = False
+
+        # Offline export of the whole capture to an SVG or HTML file (see HeatMapExporter)
+        self.export: str | None = None
+
+        # Column durations (sec) of the coarser windows kept next to the raw one (see RollupTier)
+        self.rollups: List[int] = []
+
+        # Percentiles interpolated from the frequency histograms, e.g. [50, 99, 99.9]; [] = off
+        self.percentiles: List[float] = []
+
+        # OpenMetrics endpoint (see MetricsExporter); None = off
+        self.metrics_port: int | None = None
+        self.metrics_addr: str = '127.0.0.1'
+
+        # Latency-shift detection (see ShiftDetector) and what to do when an alert starts
+        self.detect: bool = False
+        self.detect_threshold: float = 2.0
+        self.detect_baseline: int = 60  # records in the rolling baseline (EWMA span)
+        self.alert_cmd: str | None = None
+        self.alert_log: str | None = None
+
+        # Rows per power of two shown for log-linear (sub-bucket) input: 1, 2, 4 or 8
+        self.zoom: int = 1
+
+        # Self-instrumentation (see RuntimeStats): footer line and/or JSON lines file
+        self.stats: bool = False
+        self.stats_file: str | None = None
+
         # Unit of incoming bucket values (impacts labels & autotune min)
         # Valid: 'millisec', 'microsec', 'nanosec'
         self.latency_unit: str = 'millisec'
@@ -98,6 +222,7 @@ class GlobalParameters:
         self.latencyunit_tag: str = 'latencyunit'
         self.label_tag: str = 'label'
         self.label_data_source: str = 'datasource'
+        self.stream_tag: str = 'stream'
         self.default_data_source: str = 'bpf'  # bpf, systemtap, dtrace, oracle
 
     def parse_cli(self, argv: list[str] | None = None) -> None:
@@ -105,8 +230,9 @@ class GlobalParameters:
             prog="LatencyMap.py",
             description="Plot CLI heatmaps (frequency & intensity) from latency histograms."
         )
-        parser.add_argument("--num_records", "-n", type=int, default=self.num_latency_records,
-                            help="Number of time intervals displayed (default: 90).")
+        parser.add_argument("--num_records", "-n", type=int, default=None,
+                            help="Number of time intervals displayed (default: fit the terminal width "
+                                 "and follow its resizes; 90 when the output is not a terminal).")
         parser.add_argument("--min_bucket", type=int, default=self.min_latency_bkt,
                             help="Lower bucket exponent (log2). -1 = autotune (default).")
         parser.add_argument("--max_bucket", type=int, default=self.max_latency_bkt,
@@ -117,18 +243,132 @@ class GlobalParameters:
                             help="Max color scale for intensity map; -1 = auto (default).")
         parser.add_argument("--screen_delay", type=float, default=self.screen_delay,
                             help="Delay (sec) between screens (default: 0.1).")
+        parser.add_argument("--stream", type=str, default=None,
+                            help="With multiplexed input, show only this stream at startup "
+                                 "(default: all streams stacked; keys n/p/a switch at runtime).")
+        parser.add_argument("--parser", choices=("stream", "line"), default=self.parser,
+                            help="Input parser: chunked 'stream' (default) or legacy 'line' reader.")
+        parser.add_argument("--diff_repaint", action="store_true",
+                            help="Send only the cells that changed since the last frame (for slow links).")
+        parser.add_argument("--coalesce", action="store_true",
+                            help="Drain input in a background thread and merge records that arrive "
+                                 "faster than screen_delay into one column; shows lag in the footer.")
+        parser.add_argument("--replay", action="store_true",
+                            help="Fast-forward replay: no screen delay, render only the last frame "
+                                 "(plus --render_every/--render_at frames) and report records/sec.")
+        parser.add_argument("--render_every", type=int, default=self.render_every,
+                            help="With --replay, also render every Nth record (default: 0 = off).")
+        parser.add_argument("--render_at", type=str, default=None,
+                            help="With --replay, also render at these record timestamps "
+                                 "(comma-separated, microsec as in the 'timestamp' line).")
+        parser.add_argument("--record", type=str, default=None, metavar="FILE",
+                            help="Append the incoming records to a compressed, indexed session file.")
+        parser.add_argument("--session", type=str, default=None, metavar="FILE",
+                            help="Read records from a session file written by --record instead of stdin.")
+        parser.add_argument("--start", type=str, default=None, metavar="TIME",
+                            help="With --session, start at this time: microsec (as in the records' "
+                                 "'timestamp' line) or 'YYYY-MM-DD HH:MM:SS' (epoch timestamps only).")
+        parser.add_argument("--end", type=str, default=None, metavar="TIME",
+                            help="With --session, stop after this time: microsec or 'YYYY-MM-DD HH:MM:SS'.")
+        parser.add_argument("--follow", action="store_true",
+                            help="With --session, wait for blocks appended by a running --record.")
+        parser.add_argument("--export", type=str, default=None, metavar="FILE",
+                            help="Write the heat maps of the whole input to FILE (.svg or .html) "
+                                 "instead of rendering on the terminal.")
+        parser.add_argument("--rollups", type=str, default=None, metavar="SEC,...",
+                            help="Also keep windows of coarser columns, e.g. 10,60,600 (sec); "
+                                 "key r switches resolution at the terminal.")
+        parser.add_argument("--percentiles", type=str, nargs='?', const="50,99,99.9", default=None,
+                            metavar="P,...",
+                            help="Show percentiles of the latest column and of the window in the footer "
+                                 "(default list: 50,99,99.9).")
+        parser.add_argument("--metrics_port", type=int, default=None, metavar="PORT",
+                            help="Serve the latest cumulative histograms in OpenMetrics format on "
+                                 "http://ADDR:PORT/metrics (0 = any free port).")
+        parser.add_argument("--metrics_addr", type=str, default=self.metrics_addr, metavar="ADDR",
+                            help="Listen address of the metrics endpoint (default: 127.0.0.1).")
+        parser.add_argument("--detect", action="store_true",
+                            help="Detect latency shifts in the tail buckets or in intensity against a "
+                                 "rolling baseline; marks the columns under the heat maps.")
+        parser.add_argument("--detect_threshold", type=float, default=self.detect_threshold,
+                            help="With --detect, factor over the baseline that raises an alert (default: 2.0).")
+        parser.add_argument("--alert_cmd", type=str, default=None, metavar="CMD",
+                            help="With --detect, shell command run when an alert starts "
+                                 "(LATENCYMAP_STREAM, LATENCYMAP_REASON, LATENCYMAP_DATE in its environment).")
+        parser.add_argument("--alert_log", type=str, default=None, metavar="FILE",
+                            help="With --detect, append one line per alert to FILE ('-' = stderr).")
+        parser.add_argument("--zoom", type=int, choices=(1, 2, 4, 8), default=self.zoom,
+                            help="With log-linear input (bucket values between powers of 2), rows per "
+                                 "power of 2 at startup (default: 1); key z zooms at the terminal.")
+        parser.add_argument("--stats", action="store_true",
+                            help="Footer line with LatencyMap's own timings: read, deltas and render per frame, "
+                                 "frames/sec, bytes per frame, record lag and queued input.")
+        parser.add_argument("--stats_file", type=str, default=None, metavar="FILE",
+                            help="Append the same stats as one JSON object per frame to FILE ('-' = stderr).")
         parser.add_argument("--debug_level", "-d", type=int, default=self.debug_level,
-                            help="Debug level 0..5 (default: 0).")
+                            help="Debug level 0..5 (default: 0). 1 shows frame bytes and render time.")
 
         # Parse provided argv or default to sys.argv[1:]
         args = parser.parse_args(argv)
 
-        self.num_latency_records = args.num_records
+        if args.num_records is None:
+            self.fit_terminal = sys.stdout.isatty() and not args.export
+        else:
+            self.fit_terminal = False
+            self.num_latency_records = args.num_records
         self.min_latency_bkt = args.min_bucket
         self.max_latency_bkt = args.max_bucket
         self.frequency_maxval = -1 if args.frequency_maxval is None else args.frequency_maxval
         self.intensity_maxval = -1 if args.intensity_maxval is None else args.intensity_maxval
         self.screen_delay = args.screen_delay
+        self.stream = None if args.stream is None else args.stream.strip().lower()
+        self.parser = args.parser
+        self.diff_repaint = args.diff_repaint
+        self.coalesce = args.coalesce
+        self.replay = args.replay
+        self.render_every = args.render_every
+        if args.render_at:
+            try:
+                self.render_at = sorted(int(ts) for ts in args.render_at.split(','))
+            except ValueError:
+                parser.error("--render_at expects comma-separated integer timestamps")
+        self.record = args.record
+        self.session = args.session
+        try:
+            self.session_start = None if args.start is None else parse_session_time(args.start)
+            self.session_end = None if args.end is None else parse_session_time(args.end)
+        except ValueError as err:
+            parser.error(str(err))
+        self.session_by_date = any(t is not None and not t.strip().isdigit() for t in (args.start, args.end))
+        self.follow = args.follow
+        self.export = args.export
+        if args.rollups:
+            try:
+                self.rollups = sorted(int(sec) for sec in args.rollups.split(','))
+            except ValueError:
+                parser.error("--rollups expects comma-separated integer seconds")
+            if self.rollups[0] <= 0:
+                parser.error("--rollups seconds must be positive")
+        if args.percentiles:
+            try:
+                self.percentiles = [float(p) for p in args.percentiles.split(',')]
+            except ValueError:
+                parser.error("--percentiles expects comma-separated numbers, e.g. 50,99,99.9")
+            if not all(0 < p < 100 for p in self.percentiles):
+                parser.error("--percentiles must be between 0 and 100 (exclusive)")
+        self.metrics_port = args.metrics_port
+        self.metrics_addr = args.metrics_addr
+        self.detect = args.detect
+        if args.detect_threshold <= 1:
+            parser.error("--detect_threshold must be greater than 1")
+        self.detect_threshold = args.detect_threshold
+        self.alert_cmd = args.alert_cmd
+        self.alert_log = args.alert_log
+        self.zoom = args.zoom
+        self.stats = args.stats
+        self.stats_file = args.stats_file
+        if self.export and not self.export.lower().endswith(('.svg', '.html', '.htm')):
+            parser.error("--export FILE must end in .svg or .html")
         self.debug_level = args.debug_level
 
     def usage_banner(self) -> None:
@@ -137,29 +377,69 @@ class GlobalParameters:
 
 g_params = GlobalParameters()  # Initialized in __main__
 
+
+def parse_session_time(text: str) -> int:
+    """Microsec as in record timestamps, or epoch microsec of a local 'YYYY-MM-DD HH:MM[:SS]' time."""
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return int(time.mktime(time.strptime(text, fmt)) * 1_000_000)
+        except ValueError:
+            pass
+    raise ValueError(f"Cannot parse time {text!r}: use microsec or 'YYYY-MM-DD HH:MM:SS'")
+
 # --------------------------- Data types & helpers --------------------------- #
 
+# Record timestamps are microsec, but not all of them since the epoch: ora_latency*.sql sends
+# microsec since midnight, awr_latency.sql since 2010-01-01 and the DTrace scripts since boot.
+# Timestamps from 2001-09-09 on (1e15 microsec) are taken as epoch times, the others are not.
+EPOCH_TIMESTAMP_MIN = 10 ** 15
+
+
+def is_epoch_timestamp(timestamp: int | None) -> bool:
+    """True when a record timestamp (microsec) can be compared with the wall clock."""
+    return timestamp is not None and timestamp >= EPOCH_TIMESTAMP_MIN
+
+
 class LatencyRecord:
     """
     One sampling record of latency data.
     Holds frequency & intensity histograms (buckets in log2 indices).
+    Log-linear inputs (bucket values that are not powers of two, e.g. DTrace llquantize or
+    HDR-style sub-buckets) are also spread on a grid of SUB_BUCKETS linear sub-buckets per power
+    of two, indexed exponent * SUB_BUCKETS + sub-bucket, for the zoomed views (--zoom).
     """
+    SUB_BUCKETS = 8
+
     def __init__(self) -> None:
         # Raw data: exponent-> cumulative count at timestamp. Special keys: 'timestamp'
+        # Values that are not powers of two count in the bucket of their exponent (floor of log2)
         self.data: Dict[int | str, int] = {}
+        # ... and also here: bucket value -> cumulative count, with the power of two of their
+        # bucket when its line came first (input in ascending order)
+        self.fine: Dict[int, int] = {}
 
         # Pre-allocate with a generous upper bound; safe even after autotune shrinks the range.
         self.frequency_histogram: List[float] = [0.0 for _ in range(0, 65)]
         self.intensity_histogram: List[float] = [0.0 for _ in range(0, 65)]
+        # Frequency per bucket not clamped to the displayed range, for --percentiles
+        self.unclamped_frequency: List[float] = [0.0 for _ in range(0, 65)]
 
         self.delta_time: int = 0  # microseconds between this and previous record
         self.max_frequency: float = 0.0
         self.sum_frequency: float = 0.0
         self.max_intensity: float = 0.0
         self.sum_intensity: float = 0.0
+        # Rates per sub-bucket index (clamped to the bucket range), only for log-linear inputs
+        self.fine_frequency: Dict[int, float] = {}
+        self.fine_intensity: Dict[int, float] = {}
         self.date: str = ''
         self.label: str = ''
         self.data_source: str = g_params.default_data_source
+        self.stream: str = ''
+        self.latency_unit: str = ''  # '' when the record has no latencyunit line
 
     # ---------------------- Input parsing & record IO ---------------------- #
 
@@ -168,8 +448,7 @@ class LatencyRecord:
         while True:
             line = sys.stdin.readline()
             if not line:
-                print("\nReached EOF from data source, exiting.")
-                sys.exit(0)
+                raise EOFError("Reached EOF from data source")
             line = line.strip()
             if line:
                 return line.lower()
@@ -180,91 +459,180 @@ class LatencyRecord:
                 return
 
     def read_record(self) -> None:
+        """Line-by-line text parser (--parser=line); see RecordStreamParser for the default."""
         while True:
-            line = self._read_non_empty_line_lower_stripped()
-            split_line = [x.strip() for x in line.split(",")]
-
-            # End-of-record
-            if len(split_line) == 1 and split_line[0] == g_params.end_tag:
+            if self.parse_line(self._read_non_empty_line_lower_stripped()):
                 return
 
-            # Header / meta lines
-            if len(split_line) == 4 and split_line[0] == 'timestamp' and split_line[1] == 'microsec':
-                self.data['timestamp'] = int(split_line[2])
-                self.date = split_line[3]
-                continue
+    def add_sub_bucket(self, value: int, count: int) -> None:
+        """Count a bucket value that is not a power of two (log-linear input)."""
+        if value <= 0:
+            raise ValueError(f"Bucket value must be positive: {value}")
+        bucket = value.bit_length() - 1
+        power = 1 << bucket
+        if power not in self.fine and bucket in self.data:
+            if not any(v.bit_length() - 1 == bucket for v in self.fine):
+                self.fine[power] = self.data[bucket]  # the power of two's own line
+        self.data[bucket] = self.data.get(bucket, 0) + count
+        self.fine[value] = self.fine.get(value, 0) + count
+
+    def parse_line(self, line: str) -> bool:
+        """
+        Parse one non-empty, lowercased and stripped line of a record.
+        Returns True on the end-of-record tag.
+        """
+        split_line = [x.strip() for x in line.split(",")]
 
-            if len(split_line) == 2 and split_line[0] == g_params.label_tag:
-                self.label = split_line[1]
-                continue
+        # End-of-record
+        if len(split_line) == 1 and split_line[0] == g_params.end_tag:
+            return True
 
-            if len(split_line) == 2 and split_line[0] == g_params.label_data_source:
-                self.data_source = split_line[1]
-                continue
+        # Header / meta lines
+        if len(split_line) == 4 and split_line[0] == 'timestamp' and split_line[1] == 'microsec':
+            self.data['timestamp'] = int(split_line[2])
+            self.date = split_line[3]
+            return False
 
-            if len(split_line) == 2 and split_line[0] == g_params.latencyunit_tag:
-                unit = split_line[1]
-                if unit not in ('millisec', 'microsec', 'nanosec'):
-                    raise ValueError(f"Cannot understand latency unit in line: {line!r}")
-                g_params.latency_unit = unit
-                continue
+        if len(split_line) == 2 and split_line[0] == g_params.label_tag:
+            self.label = split_line[1]
+            return False
 
-            # Data lines: <power_of_two_value>,<count>
-            if len(split_line) != 2:
-                raise ValueError(f"Cannot process record line: {line!r}")
+        if len(split_line) == 2 and split_line[0] == g_params.label_data_source:
+            self.data_source = split_line[1]
+            return False
 
-            try:
-                power_of_two_val = int(split_line[0])
-                count = int(split_line[1])
-                bucket = math.log(power_of_two_val, 2.0)
-            except Exception as exc:
-                raise ValueError(f"Cannot parse data line: {line!r} ({exc})") from exc
+        if len(split_line) == 2 and split_line[0] == g_params.stream_tag:
+            self.stream = split_line[1]
+            return False
+
+        if len(split_line) == 2 and split_line[0] == g_params.latencyunit_tag:
+            unit = split_line[1]
+            if unit not in ('millisec', 'microsec', 'nanosec'):
+                raise ValueError(f"Cannot understand latency unit in line: {line!r}")
+            self.latency_unit = unit
+            return False
 
-            if abs(int(bucket) - bucket) > 1e-6:
-                raise ValueError(f"Bucket value must be a power of 2: {line!r}")
-            bucket = int(bucket)
+        # Data lines: <power_of_two_value>,<count>
+        if len(split_line) != 2:
+            raise ValueError(f"Cannot process record line: {line!r}")
 
-            # Keep cumulative count for this exponent bucket
-            self.data[bucket] = self.data.get(bucket, 0) + count
+        try:
+            power_of_two_val = int(split_line[0])
+            count = int(split_line[1])
+        except Exception as exc:
+            raise ValueError(f"Cannot parse data line: {line!r} ({exc})") from exc
+
+        if power_of_two_val <= 0:
+            raise ValueError(f"Bucket value must be positive: {line!r}")
+        if power_of_two_val & (power_of_two_val - 1):
+            self.add_sub_bucket(power_of_two_val, count)
+            return False
+
+        # Keep cumulative count for this exponent bucket
+        bucket = power_of_two_val.bit_length() - 1
+        self.data[bucket] = self.data.get(bucket, 0) + count
+        return False
 
     # ----------------------- Computations & autotune ----------------------- #
 
-    @staticmethod
-    def _autotune_latency_buckets() -> None:
+    def bucket_value_counts(self) -> Dict[int, int]:
         """
-        Compute min/max buckets for the heatmap window on first record.
-        - For microsecond inputs (typical), default min is 2^7 µs (128 µs).
-        - Display still uses milliseconds for the left axis labels.
+        Cumulative counts per input bucket value: `fine`, and the powers of two with what `fine`
+        does not hold of their bucket in `data`. A power of two with log-linear values in its
+        bucket, no line of its own and no events left is not a bucket of the input.
         """
-        if g_params.min_latency_bkt == -1:
-            g_params.min_latency_bkt = {
-                'millisec': 0,   # 1 ms
-                'microsec': 7,   # 128 µs (v1.3 default)
-                'nanosec': 17,   # 131,072 ns (~0.131 ms)
-            }[g_params.latency_unit]
-
-        if g_params.max_latency_bkt == 64:
-            # ~12 buckets vertically by default (min .. min+11)
-            g_params.max_latency_bkt = g_params.min_latency_bkt + 11
-
-    def compute_deltas(self, previous: 'LatencyRecord') -> None:
+        counts = dict(self.fine)
+        rest = {bucket: count for bucket, count in self.data.items() if bucket != 'timestamp'}
+        for value, count in self.fine.items():
+            rest[value.bit_length() - 1] -= count
+        for bucket, count in rest.items():
+            power = 1 << bucket
+            if count or power in counts or not any(v.bit_length() - 1 == bucket for v in self.fine):
+                counts[power] = counts.get(power, 0) + count
+        return counts
+
+    def fine_histograms(self) -> Tuple[Dict[int, float], Dict[int, float]]:
+        """Frequency and intensity per sub-bucket index; log2 records have them in sub-bucket 0."""
+        if self.fine_frequency:
+            return self.fine_frequency, self.fine_intensity
+        sub = self.SUB_BUCKETS
+        return ({bucket * sub: v for bucket, v in enumerate(self.frequency_histogram) if v},
+                {bucket * sub: v for bucket, v in enumerate(self.intensity_histogram) if v})
+
+    def _compute_sub_bucket_deltas(self, previous: 'LatencyRecord', time_factor: float,
+                                   min_bkt: int, max_bkt: int) -> None:
+        """
+        compute_deltas of log-linear records. An input bucket spans from its value to the next
+        value of the input ([v, next), with 2 * v after the last one, as the 1.5x log2 convention),
+        or for Oracle from the previous value to its value ((previous, v], v / 2 before the first
+        one). Its events are spread evenly over the sub-buckets it overlaps, and their time
+        waited is estimated at the middle of each overlap. Oracle rows are those of the bucket
+        upper bounds, (2^(b-1), 2^b] in row b, as in the log2 histograms.
+        The log2 histograms are the sums of the sub-buckets of each power of two.
+        """
+        if self.data_source not in ('bpf', 'systemtap', 'dtrace', 'oracle'):
+            raise ValueError("Invalid datasource. Use one of: bpf, systemtap, dtrace, oracle.")
+        sub = self.SUB_BUCKETS
+        oracle = self.data_source == 'oracle'
+        lo, hi = min_bkt * sub, max_bkt * sub + sub - 1
+        counts, previous_counts = self.bucket_value_counts(), previous.bucket_value_counts()
+        values = sorted(counts.keys() | previous_counts.keys())
+        fine_frequency, fine_intensity = self.fine_frequency, self.fine_intensity
+        for i, value in enumerate(values):
+            frequency = (counts.get(value, 0) - previous_counts.get(value, 0)) / time_factor
+            if not frequency:
+                continue
+            if oracle:
+                low, high = (values[i - 1] if i else value / 2), value
+            else:
+                low, high = value, (values[i + 1] if i + 1 < len(values) else 2 * value)
+            per_unit = frequency / (high - low)
+            start = low
+            while start < high:
+                # Sub-bucket of `start`, on the grid of the bucket upper bounds for Oracle
+                mantissa, exponent = math.frexp(start * 2 if oracle else start)
+                bucket = exponent - 1
+                part = min(int((mantissa * 2 - 1) * sub), sub - 1)
+                end = min(high, math.ldexp(1 + (part + 1) / sub, bucket - oracle))
+                if end <= start:
+                    break
+                share = per_unit * (end - start)
+                self.unclamped_frequency[min(max(bucket, 0), 64)] += share
+                write_bucket = min(max(bucket, min_bkt), max_bkt)
+                self.frequency_histogram[write_bucket] += share
+                self.intensity_histogram[write_bucket] += share * (start + end) / 2
+                write_index = min(max(bucket * sub + part, lo), hi)
+                fine_frequency[write_index] = fine_frequency.get(write_index, 0.0) + share
+                fine_intensity[write_index] = fine_intensity.get(write_index, 0.0) + share * (start + end) / 2
+                start = end
+
+    def compute_deltas(self, previous: 'LatencyRecord', min_bkt: int, max_bkt: int) -> None:
         # timestamp delta (usec); convert to seconds for rates
         self.delta_time = self.data.get('timestamp', 0) - previous.data.get('timestamp', 0)
         time_factor = self.delta_time / 1e6 if self.delta_time > 0 else 1.0
 
+        if self.fine or previous.fine:
+            self._compute_sub_bucket_deltas(previous, time_factor, min_bkt, max_bkt)
+            self.max_frequency = max(self.frequency_histogram[min_bkt:max_bkt + 1])
+            self.sum_frequency = sum(self.frequency_histogram[min_bkt:max_bkt + 1])
+            self.max_intensity = max(self.intensity_histogram[min_bkt:max_bkt + 1])
+            self.sum_intensity = sum(self.intensity_histogram[min_bkt:max_bkt + 1])
+            return
+
         for bucket in list(self.data.keys()):
             if bucket == 'timestamp':
                 continue
 
             write_bucket = bucket
-            if bucket > g_params.max_latency_bkt:
-                write_bucket = g_params.max_latency_bkt
-            if bucket < g_params.min_latency_bkt:
-                write_bucket = g_params.min_latency_bkt
+            if bucket > max_bkt:
+                write_bucket = max_bkt
+            if bucket < min_bkt:
+                write_bucket = min_bkt
 
             delta_count = self.data.get(bucket, 0) - previous.data.get(bucket, 0)
             # Frequency: events per second
             self.frequency_histogram[write_bucket] += (delta_count / time_factor)
+            self.unclamped_frequency[min(bucket, 64)] += (delta_count / time_factor)
 
             # Intensity: approximate time waited per second
             # Oracle histograms bucket differently vs BPF/SystemTap/DTrace (factor-of-2 difference).
@@ -276,56 +644,933 @@ class LatencyRecord:
             else:
                 raise ValueError("Invalid datasource. Use one of: bpf, systemtap, dtrace, oracle.")
 
-        self.max_frequency = max(self.frequency_histogram[g_params.min_latency_bkt:g_params.max_latency_bkt + 1])
-        self.sum_frequency = sum(self.frequency_histogram[g_params.min_latency_bkt:g_params.max_latency_bkt + 1])
-        self.max_intensity = max(self.intensity_histogram[g_params.min_latency_bkt:g_params.max_latency_bkt + 1])
-        self.sum_intensity = sum(self.intensity_histogram[g_params.min_latency_bkt:g_params.max_latency_bkt + 1])
+        self.max_frequency = max(self.frequency_histogram[min_bkt:max_bkt + 1])
+        self.sum_frequency = sum(self.frequency_histogram[min_bkt:max_bkt + 1])
+        self.max_intensity = max(self.intensity_histogram[min_bkt:max_bkt + 1])
+        self.sum_intensity = sum(self.intensity_histogram[min_bkt:max_bkt + 1])
+
+
+class RecordStreamParser:
+    """
+    Streaming parser for the record protocol (default, --parser=stream).
+    Reads a binary stream in large chunks and tokenizes lines as bytes. Data lines take a
+    fast path (int() on bytes, bit tests for the bucket exponent); other lines go through
+    LatencyRecord.parse_line. Iterating yields complete records and stops normally at EOF;
+    a partial record at EOF is dropped.
+    """
+    CHUNK_SIZE = 1 << 16
+    BEGIN_TAG = b'<begin record>'
+    DIGITS = frozenset(b'0123456789')
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self.stream = stream
+        # read1 returns what is available: live pipes are not held back to fill a chunk
+        self._read = getattr(stream, 'read1', stream.read)
+
+    def __iter__(self) -> Iterator[LatencyRecord]:
+        # The input format is auto-detected from the first byte of the stream
+        first_chunk = self._read(self.CHUNK_SIZE)
+        if first_chunk.startswith(BinaryRecordFormat.MAGIC[:1]):
+            return self._binary_records(first_chunk)
+        return self._text_records(first_chunk)
+
+    def _line_batches(self, chunk: bytes) -> Iterator[List[bytes]]:
+        """Complete lines, one list per chunk read."""
+        pending = b''
+        while chunk:
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            yield lines
+            chunk = self._read(self.CHUNK_SIZE)
+        if pending:
+            yield [pending]
+
+    def _text_records(self, first_chunk: bytes) -> Iterator[LatencyRecord]:
+        begin_tag = self.BEGIN_TAG
+        digits = self.DIGITS
+        rec: LatencyRecord | None = None
+        data: Dict[int | str, int] = {}
+
+        for lines in self._line_batches(first_chunk):
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                if rec is None:
+                    if line.lower() == begin_tag:
+                        rec = LatencyRecord()
+                        data = rec.data
+                    continue
+
+                # Fast path: <power_of_two_value>,<count>
+                if line[0] in digits:
+                    value_field, comma, count_field = line.partition(b',')
+                    if comma and b',' not in count_field:
+                        try:
+                            value = int(value_field)
+                            count = int(count_field)
+                        except ValueError as exc:
+                            text = line.decode('utf-8', 'replace')
+                            raise ValueError(f"Cannot parse data line: {text!r} ({exc})") from exc
+                        if value & (value - 1) or not value:
+                            # Log-linear sub-bucket (or 0, rejected there)
+                            try:
+                                rec.add_sub_bucket(value, count)
+                            except ValueError:
+                                text = line.decode('utf-8', 'replace')
+                                raise ValueError(f"Bucket value must be positive: {text!r}") from None
+                            continue
+                        bucket = value.bit_length() - 1
+                        data[bucket] = data.get(bucket, 0) + count
+                        continue
+
+                # Tags, metadata and malformed lines
+                if rec.parse_line(line.decode('utf-8', 'replace').lower()):
+                    yield rec
+                    rec = None
+
+    def _binary_records(self, first_chunk: bytes) -> Iterator[LatencyRecord]:
+        fmt = BinaryRecordFormat
+        frame_size, label_size = fmt.FRAME.size, fmt.LABEL.size
+        labels: Dict[int, str] = {}
+        stream = ''
+        buf = bytearray(first_chunk)
+        pos = 0
+
+        while True:
+            # Decode all the complete frames in the buffer
+            while len(buf) - pos >= frame_size:
+                magic, version, frame_type = fmt.FRAME.unpack_from(buf, pos)
+                if magic != fmt.MAGIC:
+                    raise ValueError(f"Bad binary record frame at byte offset {pos}")
+                if version != fmt.VERSION:
+                    raise ValueError(f"Unsupported binary record version: {version}")
+                body = pos + frame_size
+
+                if frame_type == fmt.TYPE_LABEL:
+                    if len(buf) - body < label_size:
+                        break
+                    label_id, length = fmt.LABEL.unpack_from(buf, body)
+                    end = body + label_size + length
+                    if len(buf) < end:
+                        break
+                    labels[label_id] = bytes(buf[body + label_size:end]).decode('utf-8', 'replace').lower()
+                elif frame_type == fmt.TYPE_STREAM:
+                    if len(buf) - body < fmt.STREAM.size:
+                        break
+                    (label_id,) = fmt.STREAM.unpack_from(buf, body)
+                    stream = labels.get(label_id, '')
+                    end = body + fmt.STREAM.size
+                elif frame_type == fmt.TYPE_RECORD:
+                    record = fmt.RECORD
+                    if len(buf) - body < record.size:
+                        break
+                    timestamp, unit, source, label_id, num_buckets, date_length, num_values = \
+                        record.unpack_from(buf, body)
+                    buckets = body + record.size + date_length
+                    values = buckets + num_buckets * fmt.BUCKET.size
+                    end = values + num_values * fmt.VALUE.size
+                    if len(buf) < end:
+                        break
+                    try:
+                        latency_unit = fmt.UNITS[unit]
+                        data_source = fmt.DATASOURCES[source]
+                    except IndexError:
+                        raise ValueError(f"Bad unit/datasource code in binary record: {unit}/{source}") from None
+                    rec = LatencyRecord()
+                    data = rec.data
+                    data['timestamp'] = timestamp
+                    for bucket, count in fmt.BUCKET.iter_unpack(buf[buckets:values]):
+                        data[bucket] = data.get(bucket, 0) + count
+                    rec.fine = dict(fmt.VALUE.iter_unpack(buf[values:end]))
+                    rec.data_source = data_source
+                    rec.latency_unit = latency_unit
+                    rec.stream = stream
+                    rec.label = labels.get(label_id, '')
+                    rec.date = bytes(buf[body + record.size:buckets]).decode('utf-8', 'replace').lower()
+                    if not rec.date and is_epoch_timestamp(timestamp):
+                        rec.date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp / 1e6))
+                    yield rec
+                else:
+                    raise ValueError(f"Unknown binary frame type: {frame_type}")
+                pos = end
+
+            chunk = self._read(self.CHUNK_SIZE)
+            if not chunk:
+                return  # a partial frame at EOF is dropped
+            del buf[:pos]
+            pos = 0
+            buf += chunk
+
+
+class BinaryRecordFormat:
+    """
+    Versioned binary framing of records, an optional alternative to the text protocol.
+    Every frame starts with MAGIC (first byte 0xff, never valid in the text protocol),
+    a version and a frame type:
+      - label frame:  label id (u16), length (u16), utf-8 label text
+      - record frame: timestamp microsec (i64), unit code (u8), datasource code (u8),
+                      label id (u16), number of buckets (u16), date length (u16),
+                      number of values (u16), the utf-8 date text of the source (empty
+                      if none), then (exponent u8, cumulative count u64) pairs, then for
+                      log-linear input (value u64, cumulative count u64) pairs of the
+                      input bucket values (LatencyRecord.fine)
+      - stream frame: label id (u16) of the stream key of the records that follow
+    Labels and stream keys are sent once and then referenced by id; the date is sent with each
+    record, as it changes with each record. Without a date, the reader formats the timestamp
+    as a date when it is an epoch timestamp.
+    All fields are little-endian.
+    """
+    MAGIC = b'\xffLM'
+    VERSION = 1
+    TYPE_RECORD = 1
+    TYPE_LABEL = 2
+    TYPE_STREAM = 3
+    FRAME = struct.Struct('<3sBB')
+    RECORD = struct.Struct('<qBBHHHH')
+    BUCKET = struct.Struct('<BQ')
+    VALUE = struct.Struct('<QQ')
+    LABEL = struct.Struct('<HH')
+    STREAM = struct.Struct('<H')
+    UNITS = ('millisec', 'microsec', 'nanosec')
+    DATASOURCES = ('bpf', 'systemtap', 'dtrace', 'oracle')
+
+
+class BinaryRecordWriter:
+    """
+    Writes records in BinaryRecordFormat; used by the connectors' --binary option.
+    Records can be written from their fields (write_record) or from the lines of the
+    text protocol (write_text_line), which are parsed as LatencyMap does.
+    """
+    def __init__(self, out: BinaryIO) -> None:
+        self.out = out
+        self.label_ids: Dict[str, int] = {}
+        self.stream: str = ''
+        self.latency_unit: str = 'millisec'  # text records without a latencyunit line inherit it
+        self._text_record: LatencyRecord | None = None
+
+    def _label_id(self, label: str) -> int:
+        label_id = self.label_ids.get(label)
+        if label_id is None:
+            fmt = BinaryRecordFormat
+            label_id = len(self.label_ids)
+            text = label.encode('utf-8')
+            self.out.write(fmt.FRAME.pack(fmt.MAGIC, fmt.VERSION, fmt.TYPE_LABEL)
+                           + fmt.LABEL.pack(label_id, len(text)) + text)
+            self.label_ids[label] = label_id
+        return label_id
+
+    def write_record(self, timestamp: int, buckets: Dict[int, int], label: str = '',
+                     latency_unit: str = 'microsec', data_source: str = 'bpf', stream: str = '',
+                     date: str = '', values: Dict[int, int] | None = None) -> None:
+        """
+        `buckets` maps log2 exponent -> cumulative count; `date` is the source's date text;
+        `values` maps the bucket values of log-linear input -> cumulative count (their counts
+        are also in `buckets`, see LatencyRecord.fine).
+        """
+        fmt = BinaryRecordFormat
+        if stream != self.stream:
+            self.out.write(fmt.FRAME.pack(fmt.MAGIC, fmt.VERSION, fmt.TYPE_STREAM)
+                           + fmt.STREAM.pack(self._label_id(stream)))
+            self.stream = stream
+        label_id = self._label_id(label)
+        date_text = date.encode('utf-8')
+        parts = [fmt.FRAME.pack(fmt.MAGIC, fmt.VERSION, fmt.TYPE_RECORD),
+                 fmt.RECORD.pack(timestamp, fmt.UNITS.index(latency_unit),
+                                 fmt.DATASOURCES.index(data_source), label_id, len(buckets),
+                                 len(date_text), len(values or ())),
+                 date_text]
+        parts.extend(fmt.BUCKET.pack(bucket, count) for bucket, count in sorted(buckets.items()))
+        if values:
+            parts.extend(fmt.VALUE.pack(value, count) for value, count in sorted(values.items()))
+        self.out.write(b''.join(parts))
+        self.out.flush()
+
+    def write_text_line(self, line: str) -> None:
+        """Accumulate one line of the text protocol; the record is written at its end tag."""
+        line = line.strip().lower()
+        if not line:
+            return
+        if self._text_record is None:
+            if line == g_params.begin_tag:
+                self._text_record = LatencyRecord()
+            return
+        rec = self._text_record
+        if rec.parse_line(line):
+            self._text_record = None
+            buckets = {bucket: count for bucket, count in rec.data.items() if bucket != 'timestamp'}
+            self.latency_unit = rec.latency_unit or self.latency_unit
+            self.write_record(int(rec.data.get('timestamp', 0)), buckets, rec.label,
+                              self.latency_unit, rec.data_source, rec.stream, rec.date, rec.fine)
+
+
+# ----------------------------- Session files ------------------------------ #
+
+class SessionFormat:
+    """
+    Append-only session file (--record) and its sparse index (<file>.idx).
+    The session file is a sequence of blocks: a header (magic, compressed length, number of
+    records, earliest and latest record time in microsec) and a zlib-compressed payload of
+    records in BinaryRecordFormat. Each block is self-contained (its labels and stream keys are
+    re-sent). The index has one fixed-size entry per block: earliest time, latest time, byte
+    offset of the block. It is appended only after the block is complete, so a reader can follow a session
+    being written. The time of a record is its timestamp, or its arrival time when it has none.
+    """
+    BLOCK_MAGIC = b'LMSB'
+    BLOCK = struct.Struct('<4sIIqq')
+    INDEX = struct.Struct('<qqQ')
+    INDEX_SUFFIX = '.idx'
+    BLOCK_RECORDS = 256   # records per block ...
+    BLOCK_SECONDS = 5.0   # ... or fewer, to keep a followed session close to live
+
+
+class SessionWriter:
+    """Buffers records into blocks and appends them to a session file (--record)."""
+    def __init__(self, path: str) -> None:
+        self.data = open(path, 'ab')
+        self.index = open(path + SessionFormat.INDEX_SUFFIX, 'ab')
+        self.units: Dict[str, str] = {}  # per-stream unit, for records without a latencyunit line
+        self._new_block()
+
+    def _new_block(self) -> None:
+        self.payload = io.BytesIO()
+        self.writer = BinaryRecordWriter(self.payload)
+        self.num_records = 0
+        self.first_time = self.last_time = 0
+        self.block_start = time.monotonic()
+
+    def append(self, rec: LatencyRecord) -> None:
+        timestamp = int(rec.data.get('timestamp', 0))
+        record_time = timestamp or int(time.time() * 1_000_000)
+        if self.num_records == 0 or record_time < self.first_time:
+            self.first_time = record_time
+        self.last_time = max(self.last_time, record_time)
+        unit = rec.latency_unit or self.units.get(rec.stream, g_params.latency_unit)
+        self.units[rec.stream] = unit
+        buckets = {bucket: count for bucket, count in rec.data.items() if bucket != 'timestamp'}
+        self.writer.write_record(timestamp, buckets, rec.label, unit, rec.data_source, rec.stream,
+                                 rec.date, rec.fine)
+        self.num_records += 1
+        if (self.num_records >= SessionFormat.BLOCK_RECORDS
+                or time.monotonic() - self.block_start >= SessionFormat.BLOCK_SECONDS):
+            self.flush()
+
+    def flush(self) -> None:
+        if self.num_records == 0:
+            return
+        fmt = SessionFormat
+        compressed = zlib.compress(self.payload.getvalue())
+        offset = self.data.tell()
+        self.data.write(fmt.BLOCK.pack(fmt.BLOCK_MAGIC, len(compressed), self.num_records,
+                                       self.first_time, self.last_time) + compressed)
+        self.data.flush()
+        self.index.write(fmt.INDEX.pack(self.first_time, self.last_time, offset))
+        self.index.flush()
+        self._new_block()
+
+    def close(self) -> None:
+        self.flush()
+        self.data.close()
+        self.index.close()
+
+
+def recorded(records: Iterator[LatencyRecord], session: SessionWriter) -> Iterator[LatencyRecord]:
+    """Pass records through, appending each one to the session file."""
+    for rec in records:
+        session.append(rec)
+        yield rec
+
+
+class SessionReader:
+    """
+    Reads the records of a session file in a time range. The index is searched for the first
+    block that can hold `start`, so the blocks before it are never read or decompressed.
+    With follow=True, waits for new index entries at the end instead of stopping.
+    Blocks and records after `end` are skipped, not the end of the read: streams interleaved
+    in a session (e.g. one per instance) are not strictly in time order.
+    The range is in the clock of the record timestamps; by_date=True says it was given as dates
+    (epoch times), which is refused for sessions whose source clock is not the epoch.
+    """
+    POLL_SECONDS = 0.5
+
+    def __init__(self, path: str, start: int | None = None, end: int | None = None,
+                 follow: bool = False, by_date: bool = False) -> None:
+        self.path = path
+        self.start = start
+        self.end = end
+        self.follow = follow
+        self.by_date = by_date
+
+    def _read_index(self) -> List[Tuple[int, int, int]]:
+        entry = SessionFormat.INDEX
+        with open(self.path + SessionFormat.INDEX_SUFFIX, 'rb') as f:
+            raw = f.read()
+        # a partially written last entry is left for the next poll
+        index = list(entry.iter_unpack(raw[:len(raw) - len(raw) % entry.size]))
+        if self.by_date and index and not is_epoch_timestamp(index[0][0]):
+            raise ValueError(f"{self.path}: the record timestamps are not epoch times (e.g. Oracle, AWR "
+                             f"or DTrace sources), seek with --start/--end in microsec instead of dates")
+        return index
+
+    def _read_block(self, data: BinaryIO, offset: int) -> bytes:
+        fmt = SessionFormat
+        data.seek(offset)
+        magic, length, _, _, _ = fmt.BLOCK.unpack(data.read(fmt.BLOCK.size))
+        if magic != fmt.BLOCK_MAGIC:
+            raise ValueError(f"Bad session block at byte offset {offset} of {self.path}")
+        return zlib.decompress(data.read(length))
+
+    def __iter__(self) -> Iterator[LatencyRecord]:
+        index = self._read_index()
+        # running max of the blocks' latest times: blocks are in arrival order, not strictly in time
+        last_times = list(accumulate((last for _, last, _ in index), max))
+        pos = 0 if self.start is None else bisect.bisect_left(last_times, self.start)
+        end = self.end
+        with open(self.path, 'rb') as data:
+            while True:
+                # ... so the range ends when all the remaining blocks start after it
+                remaining_first = list(accumulate((first for first, _, _ in reversed(index)), min))[::-1]
+                while pos < len(index):
+                    if end is not None and remaining_first[pos] > end:
+                        return
+                    first_time, _, offset = index[pos]
+                    pos += 1
+                    if end is not None and first_time > end:
+                        continue
+                    for rec in RecordStreamParser(io.BytesIO(self._read_block(data, offset))):
+                        timestamp = rec.data.get('timestamp', 0)
+                        if timestamp and self.start is not None and timestamp < self.start:
+                            continue
+                        if timestamp and end is not None and timestamp > end:
+                            continue
+                        yield rec
+                # a followed session is past the range once its last block starts after it
+                if not self.follow or (end is not None and index and index[-1][0] > end):
+                    return
+                time.sleep(self.POLL_SECONDS)
+                index = self._read_index()
+
+
+class SlidingWindowMax:
+    """
+    Maximum over the last `width` pushed values, in amortized O(1) per push.
+    Monotonic deque of (sequence number, value) with decreasing values.
+    """
+    def __init__(self, width: int) -> None:
+        self.width: int = width
+        self.seq: int = 0
+        self.window: Deque[Tuple[int, float]] = deque()
+        # The window starts out filled with empty (zero) columns
+        for _ in range(width):
+            self.push(0.0)
+
+    def push(self, value: float) -> None:
+        window = self.window
+        while window and window[-1][1] <= value:
+            window.pop()
+        window.append((self.seq, value))
+        if window[0][0] <= self.seq - self.width:
+            window.popleft()
+        self.seq += 1
+
+    @property
+    def max(self) -> float:
+        return self.window[0][1]
+
+
+Cell = Tuple[str, str]  # (background color escape, '' = default colors; character)
+
+
+class TerminalPainter:
+    """
+    Differential repaint of composed frames.
+    Keeps the last frame written to the terminal as a grid of cells and sends only the
+    cells that changed, using cursor-positioning escapes. A heat map scroll is replayed
+    as a column shift (delete + insert character) when that is cheaper than repainting.
+    """
+    ESC_RE = re.compile(r'(\x1b\[[0-9;]*m)')
+    ESC_RESET = "\x1b[0m"
+    BLANK: Cell = ('', ' ')
+    MAX_GAP = 4  # repaint up to this many unchanged cells rather than move the cursor
+
+    def __init__(self) -> None:
+        self.grid: List[List[Cell]] | None = None
+
+    @classmethod
+    def _parse_line(cls, line: str) -> List[Cell]:
+        cells: List[Cell] = []
+        color = ''
+        for i, part in enumerate(cls.ESC_RE.split(line)):
+            if i % 2:
+                color = '' if part == cls.ESC_RESET else part
+            else:
+                cells.extend((color, ch) for ch in part)
+        return cells
+
+    @staticmethod
+    def _goto(row: int, col: int) -> str:
+        return f"\x1b[{row + 1};{col + 1}H"
+
+    @classmethod
+    def _diff_row(cls, row: int, new: List[Cell], old: List[Cell],
+                  pen: str | None) -> Tuple[str, str | None]:
+        """Escapes turning `old` into `new` on screen row `row`; returns (output, final pen color)."""
+        out: List[str] = []
+        cursor = -1  # column of the cursor on this row, -1 = unknown
+
+        def put(cell: Cell) -> None:
+            nonlocal pen
+            if cell[0] != pen:
+                out.append(cell[0] or cls.ESC_RESET)
+                pen = cell[0]
+            out.append(cell[1])
+
+        len_old = len(old)
+        for col, cell in enumerate(new):
+            if col < len_old and old[col] == cell:
+                continue
+            if cursor != col:
+                if cursor >= 0 and col - cursor <= cls.MAX_GAP:
+                    for gap_cell in new[cursor:col]:
+                        put(gap_cell)
+                else:
+                    out.append(cls._goto(row, col))
+            put(cell)
+            cursor = col + 1
+
+        if len_old > len(new):
+            if cursor != len(new):
+                out.append(cls._goto(row, len(new)))
+            if pen != '':
+                out.append(cls.ESC_RESET)
+                pen = ''
+            out.append("\x1b[K")
+        return ''.join(out), pen
+
+    def paint(self, frame: str, shift: int = 0, region: Tuple[int, int] = (0, 0)) -> str:
+        """
+        Return the output that brings the terminal from the previous frame to `frame`.
+        `shift` is the number of columns the heat maps scrolled within `region` = [start, end).
+        """
+        lines = frame.split('\n')
+        if lines and lines[-1] == '':
+            lines.pop()
+        grid = [self._parse_line(line) for line in lines]
+
+        if self.grid is None:
+            # First frame: full paint
+            self.grid = grid
+            return "\x1b[0m\x1b[2J\x1b[H" + frame
+
+        start, end = region
+        out: List[str] = []
+        pen: str | None = None
+        for row, new in enumerate(grid):
+            old = self.grid[row] if row < len(self.grid) else []
+            if new == old:
+                continue
+            text, end_pen = self._diff_row(row, new, old, pen)
+            if 0 < shift < end - start and len(old) >= end and len(new) >= end:
+                shifted = old[:start] + old[start + shift:end] + [self.BLANK] * shift + old[end:]
+                shift_text = (self._goto(row, start) + self.ESC_RESET + f"\x1b[{shift}P"
+                              + self._goto(row, end - shift) + f"\x1b[{shift}@")
+                diff_text, diff_pen = self._diff_row(row, new, shifted, '')
+                if len(shift_text) + len(diff_text) < len(text):
+                    text, end_pen = shift_text + diff_text, diff_pen
+            out.append(text)
+            pen = end_pen
+
+        if len(grid) < len(self.grid):
+            out.append(self._goto(len(grid), 0) + self.ESC_RESET + "\x1b[J")
+        elif pen:
+            out.append(self.ESC_RESET)
+        # Park the cursor below the frame, where a full paint would leave it
+        out.append(self._goto(len(grid), 0))
+        self.grid = grid
+        return ''.join(out)
+
+
+def zoom_rows(zoom: int, num_buckets: int = 65) -> array:
+    """Mapping table sub-bucket index -> display row, with `zoom` rows per power of two."""
+    sub = LatencyRecord.SUB_BUCKETS
+    return array('H', [(index // sub) * zoom + (index % sub) * zoom // sub for index in range(num_buckets * sub)])
 
 
 class ArrayOfLatencyRecords:
     """
-    Holds the scrolling window (time axis) of LatencyRecord objects.
+    Holds the scrolling window (time axis) of latency histograms for one stream, with the
+    stream's delta state (previous record), latency unit and bucket range.
+    Storage is a preallocated bucket x time matrix used as a ring buffer: `head` is
+    the slot of the oldest column, which is overwritten by the next record.
+    Window max, Max(Sum) and totals are maintained incrementally on every scroll.
+    With --rollups, the stream also feeds a RollupTier per coarser resolution.
+    Log-linear input also fills a sub-bucket matrix (allocated on the first such record),
+    rebinned to the rows of a zoomed view through the precomputed ZOOM_ROWS tables.
     """
+    NUM_BUCKETS = 65  # same generous upper bound as LatencyRecord histograms
+    HISTORY_COLUMNS = 1024  # retained for resizes, see resize()
+    SUB_BUCKETS = LatencyRecord.SUB_BUCKETS
+    FINE_ROWS = NUM_BUCKETS * SUB_BUCKETS
+    ZOOM_LEVELS = (1, 2, 4, 8)  # display rows per power of two, up to SUB_BUCKETS
+    # Display row of each sub-bucket index, per zoom level
+    ZOOM_ROWS = {zoom: zoom_rows(zoom) for zoom in ZOOM_LEVELS}
     BLUE_PALETTE = {0: 15, 1: 51, 2: 45, 3: 39, 4: 33, 5: 27, 6: 21}    # white→deep blue bg
     RED_PALETTE = {0: 15, 1: 226, 2: 220, 3: 214, 4: 208, 5: 202, 6: 196}  # white→red bg
     ESC_RESET = "\x1b[0m"
-
-    def __init__(self) -> None:
+    BG_ESCAPES = {
+        'blue': [f"\x1b[48;5;{c}m" for _, c in sorted(BLUE_PALETTE.items())],
+        'red': [f"\x1b[48;5;{c}m" for _, c in sorted(RED_PALETTE.items())],
+    }
+
+    def __init__(self, stream: str = '') -> None:
+        self.stream: str = stream
+        self.latency_unit: str = g_params.latency_unit
+        self.min_latency_bkt: int = g_params.min_latency_bkt
+        self.max_latency_bkt: int = g_params.max_latency_bkt
+        self.previous: LatencyRecord | None = None  # None until the first record: then autotune
         self.sample_number: int = 0
-        # IMPORTANT: create distinct empty records (no shared reference)
-        self.data: List[LatencyRecord] = [LatencyRecord() for _ in range(0, g_params.num_latency_records + 1)]
+        self._allocate_window(g_params.num_latency_records + 1)
+
+        # Metadata (date, label, sums) is only displayed for the newest column
+        self.latest: LatencyRecord = LatencyRecord()
+
+        # Columns kept to refill the window when the terminal is resized (--num_records not given):
+        # (column, alert flag), oldest first
+        self.history: Deque[Tuple[LatencyRecord, int]] | None = None
+        if g_params.fit_terminal:
+            self.history = deque(maxlen=self.HISTORY_COLUMNS)
+
+        # Lines of this chart in the frame being composed, see LatencyMapDisplay.render()
+        self._frame: List[str] = []
+
+        # Ingest status with --coalesce: records merged into the newest column and their wait
+        self.merged_records: int = 0
+        self.input_lag: float = 0.0
+
+        # Column duration shown in the footer with --rollups, and the coarser windows
+        self.resolution: str = 'raw'
+        self.rollups: List[RollupTier] = []
+
+        # --detect: the reason for the newest column with a latency shift
+        self.detector: ShiftDetector | None = None
+        self.alert_reason: str = ''
+
+        # Log-linear input: rows per power of two of this chart (> 1 in zoomed views)
+        self.zoom: int = 1
+
+    def _allocate_window(self, width: int) -> None:
+        """Empty ring of `width` columns, with its per-column summaries and window aggregates."""
+        self.width: int = width
+        self.head: int = 0
+
+        # Row-major by bucket: bucket b occupies [b * width, (b + 1) * width)
+        size = self.NUM_BUCKETS * self.width
+        self.frequency_matrix = array('d', bytes(8 * size))
+        self.intensity_matrix = array('d', bytes(8 * size))
+
+        # Per-column summaries, indexed by ring slot
+        self.delta_times = array('q', bytes(8 * self.width))
+        self.sum_frequency = array('d', bytes(8 * self.width))
+        self.sum_intensity = array('d', bytes(8 * self.width))
+
+        # Incremental window aggregates
+        self.max_frequency = SlidingWindowMax(self.width)
+        self.max_intensity = SlidingWindowMax(self.width)
+        self.max_sum_frequency = SlidingWindowMax(self.width)
+        self.max_sum_intensity = SlidingWindowMax(self.width)
+        self.total_frequency: float = 0.0
+        self.total_intensity: float = 0.0
+
+        # --percentiles: the unclamped frequencies of each column (same layout as the matrices
+        # above), event counts per bucket over the window (rate x column duration), kept
+        # incrementally on scroll, and the percentiles of each column (one ring per percentile)
+        self.unclamped_matrix = array('d', bytes(8 * size)) if g_params.percentiles else array('d')
+        self.window_counts = array('d', bytes(8 * self.NUM_BUCKETS))
+        self.column_percentiles: List[array] = [array('d', bytes(8 * self.width))
+                                                for _ in g_params.percentiles]
+
+        # --detect: columns with a latency shift (1 = alert)
+        self.alerts = array('b', bytes(self.width))
+
+        # Log-linear input: sub-bucket x time matrices (None until the first such record) and
+        # the zoomed views
+        self.fine_frequency_matrix: array | None = None
+        self.fine_intensity_matrix: array | None = None
+        self._zoomed: Dict[int, ArrayOfLatencyRecords] = {}
+
+    def resize(self, width: int) -> None:
+        """
+        Ring of `width` columns refilled from the retained history, with the rollup windows:
+        a wider window shows older columns again, a narrower one the newest columns.
+        """
+        history, sample_number = self.history, self.sample_number
+        self._allocate_window(width)
+        if history is not None:
+            self.history = deque(maxlen=history.maxlen)
+            for column, alert in history:
+                self.add_new_record(column)
+                if alert:
+                    self._mark_alert()
+        self.sample_number = sample_number
+        for tier in self.rollups:
+            tier.chart.resize(width)
 
     # ------------------------------- Debug -------------------------------- #
 
+    def _columns_oldest_first(self) -> range:
+        return range(self.head, self.head + self.width)
+
+    def _print_histograms_debug(self, matrix: array) -> None:
+        for i in self._columns_oldest_first():
+            col = i % self.width
+            print(list(matrix[col::self.width]), self.delta_times[col])
+
     def print_frequency_histograms_debug(self) -> None:
         print('\nFrequency histograms:')
-        for record in self.data:
-            print(record.frequency_histogram, record.delta_time)
+        self._print_histograms_debug(self.frequency_matrix)
 
     def print_intensity_histograms_debug(self) -> None:
         print('\nIntensity histograms:')
-        for record in self.data:
-            print(record.intensity_histogram, record.delta_time)
+        self._print_histograms_debug(self.intensity_matrix)
+
+    # ----------------------- Computations & autotune ----------------------- #
+
+    def _autotune_latency_buckets(self) -> None:
+        """
+        Compute min/max buckets for the heatmap window on first record.
+        - For microsecond inputs (typical), default min is 2^7 µs (128 µs).
+        - Display still uses milliseconds for the left axis labels.
+        """
+        if self.min_latency_bkt == -1:
+            self.min_latency_bkt = {
+                'millisec': 0,   # 1 ms
+                'microsec': 7,   # 128 µs (v1.3 default)
+                'nanosec': 17,   # 131,072 ns (~0.131 ms)
+            }[self.latency_unit]
+
+        if self.max_latency_bkt == 64:
+            # ~12 buckets vertically by default (min .. min+11)
+            self.max_latency_bkt = self.min_latency_bkt + 11
+
+    def ingest(self, record: LatencyRecord) -> None:
+        """Compute the deltas of a new record of this stream and scroll it into the window."""
+        # A record without a latencyunit line keeps the stream's current unit
+        if record.latency_unit:
+            self.latency_unit = record.latency_unit
+        else:
+            record.latency_unit = self.latency_unit
+
+        reason = ''
+        if self.previous is None:
+            self._autotune_latency_buckets()
+            self.rollups = [RollupTier(self, seconds) for seconds in g_params.rollups]
+            if g_params.detect:
+                self.detector = ShiftDetector(self)
+        else:
+            record.compute_deltas(self.previous, self.min_latency_bkt, self.max_latency_bkt)
+            if self.detector is not None:
+                reason = self.detector.check(record)
+                if reason and not self.alert_reason:
+                    fire_alert(self.stream, record, reason)  # hooks run once per episode
+                self.alert_reason = reason
+            # The baseline record has no deltas: the rollups start with the second one
+            column: LatencyRecord | None = record
+            for tier in self.rollups:
+                column = tier.add(column)
+                if column is None:
+                    break
+        self.add_new_record(record)
+        if reason:
+            self._mark_alert()
+        self.previous = record
+
+    def _mark_alert(self) -> None:
+        """Flag the newest column as a latency shift."""
+        self.alerts[(self.head - 1) % self.width] = 1
+        if self.history is not None:
+            self.history[-1] = (self.history[-1][0], 1)
 
     # ------------------------------ Charting ------------------------------ #
 
+    @staticmethod
+    def _column_seconds(delta_time: int) -> float:
+        """Duration of a column, as the time factor of compute_deltas (1 sec without timestamps)."""
+        return delta_time / 1e6 if delta_time > 0 else 1.0
+
+    @staticmethod
+    def _percentiles(counts: List[float] | array, data_source: str) -> List[float]:
+        """
+        Percentiles (--percentiles) of an unclamped frequency histogram, in the latency unit,
+        interpolated linearly within each log2 bucket. Events outside the displayed buckets are
+        in their own bucket, not in the edge rows of the heat map. Oracle buckets cover
+        (2^(b-1), 2^b], the other sources [2^b, 2^(b+1)), as in the intensity approximation.
+        """
+        counts = [max(c, 0.0) for c in counts]  # counter resets count as no events
+        total = sum(counts)
+        shift = -1 if data_source == 'oracle' else 0
+        result = []
+        for p in g_params.percentiles:
+            target = total * p / 100
+            cumulative = 0.0
+            value = 0.0
+            for bucket, count in enumerate(counts):
+                if count <= 0:
+                    continue
+                low = 2.0 ** (bucket + shift)
+                if cumulative + count >= target:
+                    value = low + low * (target - cumulative) / count
+                    break
+                cumulative += count
+                value = 2 * low  # rounding: the upper bound of the last bucket with events
+            result.append(value)
+        return result
+
+    def _update_percentiles(self, col: int, record: LatencyRecord) -> None:
+        """Swap the outgoing column for the new one in the window counts (before the overwrite)."""
+        width = self.width
+        old_seconds = self._column_seconds(self.delta_times[col])
+        new_seconds = self._column_seconds(record.delta_time)
+        window_counts = self.window_counts
+        new_counts = record.unclamped_frequency[:self.NUM_BUCKETS]
+        for bucket, (old, new) in enumerate(zip(self.unclamped_matrix[col::width], new_counts)):
+            if old or new:
+                window_counts[bucket] += new * new_seconds - old * old_seconds
+        self.unclamped_matrix[col::width] = array('d', new_counts)
+        for ring, value in zip(self.column_percentiles, self._percentiles(new_counts, record.data_source)):
+            ring[col] = value
+
     def add_new_record(self, record: LatencyRecord) -> None:
-        # Scroll window: discard oldest, append newest
-        self.data = self.data[1:] + [record]
+        # Scroll window: overwrite the oldest column with the newest record
+        col = self.head
+        width = self.width
+        freq, inten = self.frequency_matrix, self.intensity_matrix
+        if g_params.percentiles:
+            self._update_percentiles(col, record)
+        freq[col::width] = array('d', record.frequency_histogram[:self.NUM_BUCKETS])
+        inten[col::width] = array('d', record.intensity_histogram[:self.NUM_BUCKETS])
+
+        self.total_frequency += record.sum_frequency - self.sum_frequency[col]
+        self.total_intensity += record.sum_intensity - self.sum_intensity[col]
+        self.delta_times[col] = record.delta_time
+        self.alerts[col] = 0
+        self.sum_frequency[col] = record.sum_frequency
+        self.sum_intensity[col] = record.sum_intensity
+
+        self.max_frequency.push(record.max_frequency)
+        self.max_intensity.push(record.max_intensity)
+        self.max_sum_frequency.push(record.sum_frequency)
+        self.max_sum_intensity.push(record.sum_intensity)
+
+        if record.fine_frequency and self.fine_frequency_matrix is None:
+            self._allocate_sub_buckets()
+        if self.fine_frequency_matrix is not None:
+            self._add_sub_bucket_column(col, record)
+
+        self.head = (col + 1) % width
+        if self.head == 0:
+            # Once per full turn of the ring, drop accumulated floating point drift
+            self.total_frequency = math.fsum(self.sum_frequency)
+            self.total_intensity = math.fsum(self.sum_intensity)
+            if g_params.percentiles:
+                seconds = [self._column_seconds(dt) for dt in self.delta_times]
+                for bucket in range(self.NUM_BUCKETS):
+                    row = self.unclamped_matrix[bucket * width:(bucket + 1) * width]
+                    self.window_counts[bucket] = math.fsum(v * t for v, t in zip(row, seconds))
+
+        self.latest = record
         self.sample_number += 1
+        if self.history is not None:
+            self.history.append((record, 0))
+
+    def _allocate_sub_buckets(self) -> None:
+        """Sub-bucket matrices, with the columns already in the window in their sub-bucket 0."""
+        width, sub = self.width, self.SUB_BUCKETS
+        self.fine_frequency_matrix = array('d', bytes(8 * self.FINE_ROWS * width))
+        self.fine_intensity_matrix = array('d', bytes(8 * self.FINE_ROWS * width))
+        for fine, matrix in ((self.fine_frequency_matrix, self.frequency_matrix),
+                             (self.fine_intensity_matrix, self.intensity_matrix)):
+            for bucket in range(self.NUM_BUCKETS):
+                start = bucket * sub * width
+                fine[start:start + width] = matrix[bucket * width:(bucket + 1) * width]
+
+    def _add_sub_bucket_column(self, col: int, record: LatencyRecord) -> None:
+        width = self.width
+        empty = array('d', bytes(8 * self.FINE_ROWS))
+        for matrix, values in zip((self.fine_frequency_matrix, self.fine_intensity_matrix),
+                                  record.fine_histograms()):
+            matrix[col::width] = empty
+            for index, value in values.items():
+                matrix[index * width + col] = value
+
+    def zoomed(self, zoom: int) -> ArrayOfLatencyRecords:
+        """
+        View of this window with `zoom` rows per power of two, rebinned from the sub-buckets
+        (this chart when zoom is 1 or the input has no sub-buckets). The rows are limited to the
+        powers of two with events in the window. Rebuilt only when a column was added.
+        """
+        if zoom == 1 or self.fine_frequency_matrix is None:
+            return self
+        view = self._zoomed.get(zoom)
+        if view is not None and view.sample_number == self.sample_number:
+            return view
+
+        width, sub = self.width, self.SUB_BUCKETS
+        table = self.ZOOM_ROWS[zoom]
+        rows = {}
+        for name, fine in (('frequency_matrix', self.fine_frequency_matrix),
+                           ('intensity_matrix', self.fine_intensity_matrix)):
+            matrix = array('d', bytes(8 * self.NUM_BUCKETS * zoom * width))
+            for index in range(self.min_latency_bkt * sub, (self.max_latency_bkt + 1) * sub):
+                values = fine[index * width:(index + 1) * width]
+                if any(values):
+                    start = table[index] * width
+                    matrix[start:start + width] = array('d', map(operator.add, matrix[start:start + width], values))
+            rows[name] = matrix
+
+        view = copy.copy(self)  # shares the window state: sums, footer, alerts
+        view.zoom = zoom
+        view.frequency_matrix = rows['frequency_matrix']
+        view.intensity_matrix = rows['intensity_matrix']
+        buckets = [index // sub for index in range(self.min_latency_bkt * sub, (self.max_latency_bkt + 1) * sub)
+                   if any(self.fine_frequency_matrix[index * width:(index + 1) * width])]
+        low, high = (min(buckets), max(buckets)) if buckets else (self.min_latency_bkt, self.max_latency_bkt)
+        view.min_latency_bkt, view.max_latency_bkt = low * zoom, high * zoom + zoom - 1
+        # Color scales over the view's own (finer) cells
+        for attr, matrix in (('max_frequency', view.frequency_matrix), ('max_intensity', view.intensity_matrix)):
+            scale = SlidingWindowMax(1)
+            scale.push(max(matrix[view.min_latency_bkt * width:(view.max_latency_bkt + 1) * width]))
+            setattr(view, attr, scale)
+        self._zoomed[zoom] = view
+        return view
+
+    def _row(self, matrix: array, bucket: int) -> array:
+        """Values of one bucket across the window, oldest→newest."""
+        start = bucket * self.width
+        split = start + self.head
+        return matrix[split:start + self.width] + matrix[start:split]
 
     @staticmethod
     def _bg_color(token: int, palette: str) -> str:
-        if palette == 'blue':
-            c = ArrayOfLatencyRecords.BLUE_PALETTE[token]
-        elif palette == 'red':
-            c = ArrayOfLatencyRecords.RED_PALETTE[token]
-        else:
+        if palette not in ArrayOfLatencyRecords.BG_ESCAPES:
             raise ValueError("palette must be 'blue' or 'red'")
-        return f"\x1b[48;5;{c}m"
+        return ArrayOfLatencyRecords.BG_ESCAPES[palette][token]
 
     @staticmethod
-    def _fmt_value(v: float) -> str:
+    def _quantize_row(values: array, max_val: float) -> List[int]:
+        """Map a row of values to color tokens 0..6 (0 = no events, 6 = at/above max_val)."""
+        scale = 6 / max_val if max_val > 0 else 0.0
+        # Negative deltas (counter resets) are shown as no events, like fmt_value does
+        return [0 if v <= 0 else 6 if v >= max_val else int(v * scale) + 1 for v in values]
+
+    @staticmethod
+    def _compose_cells(tokens: List[int], palette: str) -> str:
+        """Colored blocks for a row of tokens, with one escape per run of equal colors."""
+        escapes = ArrayOfLatencyRecords.BG_ESCAPES[palette]
+        return ''.join(escapes[token] + ' ' * sum(1 for _ in run) for token, run in groupby(tokens))
+
+    @staticmethod
+    def fmt_value(v: float) -> str:
+        """Compact number for the frame, the exported heat maps and the shift alerts."""
         if v < 0:
             return "0"
         if v <= 9:
@@ -334,23 +1579,25 @@ class ArrayOfLatencyRecords:
             return str(int(round(v)))
         return f"{v:.2g}"
 
-    @staticmethod
-    def _bucket_ms_label(bucket_exp: int) -> str:
+    def bucket_ms_label(self, bucket_exp: int) -> str:
         """
-        Render the bucket upper bound as milliseconds for the left axis.
+        Render the bucket upper bound as milliseconds for the left axis, also of the exported
+        heat maps (HeatMapExporter) and in the shift alerts (ShiftDetector).
         - Always display in ms.
         - For <1ms: show with leading dot, e.g., .512
         - For >=1ms: show integer without leading dot: 1, 2, 4, 8, ...
         - Top line uses >prev, bottom uses <current (collapsed).
         """
         # Convert the bucket exponent (in given unit) to microseconds first
-        # then to milliseconds for display.
-        if g_params.latency_unit == 'millisec':
-            usec = (2 ** bucket_exp) * 1000.0
-        elif g_params.latency_unit == 'microsec':
-            usec = float(2 ** bucket_exp)
+        # then to milliseconds for display. Zoomed views have `zoom` rows per power of two.
+        zoom = self.zoom
+        value = 2 ** (bucket_exp // zoom) * (1 + (bucket_exp % zoom) / zoom)
+        if self.latency_unit == 'millisec':
+            usec = value * 1000.0
+        elif self.latency_unit == 'microsec':
+            usec = float(value)
         else:  # 'nanosec'
-            usec = (2 ** bucket_exp) / 1000.0
+            usec = value / 1000.0
 
         ms = usec / 1000.0
         if ms < 1.0:
@@ -360,47 +1607,62 @@ class ArrayOfLatencyRecords:
             return s
         else:
             # For 1, 2, 4, 8, ... show as integer without trailing .0
-            # (safe because steps are exact powers of two)
+            # (safe because steps are exact powers of two; zoomed rows in between get decimals)
+            if zoom > 1 and ms != int(ms) and ms < 1000:
+                return f"{ms:.3g}"
             return str(int(round(ms)))
 
-    def _print_header(self) -> None:
-        if g_params.debug_level < 2:
-            # Clear screen & home cursor
-            print("\x1b[0m\x1b[2J\x1b[H", end="")
-        print("LatencyMap.py v1.3 - Luca.Canali@cern.ch")
+    def _emit(self, line: str) -> None:
+        self._frame.append(line + '\n')
 
-    def _print_footer(self) -> None:
-        total_intensity = sum(r.sum_intensity for r in self.data)
-        total_frequency = sum(r.sum_frequency for r in self.data)
-        last = self.data[-1]
+    def _compose_footer(self) -> None:
+        total_intensity = self.total_intensity
+        total_frequency = self.total_frequency
+        last = self.latest
 
         total_avg = (total_intensity / total_frequency) if total_frequency > 0 else 0.0
         latest_avg = (last.sum_intensity / last.sum_frequency) if last.sum_frequency > 0 else 0.0
 
         # Note: display average in the configured latency unit string (kept from v1.2 behavior)
-        print(f"Average latency: {self._fmt_value(total_avg)} {g_params.latency_unit}. "
-              f"Average latency of latest values: {self._fmt_value(latest_avg)} {g_params.latency_unit}")
+        self._emit(f"Average latency: {self.fmt_value(total_avg)} {self.latency_unit}. "
+                   f"Average latency of latest values: {self.fmt_value(latest_avg)} {self.latency_unit}")
 
-        print(f"Sample num: {self.sample_number}. "
-              f"Delta time: {round(last.delta_time/1e6, 1)} sec. "
-              f"Date: {last.date.upper()}")
+        self._emit(f"Sample num: {self.sample_number}. "
+                   f"Delta time: {round(last.delta_time/1e6, 1)} sec. "
+                   f"Date: {last.date.upper()}")
         if last.label:
-            print(f"Label: {last.label}")
-
-    def _print_heat_map(self, chart_type: str) -> None:
+            self._emit(f"Label: {last.label}")
+        if g_params.coalesce:
+            self._emit(f"Merged records: {self.merged_records}. Input lag: {self.input_lag:.2f} sec")
+        if g_params.rollups:
+            self._emit(f"Resolution: {self.resolution}. Key r = next resolution")
+        if self.fine_frequency_matrix is not None:
+            self._emit(f"Zoom: {self.zoom} row(s) per power of 2. Key z = zoom in/out")
+        if g_params.detect:
+            self._emit(f"Latency shift: {self.alert_reason or 'none'}")
+        if g_params.percentiles:
+            latest = ' '.join(f"p{p:g}={self.fmt_value(ring[(self.head - 1) % self.width])}"
+                              for p, ring in zip(g_params.percentiles, self.column_percentiles))
+            window = ' '.join(f"p{p:g}={self.fmt_value(v)}" for p, v in
+                              zip(g_params.percentiles, self._percentiles(self.window_counts, last.data_source)))
+            self._emit(f"Percentiles ({self.latency_unit}) latest: {latest}. Window: {window}")
+
+    def _compose_heat_map(self, chart_type: str) -> None:
         assert chart_type in ('Frequency', 'Intensity')
         if chart_type == 'Frequency':
             params_maxval = g_params.frequency_maxval
             palette = 'blue'
-            chart_maxval = max(r.max_frequency for r in self.data)
+            chart_maxval = self.max_frequency.max
+            matrix = self.frequency_matrix
             title = 'Frequency Heatmap: events per sec'
             unit = '(N#/sec)'
         else:
             params_maxval = g_params.intensity_maxval
             palette = 'red'
-            chart_maxval = max(r.max_intensity for r in self.data)
+            chart_maxval = self.max_intensity.max
+            matrix = self.intensity_matrix
             title = 'Intensity Heatmap: time waited per sec'
-            unit = f"({g_params.latency_unit}/sec)"
+            unit = f"({self.latency_unit}/sec)"
 
         # Header line
         left_axis_title = "Latency bucket"
@@ -410,108 +1672,994 @@ class ArrayOfLatencyRecords:
         line += "Latest values"
         if g_params.print_legend:
             line += "    Legend"
-        print(line)
+        self._emit(line)
 
         line = "(millisec)".ljust(max(16, g_params.num_latency_records - len(unit) + 14))
         line += unit
-        print(line)
+        self._emit(line)
 
         # Determine color scale
         max_val = chart_maxval if params_maxval == -1 else params_maxval
 
         # Main map
         row_idx = -1
-        for bucket in range(g_params.max_latency_bkt, g_params.min_latency_bkt - 1, -1):
+        for bucket in range(self.max_latency_bkt, self.min_latency_bkt - 1, -1):
             row_idx += 1
 
             # Left axis label
-            if bucket == g_params.max_latency_bkt:
-                label = ">" + self._bucket_ms_label(bucket - 1)
-            elif bucket == g_params.min_latency_bkt:
-                label = "<" + self._bucket_ms_label(bucket)
+            if bucket == self.max_latency_bkt:
+                label = ">" + self.bucket_ms_label(bucket - 1)
+            elif bucket == self.min_latency_bkt:
+                label = "<" + self.bucket_ms_label(bucket)
             else:
-                label = self._bucket_ms_label(bucket)
+                label = self.bucket_ms_label(bucket)
             line = label.rjust(6, ' ') + ' '
 
             # Heat row: oldest→newest (left→right). Newest column is the RIGHT-most.
-            data_point = 0.0
-            for record in self.data:
-                if chart_type == 'Frequency':
-                    data_point = record.frequency_histogram[bucket]
-                else:
-                    data_point = record.intensity_histogram[bucket]
-
-                if data_point == 0:
-                    token = 0
-                elif data_point >= max_val:
-                    token = 6
-                else:
-                    token = int(data_point * 6 / max_val) + 1
-
-                if g_params.debug_level >= 2:
-                    line += f"{token}:{data_point}, "
-                else:
-                    line += self._bg_color(token, palette) + ' '  # colored block
+            row = self._row(matrix, bucket)
+            tokens = self._quantize_row(row, max_val)
+            if g_params.debug_level >= 2:
+                line += ''.join(f"{token}:{data_point}, " for token, data_point in zip(tokens, row))
+            else:
+                line += self._compose_cells(tokens, palette)  # colored blocks
 
             # Latest value (right margin)
-            line += self.ESC_RESET + self._fmt_value(data_point).rjust(7, '.')
+            line += self.ESC_RESET + self.fmt_value(row[-1]).rjust(7, '.')
 
             # Legend on the far right
             if g_params.print_legend:
                 if row_idx <= 6:
                     line += '    ' + self._bg_color(row_idx, palette) + ' ' + self.ESC_RESET + ' '
                     display_val = 0 if row_idx == 0 else int(max_val * (row_idx - 1) / 6)
-                    line += ('0' if row_idx == 0 else '>' + self._fmt_value(display_val))
+                    line += ('0' if row_idx == 0 else '>' + self.fmt_value(display_val))
                 elif row_idx == 7:
-                    line += '    ' + 'Max: ' + self._fmt_value(chart_maxval)
-                elif row_idx == (g_params.max_latency_bkt - g_params.min_latency_bkt):
+                    line += '    ' + 'Max: ' + self.fmt_value(chart_maxval)
+                elif row_idx == (self.max_latency_bkt - self.min_latency_bkt):
                     line += '    ' + 'Max(Sum):'
-            print(line)
+            self._emit(line)
+
+        if g_params.detect:
+            # Marks under the columns with a latency shift, oldest→newest
+            head = self.head
+            alerts = self.alerts[head:] + self.alerts[:head]
+            self._emit(' ' * 7 + ''.join('^' if alert else ' ' for alert in alerts))
 
         # Footer line under the heatmap
-        last = self.data[-1]
+        last = self.latest
         line = '      '
         if chart_type == 'Frequency':
             line += 'x=time, y=latency bucket (ms), color=wait frequency (IOPS)'
             line = line.ljust(g_params.num_latency_records + 3)
-            line += 'Sum:' + self._fmt_value(last.sum_frequency).rjust(7, '.')
-            max_sum = max(r.sum_frequency for r in self.data)
-            line += '    ' + self._fmt_value(max_sum)
+            line += 'Sum:' + self.fmt_value(last.sum_frequency).rjust(7, '.')
+            max_sum = self.max_sum_frequency.max
+            line += '    ' + self.fmt_value(max_sum)
         else:
             line += 'x=time, y=latency bucket (ms), color=time waited'
             line = line.ljust(g_params.num_latency_records + 3)
-            line += 'Sum:' + self._fmt_value(last.sum_intensity).rjust(7, '.')
-            max_sum = max(r.sum_intensity for r in self.data)
-            line += '    ' + self._fmt_value(max_sum)
-        print(line + '\n')
+            line += 'Sum:' + self.fmt_value(last.sum_intensity).rjust(7, '.')
+            max_sum = self.max_sum_intensity.max
+            line += '    ' + self.fmt_value(max_sum)
+        self._emit(line + '\n')
 
     # ------------------------------- Public -------------------------------- #
 
-    def render(self) -> None:
-        self._print_header()
+    def view(self, resolution: int) -> ArrayOfLatencyRecords:
+        """The window shown at a resolution: 0 = raw, n = n-th rollup (this one if not there yet)."""
+        if 0 < resolution <= len(self.rollups):
+            return self.rollups[resolution - 1].chart
+        return self
+
+    def compose(self) -> List[str]:
+        """Lines of the heat maps and footer of this chart, for the frame being rendered."""
+        self._frame = []
         if g_params.frequency_map:
-            self._print_heat_map('Frequency')
+            self._compose_heat_map('Frequency')
         if g_params.intensity_map:
-            self._print_heat_map('Intensity')
-        self._print_footer()
+            self._compose_heat_map('Intensity')
+        self._compose_footer()
+        return self._frame
+
+
+class ShiftDetector:
+    """
+    Latency-shift detection for one stream (--detect), O(buckets) per record.
+    The baseline is an exponentially weighted average (span: detect_baseline records) of the
+    share of events in each bucket and of the intensity sum. A record raises an alert when the
+    share of its events in the tail, the buckets from the baseline's 90th percentile up, or its
+    intensity exceeds detect_threshold times the baseline. Records with few events are skipped.
+    """
+    WARMUP = 10        # records in the baseline before alerting
+    MIN_EVENTS = 20    # events in a column to judge its distribution
+    TAIL_SHARE = 0.9   # the tail starts at the bucket of the baseline's 90th percentile
+    MIN_TAIL_GAIN = 0.05  # and must grow by at least 5% of the events
+
+    def __init__(self, chart: ArrayOfLatencyRecords) -> None:
+        self.chart = chart
+        self.alpha: float = 2 / (g_params.detect_baseline + 1)
+        self.threshold: float = g_params.detect_threshold
+        self.shares: List[float] = [0.0] * ArrayOfLatencyRecords.NUM_BUCKETS
+        self.intensity: float = 0.0
+        self.samples: int = 0
+
+    def check(self, record: LatencyRecord) -> str:
+        """Compare a record (after compute_deltas) with the baseline, then fold it in; '' = no shift."""
+        lo, hi = self.chart.min_latency_bkt, self.chart.max_latency_bkt
+        total = record.sum_frequency
+        seconds = record.delta_time / 1e6 if record.delta_time > 0 else 1.0
+        if total * seconds < self.MIN_EVENTS:
+            return ''
+        freq = record.frequency_histogram
+        shares = self.shares
+        reason = ''
+        if self.samples >= self.WARMUP:
+            cumulative, tail = 0.0, hi
+            for bucket in range(lo, hi + 1):
+                cumulative += shares[bucket]
+                if cumulative >= self.TAIL_SHARE:
+                    tail = bucket
+                    break
+            baseline_tail = sum(shares[tail:hi + 1])
+            current_tail = sum(max(freq[bucket], 0.0) for bucket in range(tail, hi + 1)) / total
+            if current_tail > self.threshold * baseline_tail and current_tail - baseline_tail >= self.MIN_TAIL_GAIN:
+                # Lower bound of the tail: Oracle buckets cover (2^(b-1), 2^b], the others [2^b, 2^(b+1))
+                low = tail - 1 if record.data_source == 'oracle' else tail
+                reason = (f"tail >{self.chart.bucket_ms_label(low)} ms has {current_tail:.0%} of events "
+                          f"(baseline {baseline_tail:.0%})")
+            elif record.sum_intensity > self.threshold * self.intensity:
+                reason = (f"intensity {ArrayOfLatencyRecords.fmt_value(record.sum_intensity)} "
+                          f"{self.chart.latency_unit}/sec "
+                          f"(baseline {ArrayOfLatencyRecords.fmt_value(self.intensity)})")
+
+        # Plain mean while warming up, so the baseline does not start from zero
+        alpha = max(self.alpha, 1 / (self.samples + 1))
+        for bucket in range(lo, hi + 1):
+            shares[bucket] += alpha * (max(freq[bucket], 0.0) / total - shares[bucket])
+        self.intensity += alpha * (record.sum_intensity - self.intensity)
+        self.samples += 1
+        return reason
+
+
+_alert_commands: List[subprocess.Popen] = []
+
+
+def fire_alert(stream: str, record: LatencyRecord, reason: str) -> None:
+    """Alert hooks of --detect: --alert_log line and --alert_cmd, which is not waited for."""
+    line = (f"{time.strftime('%Y-%m-%d %H:%M:%S')} LatencyMap latency shift: "
+            f"stream={stream or '-'} date={record.date or '-'} {reason}")
+    if g_params.alert_log == '-':
+        sys.stderr.write(line + '\n')
+    elif g_params.alert_log:
+        with open(g_params.alert_log, 'a') as log:
+            log.write(line + '\n')
+    if g_params.alert_cmd:
+        _alert_commands[:] = [proc for proc in _alert_commands if proc.poll() is None]  # reap
+        env = dict(os.environ, LATENCYMAP_STREAM=stream, LATENCYMAP_REASON=reason,
+                   LATENCYMAP_DATE=record.date)
+        _alert_commands.append(subprocess.Popen(g_params.alert_cmd, shell=True, env=env,
+                                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL))
+
+
+class RollupTier:
+    """
+    A coarser resolution of one stream (--rollups), in a window of the same width as the raw one.
+    Columns of the finer level are summed as event counts and time (rate * duration) until they
+    cover `seconds`, then the sums become one column: rates over the summed time. Tiers cascade
+    (raw -> 10 s -> 1 min -> ...), so memory stays one ring per tier however long the run.
+    Records without timestamps count as 1 sec each, as in compute_deltas.
+    """
+    def __init__(self, source: ArrayOfLatencyRecords, seconds: int) -> None:
+        self.seconds: int = seconds
+        self.source = source
+        self.chart = ArrayOfLatencyRecords(source.stream)
+        self.chart.min_latency_bkt = source.min_latency_bkt
+        self.chart.max_latency_bkt = source.max_latency_bkt
+        self.chart.resolution = f"{seconds} sec"
+        self.frequency_counts: List[float] = [0.0] * ArrayOfLatencyRecords.NUM_BUCKETS
+        self.intensity_counts: List[float] = [0.0] * ArrayOfLatencyRecords.NUM_BUCKETS
+        self.unclamped_counts: List[float] = [0.0] * ArrayOfLatencyRecords.NUM_BUCKETS
+        # Log-linear input: the same per sub-bucket index
+        self.fine_frequency_counts: Dict[int, float] = {}
+        self.fine_intensity_counts: Dict[int, float] = {}
+        self.elapsed: float = 0.0
+
+    def add(self, column: LatencyRecord) -> LatencyRecord | None:
+        """Add a column of the finer level; returns the new column of this tier when one completes."""
+        duration = column.delta_time / 1e6 if column.delta_time > 0 else 1.0
+        lo, hi = self.source.min_latency_bkt, self.source.max_latency_bkt + 1
+        frequency, intensity = self.frequency_counts, self.intensity_counts
+        for bucket in range(lo, hi):
+            frequency[bucket] += column.frequency_histogram[bucket] * duration
+            intensity[bucket] += column.intensity_histogram[bucket] * duration
+        if g_params.percentiles:
+            self.unclamped_counts = [count + value * duration for count, value
+                                     in zip(self.unclamped_counts, column.unclamped_frequency)]
+        if column.fine_frequency or self.fine_frequency_counts:
+            for counts, values in zip((self.fine_frequency_counts, self.fine_intensity_counts),
+                                      column.fine_histograms()):
+                for index, value in values.items():
+                    counts[index] = counts.get(index, 0.0) + value * duration
+        self.elapsed += duration
+        if self.elapsed < self.seconds:
+            return None
+
+        rec = LatencyRecord()
+        elapsed = self.elapsed
+        rec.frequency_histogram[lo:hi] = [count / elapsed for count in frequency[lo:hi]]
+        rec.intensity_histogram[lo:hi] = [count / elapsed for count in intensity[lo:hi]]
+        rec.unclamped_frequency = [count / elapsed for count in self.unclamped_counts]
+        rec.fine_frequency = {index: count / elapsed for index, count in self.fine_frequency_counts.items()}
+        rec.fine_intensity = {index: count / elapsed for index, count in self.fine_intensity_counts.items()}
+        rec.delta_time = int(round(elapsed * 1e6))
+        rec.max_frequency = max(rec.frequency_histogram[lo:hi])
+        rec.sum_frequency = sum(rec.frequency_histogram[lo:hi])
+        rec.max_intensity = max(rec.intensity_histogram[lo:hi])
+        rec.sum_intensity = sum(rec.intensity_histogram[lo:hi])
+        # Metadata of the newest record in the column
+        rec.data['timestamp'] = column.data.get('timestamp', 0)
+        rec.date, rec.label, rec.stream = column.date, column.label, column.stream
+        rec.data_source, rec.latency_unit = column.data_source, column.latency_unit
+        self.chart.latency_unit = column.latency_unit or self.chart.latency_unit
+
+        self.frequency_counts = [0.0] * ArrayOfLatencyRecords.NUM_BUCKETS
+        self.intensity_counts = [0.0] * ArrayOfLatencyRecords.NUM_BUCKETS
+        self.unclamped_counts = [0.0] * ArrayOfLatencyRecords.NUM_BUCKETS
+        self.fine_frequency_counts = {}
+        self.fine_intensity_counts = {}
+        self.elapsed = 0.0
+        self.chart.add_new_record(rec)
+        return rec
+
+
+class LatencyMapDisplay:
+    """
+    Routes records to one ArrayOfLatencyRecords per stream key ('' when the input has no
+    'stream' tag) and renders the terminal frame: the charts of all streams stacked, or of
+    one selected stream (--stream, or keys n/p/a at the terminal, see KeyboardSwitcher).
+    Without --num_records on a terminal, the window is as wide as the terminal allows and is
+    resized and rendered again when the terminal is (SIGWINCH, see watch_resize). The signal
+    handler and the key presses only flag the resize or the switch, the main loop applies them
+    (apply_pending) between records and, while waiting for input, from the reader's idle
+    callback (see BackgroundReader): a switch shows at once, not with the next record.
+    """
+    MARGIN = 31  # axis labels, latest values and legend around the heat map columns
+    MIN_COLUMNS = 10
+
+    def __init__(self) -> None:
+        self.charts: Dict[str, ArrayOfLatencyRecords] = {}
+        self.selected: str | None = g_params.stream  # None = all streams, stacked
+        self.resolution: int = 0  # 0 = raw columns, n = n-th of --rollups
+        self.zoom: int = g_params.zoom  # rows per power of two, with log-linear input
+
+        self.frame_bytes: int = 0
+        self.frame_time: float = 0.0  # seconds spent composing and writing the last frame
+        self.stats: RuntimeStats | None = None  # --stats: adds its line to and counts each frame
+
+        # Differential repaint (raw debug output is not a cell grid: always print it in full)
+        self.painter: TerminalPainter | None = None
+        if g_params.diff_repaint and g_params.debug_level < 2:
+            self.painter = TerminalPainter()
+        self.painted_samples: Dict[str, int] = {}
+
+        # Set by the SIGWINCH handler and the key presses, applied by the main loop (apply_pending)
+        self.resized: bool = False
+        self.redraw: bool = False
+        if g_params.fit_terminal:
+            g_params.num_latency_records = self._fit_columns()
+
+    def _fit_columns(self) -> int:
+        return max(shutil.get_terminal_size().columns - self.MARGIN, self.MIN_COLUMNS)
+
+    def watch_resize(self) -> None:
+        """Follow the terminal size (SIGWINCH) when the width was not fixed with --num_records."""
+        if g_params.fit_terminal and hasattr(signal, 'SIGWINCH'):
+            signal.signal(signal.SIGWINCH, self._on_resize)
+
+    def _on_resize(self, signum, frame) -> None:
+        # It may interrupt a render or an ingest: only flag the resize for the main loop
+        self.resized = True
+
+    def apply_pending(self) -> None:
+        """
+        Main loop: resize and render when the terminal was resized since the last call, render
+        when a key switched the stream, resolution or zoom.
+        """
+        if self.resized:
+            self.refresh()
+        if self.redraw and self.charts:
+            self.render()
+
+    def refresh(self) -> None:
+        """Resize the charts to the terminal (from their retained columns) and render them."""
+        self.resized = False
+        columns = self._fit_columns()
+        if columns == g_params.num_latency_records:
+            return
+        g_params.num_latency_records = columns
+        for chart in self.charts.values():
+            chart.resize(columns + 1)
+        if self.painter is not None:
+            self.painter = TerminalPainter()  # the terminal reflowed the old frame: full paint
+        self.painted_samples.clear()
+        if self.charts:
+            self.render()
+
+    def ingest(self, record: LatencyRecord) -> ArrayOfLatencyRecords:
+        chart = self.charts.get(record.stream)
+        if chart is None:
+            chart = self.charts[record.stream] = ArrayOfLatencyRecords(record.stream)
+        chart.ingest(record)
+        return chart
+
+    def select(self, step: int) -> None:
+        """Show the next (step=1) or previous (step=-1) stream; step=0 shows all streams."""
+        keys = sorted(self.charts)
+        self.redraw = True
+        if step == 0 or not keys:
+            self.selected = None
+            return
+        if self.selected in keys:
+            self.selected = keys[(keys.index(self.selected) + step) % len(keys)]
+        else:
+            self.selected = keys[0] if step > 0 else keys[-1]
+
+    def next_resolution(self) -> None:
+        """Cycle raw -> each of --rollups -> raw."""
+        self.resolution = (self.resolution + 1) % (len(g_params.rollups) + 1)
+        self.redraw = True
+
+    def next_zoom(self) -> None:
+        """Cycle the rows per power of two of log-linear inputs: 1 -> 2 -> 4 -> 8 -> 1."""
+        levels = ArrayOfLatencyRecords.ZOOM_LEVELS
+        self.zoom = levels[(levels.index(self.zoom) + 1) % len(levels)]
+        self.redraw = True
+
+    def shown_charts(self) -> List[ArrayOfLatencyRecords]:
+        if self.selected is not None:
+            chart = self.charts.get(self.selected)
+            return [chart.view(self.resolution).zoomed(self.zoom)] if chart is not None else []
+        return [self.charts[key].view(self.resolution).zoomed(self.zoom) for key in sorted(self.charts)]
+
+    def render(self) -> None:
+        """Compose the whole frame and write it to stdout with a single write."""
+        start = time.perf_counter()
+        self.redraw = False
+        frame: List[str] = []
+        if g_params.debug_level < 2 and self.painter is None:
+            # Clear screen & home cursor
+            frame.append("\x1b[0m\x1b[2J\x1b[H")
+        frame.append("LatencyMap.py v1.3 - Luca.Canali@cern.ch\n")
+
+        charts = self.shown_charts()
+        keys = sorted(self.charts)
+        for chart in charts:
+            if len(keys) > 1:
+                frame.append(f"Stream: {chart.stream or '(none)'} ({keys.index(chart.stream) + 1} of "
+                             f"{len(keys)}). Keys: n/p = next/previous stream, a = all streams\n")
+            frame.extend(chart.compose())
+        if g_params.fit_terminal:
+            # Text lines (labels, footers) longer than the terminal would wrap: cut them
+            width = g_params.num_latency_records + self.MARGIN
+            frame = [line if len(line) <= width or '\x1b' in line else line[:width] + '\n' for line in frame]
+        if g_params.debug_level >= 1:
+            # Stats of the previous frame: the current one is not complete yet
+            frame.append(f"Frame: {self.frame_bytes} bytes, {self.frame_time * 1000:.2f} ms\n")
+        if self.stats is not None and g_params.stats:
+            frame.append(self.stats.summary + '\n')
+
+        output = ''.join(frame)
+        if self.painter is not None:
+            # Heat map cells start after the 6-char axis label and a space
+            shift = 0
+            for chart in charts:
+                key = f"{chart.stream}/{chart.resolution}/{chart.zoom}"
+                shift = max(shift, chart.sample_number - self.painted_samples.get(key, 0))
+                self.painted_samples[key] = chart.sample_number
+            region = (7, 7 + g_params.num_latency_records + 1)
+            output = self.painter.paint(output, shift, region)
+        sys.stdout.write(output)
+        sys.stdout.flush()
+        self.frame_bytes = len(output.encode())
+        self.frame_time = time.perf_counter() - start
+        if self.stats is not None:
+            self.stats.frame(self)  # every frame: from records, resizes and key switches
+
+
+class KeyboardSwitcher:
+    """
+    Reads single key presses from the controlling terminal (stdin carries the data) in a
+    background thread and switches the view of a LatencyMapDisplay, rendered at once by the
+    main loop (see LatencyMapDisplay.apply_pending):
+    n = next stream, p = previous stream, a = all streams stacked, r = next resolution (--rollups),
+    z = zoom in/out (log-linear input).
+    Does nothing when there is no terminal or no termios (e.g. on Windows).
+    """
+    KEYS = {'n': 1, '\t': 1, 'p': -1, 'a': 0}
+
+    def __init__(self, display: LatencyMapDisplay) -> None:
+        self.display = display
+        try:
+            import termios
+            import tty
+            self.fd = os.open('/dev/tty', os.O_RDONLY)
+            self.saved_attrs = termios.tcgetattr(self.fd)
+            tty.setcbreak(self.fd)
+        except (ImportError, OSError):
+            return
+        atexit.register(termios.tcsetattr, self.fd, termios.TCSADRAIN, self.saved_attrs)
+        threading.Thread(target=self._read_keys, name="LatencyMap-keys", daemon=True).start()
+
+    def _read_keys(self) -> None:
+        while True:
+            try:
+                key = os.read(self.fd, 1).decode('ascii', 'ignore').lower()
+            except OSError:
+                return
+            if key == 'r':
+                self.display.next_resolution()
+            elif key == 'z':
+                self.display.next_zoom()
+            elif key in self.KEYS:
+                self.display.select(self.KEYS[key])
+
+
+# ------------------------------ Metrics ------------------------------------ #
+
+class MetricsExporter:
+    """
+    OpenMetrics endpoint (--metrics_port) for the latest cumulative histogram of each stream.
+    The read loop only stores a reference to the newest record of a stream (publish); the
+    exposition is built by the HTTP server thread on scrape from those records, so a scrape
+    neither blocks ingest/rendering nor touches the heat map window. Buckets: a power-of-two
+    value 2^b is the upper bound (le) of its bucket for Oracle and the lower bound for the
+    other sources (le = 2^(b+1)); values are converted from the latency unit to seconds.
+    _sum uses the same per-bucket approximation as the intensity map.
+    """
+    NAME = 'latencymap_latency_seconds'
+    CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+    UNIT_SECONDS = {'millisec': 1e-3, 'microsec': 1e-6, 'nanosec': 1e-9}
+
+    def __init__(self, port: int, address: str = '127.0.0.1') -> None:
+        self.latest: Dict[str, LatencyRecord] = {}
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = exporter.exposition().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', exporter.CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass  # stderr belongs to the terminal frames
+
+        self.server = http.server.ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.port: int = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="LatencyMap-metrics", daemon=True).start()
+
+    def publish(self, rec: LatencyRecord) -> None:
+        """Called from the read loop after ingest (rec.latency_unit is resolved by then)."""
+        self.latest[rec.stream] = rec
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def exposition(self) -> str:
+        name = self.NAME
+        lines = [f"# TYPE {name} histogram",
+                 f"# UNIT {name} seconds",
+                 f"# HELP {name} Latency histograms read by LatencyMap (cumulative counts)."]
+        for stream, rec in sorted(list(self.latest.items())):
+            scale = self.UNIT_SECONDS.get(rec.latency_unit or g_params.latency_unit, 1e-3)
+            oracle = rec.data_source == 'oracle'
+            labels = f'stream="{self._escape(stream)}",source="{self._escape(rec.data_source)}"'
+            cumulative = 0
+            total = 0.0
+            for bucket in sorted(b for b in rec.data if b != 'timestamp'):
+                count = rec.data[bucket]
+                cumulative += count
+                total += (0.75 if oracle else 1.5) * count * (2 ** bucket) * scale
+                le = (2 ** bucket if oracle else 2 ** (bucket + 1)) * scale
+                lines.append(f'{name}_bucket{{{labels},le="{le:.9g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'{name}_count{{{labels}}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {total:.9g}')
+        lines.append("# EOF")
+        return '\n'.join(lines) + '\n'
+
+
+# -------------------------------- Export ----------------------------------- #
+
+def xterm_rgb(code: int) -> str:
+    """#rrggbb of an xterm-256 color code, for the palettes of ArrayOfLatencyRecords."""
+    if code < 16:
+        base = ((0, 0, 0), (128, 0, 0), (0, 128, 0), (128, 128, 0), (0, 0, 128), (128, 0, 128),
+                (0, 128, 128), (192, 192, 192), (128, 128, 128), (255, 0, 0), (0, 255, 0),
+                (255, 255, 0), (0, 0, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255))
+        r, g, b = base[code]
+    elif code < 232:
+        levels = (0, 95, 135, 175, 215, 255)
+        code -= 16
+        r, g, b = levels[code // 36], levels[code // 6 % 6], levels[code % 6]
+    else:
+        r = g = b = 8 + 10 * (code - 232)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+class ExportedStream:
+    """All the columns of one stream, for HeatMapExporter; bucket values flattened column by column."""
+    def __init__(self, chart: ArrayOfLatencyRecords) -> None:
+        self.chart = chart
+        self.frequency = array('d')
+        self.intensity = array('d')
+        self.dates: List[str] = []
+        self.label: str = ''
+
+    def add(self, record: LatencyRecord) -> None:
+        lo, hi = self.chart.min_latency_bkt, self.chart.max_latency_bkt + 1
+        self.frequency.extend(record.frequency_histogram[lo:hi])
+        self.intensity.extend(record.intensity_histogram[lo:hi])
+        self.dates.append(record.date)
+        self.label = record.label or self.label
+
+
+class HeatMapExporter:
+    """
+    Offline export (--export) of the whole capture: a frequency and an intensity map per stream,
+    as one SVG or a standalone HTML page. Colors and quantization are those of the terminal
+    (palettes and _quantize_row of ArrayOfLatencyRecords), scaled to the max of the whole capture
+    unless --frequency_maxval/--intensity_maxval are set. Each run of equal colors in a row is a
+    single <rect>, so file size follows the number of color changes, not of columns.
+    """
+    CELL_HEIGHT = 14
+    MAX_CELL_WIDTH = 8
+    TARGET_WIDTH = 1200  # px: small captures get wider cells, long ones 1 px per column
+    LEFT = 60            # px for the latency axis labels
+    TICK_SPACING = 150   # px between time axis labels
+
+    def __init__(self) -> None:
+        self.streams: Dict[str, ExportedStream] = {}
+
+    def add(self, chart: ArrayOfLatencyRecords, record: LatencyRecord) -> None:
+        stream = self.streams.get(chart.stream)
+        if stream is None:
+            stream = self.streams[chart.stream] = ExportedStream(chart)
+        stream.add(record)
+
+    def _heat_map(self, out: List[str], y: int, stream: ExportedStream, chart_type: str) -> int:
+        """Append the SVG elements of one map at height y; returns the height used."""
+        chart = stream.chart
+        if chart_type == 'Frequency':
+            values, palette, params_maxval = stream.frequency, ArrayOfLatencyRecords.BLUE_PALETTE, \
+                g_params.frequency_maxval
+            title = 'Frequency Heatmap: events per sec'
+        else:
+            values, palette, params_maxval = stream.intensity, ArrayOfLatencyRecords.RED_PALETTE, \
+                g_params.intensity_maxval
+            title = f"Intensity Heatmap: time waited per sec ({chart.latency_unit}/sec)"
+        colors = [xterm_rgb(code) for _, code in sorted(palette.items())]
+        num_buckets = chart.max_latency_bkt - chart.min_latency_bkt + 1
+        num_columns = len(stream.dates)
+        cell_w = max(1, min(self.MAX_CELL_WIDTH, self.TARGET_WIDTH // max(num_columns, 1)))
+        max_val = max(values, default=0.0) if params_maxval == -1 else params_maxval
+        cell_h, left = self.CELL_HEIGHT, self.LEFT
+
+        text = html.escape(title + (f" - {stream.label}" if stream.label else ''))
+        out.append(f'<text x="{left}" y="{y + 16}" class="title">{text}</text>')
+        top = y + 24
+        out.append(f'<rect x="{left}" y="{top}" width="{num_columns * cell_w}" '
+                   f'height="{num_buckets * cell_h}" fill="{colors[0]}" stroke="#ccc"/>')
+
+        for row_idx, bucket in enumerate(range(chart.max_latency_bkt, chart.min_latency_bkt - 1, -1)):
+            row_y = top + row_idx * cell_h
+            if bucket == chart.max_latency_bkt:
+                label = ">" + chart.bucket_ms_label(bucket - 1)
+            elif bucket == chart.min_latency_bkt:
+                label = "<" + chart.bucket_ms_label(bucket)
+            else:
+                label = chart.bucket_ms_label(bucket)
+            out.append(f'<text x="{left - 4}" y="{row_y + cell_h - 3}" class="axis" '
+                       f'text-anchor="end">{html.escape(label)}</text>')
+
+            row = values[bucket - chart.min_latency_bkt::num_buckets]
+            col = 0
+            for token, run in groupby(ArrayOfLatencyRecords._quantize_row(row, max_val)):
+                length = sum(1 for _ in run)
+                if token:  # token 0 is the background
+                    out.append(f'<rect x="{left + col * cell_w}" y="{row_y}" width="{length * cell_w}" '
+                               f'height="{cell_h}" fill="{colors[token]}"/>')
+                col += length
+
+        # Time axis
+        axis_y = top + num_buckets * cell_h + 14
+        step = max(1, self.TICK_SPACING // cell_w)
+        for col in range(0, num_columns, step):
+            date = html.escape(stream.dates[col] or f"#{col + 1}")
+            out.append(f'<text x="{left + col * cell_w}" y="{axis_y}" class="axis">{date}</text>')
+
+        # Legend, as in the terminal: token k is above max_val * (k - 1) / 6
+        legend_x = left + num_columns * cell_w + 16
+        for token, color in enumerate(colors):
+            legend_y = top + token * cell_h
+            value = '0' if token == 0 else '>' + ArrayOfLatencyRecords.fmt_value(int(max_val * (token - 1) / 6))
+            out.append(f'<rect x="{legend_x}" y="{legend_y}" width="{cell_h}" height="{cell_h - 2}" '
+                       f'fill="{color}" stroke="#ccc"/>')
+            out.append(f'<text x="{legend_x + cell_h + 4}" y="{legend_y + cell_h - 3}" class="axis">{html.escape(value)}</text>')
+        return 24 + num_buckets * cell_h + 30
+
+    def svg(self) -> str:
+        out: List[str] = []
+        y = 0
+        width = 0
+        for key in sorted(self.streams):
+            stream = self.streams[key]
+            if len(self.streams) > 1:
+                out.append(f'<text x="4" y="{y + 18}" class="stream">Stream: {html.escape(key or "(none)")}</text>')
+                y += 24
+            for chart_type in ('Frequency', 'Intensity'):
+                y += self._heat_map(out, y, stream, chart_type)
+            cell_w = max(1, min(self.MAX_CELL_WIDTH, self.TARGET_WIDTH // max(len(stream.dates), 1)))
+            width = max(width, self.LEFT + len(stream.dates) * cell_w + 120)
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{y}" '
+                f'shape-rendering="crispEdges">\n'
+                '<style>text { font-family: monospace; font-size: 11px; } '
+                '.title, .stream { font-size: 13px; font-weight: bold; }</style>\n'
+                + '\n'.join(out) + '\n</svg>\n')
+
+    def write(self, path: str) -> None:
+        svg = self.svg()
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.lower().endswith('.svg'):
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n' + svg)
+            else:
+                f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+                        '<title>LatencyMap heat maps</title></head>\n'
+                        '<body><div style="overflow-x: auto">\n' + svg + '</div></body></html>\n')
+
+
+def export_heat_maps(records: Iterator[LatencyRecord], path: str) -> int:
+    """--export: ingest all the records, then write the heat maps; no terminal rendering."""
+    display = LatencyMapDisplay()
+    exporter = HeatMapExporter()
+    num_records = 0
+    try:
+        for rec in records:
+            exporter.add(display.ingest(rec), rec)
+            num_records += 1
+    except Exception as err:
+        sys.stderr.write(f"ERROR: {err}\n")
+        return 1
+    exporter.write(path)
+    print(f"Exported {num_records} records ({len(exporter.streams)} streams) to {path}.")
+    return 0
 
 
 # --------------------------------- Main ------------------------------------ #
 
+class ReplaySchedule:
+    """
+    Selects which records are rendered in --replay mode: every Nth record and the first
+    record at or after each requested timestamp. The last record is rendered by main().
+    """
+    def __init__(self, every: int, timestamps: List[int]) -> None:
+        self.every: int = every
+        self.pending: Deque[int] = deque(timestamps)
+        self.num_records: int = 0
+        self.start_time: float = time.perf_counter()
+
+    def due(self, rec: LatencyRecord) -> bool:
+        self.num_records += 1
+        render = self.every > 0 and self.num_records % self.every == 0
+        ts = rec.data.get('timestamp')
+        while ts is not None and self.pending and self.pending[0] <= ts:
+            self.pending.popleft()
+            render = True
+        return render
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.num_records / elapsed if elapsed > 0 else 0.0
+        print(f"Replayed {self.num_records} records in {elapsed:.3f} sec ({rate:.0f} records/sec).")
+
+
+def pending_input_bytes() -> int | None:
+    """Bytes the data source wrote to the stdin pipe that are not read yet (FIONREAD); None if unknown."""
+    try:
+        import fcntl
+        import stat
+        import termios
+        fd = sys.stdin.fileno()
+        if not stat.S_ISFIFO(os.fstat(fd).st_mode):
+            return None  # a file: not a backlog, or a terminal
+        buf = fcntl.ioctl(fd, termios.FIONREAD, b'\0\0\0\0')
+    except (ImportError, OSError, ValueError, io.UnsupportedOperation):
+        return None
+    return struct.unpack('i', buf)[0]
+
+
+class RuntimeStats:
+    """
+    Self-instrumentation (--stats, --stats_file): where LatencyMap spends its time between two
+    frames. Records the time spent waiting for and parsing input (read), computing deltas and
+    scrolling (ingest) and composing and writing the frame (render), the frame rate and size,
+    the lag of the newest record behind the wall clock, and the input not processed yet:
+    records queued by --coalesce and bytes waiting in the stdin pipe.
+    The lag is measured against the wall clock for epoch timestamps. Other source clocks
+    (see is_epoch_timestamp) are aligned to the wall clock at the first record of each stream,
+    so their lag is how much further behind than at that record it is.
+    main() only creates it when one of the options is given: otherwise no timing is taken.
+    """
+    FPS_FRAMES = 20  # frame rate over the last frames
+
+    def __init__(self, path: str | None) -> None:
+        self.out = None
+        if path == '-':
+            self.out = sys.stderr
+        elif path:
+            self.out = open(path, 'a', buffering=1)
+            atexit.register(self.out.close)
+        self.frame_times: Deque[float] = deque(maxlen=self.FPS_FRAMES)
+        self.frames: int = 0
+        self.summary: str = 'Stats: (from the next frame)'
+        self.latest: LatencyRecord = LatencyRecord()
+        self.queued: int = 0
+        self.clock_offsets: Dict[str, float] = {}  # stream -> wall clock - source clock (sec)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.records: int = 0  # since the last frame
+        self.merged: int = 0
+        self.read_time: float = 0.0
+        self.ingest_time: float = 0.0
+
+    def add(self, rec: LatencyRecord, read_time: float, ingest_time: float,
+            records: Iterator[LatencyRecord]) -> None:
+        self.records += 1
+        self.read_time += read_time
+        self.ingest_time += ingest_time
+        self.latest = rec
+        ts = rec.data.get('timestamp')
+        if ts and rec.stream not in self.clock_offsets:
+            self.clock_offsets[rec.stream] = 0.0 if is_epoch_timestamp(ts) else time.time() - ts / 1e6
+        if isinstance(records, CoalescingReader):
+            self.merged += records.merged
+        self.queued = records.queue.qsize() if isinstance(records, CoalescingReader) else 0
+
+    def frame(self, display: LatencyMapDisplay) -> None:
+        """Close the interval of the frame just rendered: new summary line and JSON object."""
+        now = time.perf_counter()
+        self.frame_times.append(now)
+        self.frames += 1
+        times = self.frame_times
+        fps = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+        ts = self.latest.data.get('timestamp')
+        lag = time.time() - ts / 1e6 - self.clock_offsets[self.latest.stream] if ts else 0.0
+        lag_base = 'epoch' if is_epoch_timestamp(ts) else 'first record'
+        pending = None if g_params.session else pending_input_bytes()
+
+        self.summary = (f"Stats: {self.records} record(s) read {self.read_time * 1000:.2f} ms, "
+                        f"deltas {self.ingest_time * 1000:.2f} ms, render {display.frame_time * 1000:.2f} ms, "
+                        f"{display.frame_bytes} bytes. {fps:.1f} frames/sec. Lag: {lag:.2f} sec"
+                        + ('' if lag_base == 'epoch' else ' since the first record')
+                        + f". Merged: {self.merged}, queued: {self.queued} record(s)"
+                        + ('' if pending is None else f", {pending} bytes in stdin"))
+        if self.out is not None:
+            self.out.write(json.dumps({
+                'frame': self.frames, 'time': round(time.time(), 6), 'records': self.records,
+                'read_ms': round(self.read_time * 1000, 3), 'deltas_ms': round(self.ingest_time * 1000, 3),
+                'render_ms': round(display.frame_time * 1000, 3), 'frame_bytes': display.frame_bytes,
+                'fps': round(fps, 2), 'lag_sec': round(lag, 3), 'lag_base': lag_base, 'merged': self.merged,
+                'queued_records': self.queued, 'stdin_bytes': pending,
+            }) + '\n')
+        self._reset()
+
+
+def read_line_records() -> Iterator[LatencyRecord]:
+    """Records from stdin with the line-by-line text parser (--parser=line)."""
+    while True:
+        rec = LatencyRecord()
+        try:
+            rec.go_to_begin_record_tag()
+            rec.read_record()
+        except EOFError:
+            return
+        yield rec
+
+
+def read_records() -> Iterator[LatencyRecord]:
+    if g_params.session:
+        return iter(SessionReader(g_params.session, g_params.session_start, g_params.session_end,
+                                  g_params.follow, g_params.session_by_date))
+    if g_params.parser == 'line':
+        records = read_line_records()
+    else:
+        records = iter(RecordStreamParser(sys.stdin.buffer))
+    if g_params.record:
+        session = SessionWriter(g_params.record)
+        atexit.register(session.close)  # the last, partial block
+        records = recorded(records, session)
+    return records
+
+
+def wait_for_item(items: queue.Queue, idle: Optional[Callable[[], None]], seconds: float):
+    """Next item of a queue, calling idle() every `seconds` while there is none."""
+    if idle is None:
+        return items.get()
+    while True:
+        try:
+            return items.get(timeout=seconds)
+        except queue.Empty:
+            idle()
+
+
+class BackgroundReader:
+    """
+    Reads a record iterator in a background thread, so that the main thread waits for the next
+    record in a queue and calls `idle` every IDLE_SECONDS meanwhile (terminal resizes while the
+    source is quiet). The queue holds one record: reading stays paced by the main loop.
+    """
+    _EOF = object()
+    IDLE_SECONDS = 0.1
+
+    def __init__(self, records: Iterator[LatencyRecord], idle: Callable[[], None]) -> None:
+        self.records = records
+        self.idle = idle
+        self.queue: queue.Queue = queue.Queue(maxsize=1)
+        threading.Thread(target=self._drain, name="LatencyMap-reader", daemon=True).start()
+
+    def _drain(self) -> None:
+        try:
+            for rec in self.records:
+                self.queue.put(rec)
+            self.queue.put(self._EOF)
+        except Exception as err:  # re-raised in the consumer thread
+            self.queue.put(err)
+
+    def __iter__(self) -> BackgroundReader:
+        return self
+
+    def __next__(self) -> LatencyRecord:
+        item = wait_for_item(self.queue, self.idle, self.IDLE_SECONDS)
+        if item is self._EOF:
+            self.queue.put(item)  # for any later call
+            raise StopIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+class CoalescingReader:
+    """
+    Drains a record iterator in a background thread (--coalesce).
+    Each batch of queued records is reduced to the newest record of each stream: counts are
+    cumulative, so computing deltas from the last record shown merges all the intermediate
+    ones into one column without losing data. The first record of a stream (the baseline
+    for its deltas) is never merged. `merged` and `lag` describe the record last returned:
+    number of records merged into it and how long (sec) the oldest of them waited in the queue.
+    While the queue is empty, `idle` (if any) is called every IDLE_SECONDS.
+    """
+    _EOF = object()
+    IDLE_SECONDS = 0.1
+
+    def __init__(self, records: Iterator[LatencyRecord], idle: Optional[Callable[[], None]] = None) -> None:
+        self.records = records
+        self.idle = idle
+        self.queue: queue.Queue = queue.Queue()
+        self.merged: int = 0
+        self.lag: float = 0.0
+        self._pending: Deque[Tuple[LatencyRecord, int, float]] = deque()
+        self._seen_streams: set = set()
+        self._done = False
+        threading.Thread(target=self._drain, name="LatencyMap-reader", daemon=True).start()
+
+    def _drain(self) -> None:
+        try:
+            for rec in self.records:
+                self.queue.put((time.monotonic(), rec))
+            self.queue.put((time.monotonic(), self._EOF))
+        except Exception as err:  # re-raised in the consumer thread
+            self.queue.put((time.monotonic(), err))
+
+    def __iter__(self) -> CoalescingReader:
+        return self
+
+    def _next_batch(self) -> None:
+        batch = [wait_for_item(self.queue, self.idle, self.IDLE_SECONDS)]
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        arrival, tail = batch[-1]
+        if tail is self._EOF or isinstance(tail, Exception):
+            batch.pop()
+            if isinstance(tail, Exception) and batch:
+                # Show what was read before the error, report it on the next batch
+                self.queue.put((arrival, tail))
+            elif isinstance(tail, Exception):
+                raise tail
+            else:
+                self._done = True
+
+        now = time.monotonic()
+        entries: List[list] = []  # [record, merged, arrival], in order of first appearance
+        newest: Dict[str, list] = {}
+        for arrival, rec in batch:
+            if rec.stream not in self._seen_streams:
+                self._seen_streams.add(rec.stream)
+                entries.append([rec, 0, arrival])
+                continue
+            entry = newest.get(rec.stream)
+            if entry is None:
+                newest[rec.stream] = entry = [rec, 0, arrival]
+                entries.append(entry)
+            else:
+                entry[0] = rec
+                entry[1] += 1
+        self._pending.extend((rec, merged, now - arrival) for rec, merged, arrival in entries)
+
+    @property
+    def batch_pending(self) -> bool:
+        """True while records of the current batch (other streams) are still to be returned."""
+        return bool(self._pending)
+
+    def __next__(self) -> LatencyRecord:
+        while not self._pending:
+            if self._done:
+                raise StopIteration
+            self._next_batch()
+        rec, self.merged, self.lag = self._pending.popleft()
+        return rec
+
+
 def main(argv: list[str] | None = None) -> int:
     # Parse CLI first so -h/--help works via console script entry point
     g_params.parse_cli(argv)
     # Show banner after successful parse (won't print on -h because argparse exits first)
     g_params.usage_banner()
-    chart = ArrayOfLatencyRecords()
-    first = True
-    previous = LatencyRecord()  # dummy previous for first delta computation
+    if g_params.export:
+        return export_heat_maps(read_records(), g_params.export)
+    display = LatencyMapDisplay()
+    metrics = None
+    if g_params.metrics_port is not None:
+        metrics = MetricsExporter(g_params.metrics_port, g_params.metrics_addr)
+        print(f"Serving OpenMetrics on http://{g_params.metrics_addr}:{metrics.port}/metrics")
+    replay = ReplaySchedule(g_params.render_every, g_params.render_at) if g_params.replay else None
+    stats = None
+    if g_params.stats or g_params.stats_file:
+        stats = display.stats = RuntimeStats(g_params.stats_file)
+    rendered = True
+    records = read_records()
+    # Resizes and key switches while waiting for input are applied by the reader's idle callback
+    # (keys are read only on a terminal and not in --replay; fit_terminal implies a terminal)
+    idle = display.apply_pending if replay is None and sys.stdout.isatty() else None
+    if g_params.coalesce and replay is None:
+        records = CoalescingReader(records, idle)
+    elif idle is not None:
+        records = BackgroundReader(records, idle)
+    switcher: KeyboardSwitcher | None = None
+
+    display.watch_resize()
 
     while True:
-        rec = LatencyRecord()
-        rec.go_to_begin_record_tag()
+        read_start = time.perf_counter() if stats is not None else 0.0
+        display.apply_pending()
         try:
-            rec.read_record()
+            rec = next(records)
+        except StopIteration:
+            if not rendered and display.charts:
+                display.render()
+            print("\nReached EOF from data source, exiting.")
+            if replay is not None:
+                replay.report()
+            return 0
         except Exception as err:
             sys.stderr.write(f"ERROR: {err}\n")
             return 1
@@ -520,17 +2668,33 @@ def main(argv: list[str] | None = None) -> int:
             print("\nLatest data record:")
             print(rec.data)
 
-        if first:
-            LatencyRecord._autotune_latency_buckets()
-            first = False
+        if stats is not None:
+            ingest_start = time.perf_counter()
+            chart = display.ingest(rec)
+            stats.add(rec, ingest_start - read_start, time.perf_counter() - ingest_start, records)
         else:
-            rec.compute_deltas(previous)
-
-        chart.add_new_record(rec)
-        previous = rec
-
-        chart.render()
-        time.sleep(g_params.screen_delay)
+            chart = display.ingest(rec)
+        if metrics is not None:
+            metrics.publish(rec)
+        if (switcher is None and replay is None and sys.stdout.isatty()
+                and (len(display.charts) > 1 or g_params.rollups or chart.fine_frequency_matrix is not None)):
+            # Keys to switch streams (only once the input turns out to be multiplexed), resolution or zoom
+            switcher = KeyboardSwitcher(display)
+        if isinstance(records, CoalescingReader):
+            chart.merged_records = records.merged
+            chart.input_lag = records.lag
+            if records.batch_pending:
+                continue  # one frame per batch, after all its streams are ingested
+
+        if replay is None:
+            display.render()
+        else:
+            rendered = replay.due(rec)
+            if rendered:
+                display.render()
+        display.apply_pending()  # resized or switched while ingesting or rendering
+        if replay is None:
+            time.sleep(g_params.screen_delay)
 
         if g_params.debug_level >= 3:
             chart.print_frequency_histograms_debug()
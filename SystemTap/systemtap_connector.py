@@ -10,9 +10,11 @@ Purpose
 
 Usage
   stap -v SystemTap/blockio_rq_latency.stp \
-  | python3 SystemTap/systemtap_connector.py \
+  | python3 SystemTap/systemtap_connector.py [--binary] \
   | python3 LatencyMap.py
 
+  --binary emits records in the PyLatencyMap binary format instead of text.
+
 Notes
   - This connector assumes the SystemTap script already prints records delimited by:
       <begin record> ... <end record>
@@ -27,6 +29,8 @@ Notes
 """
 
 from __future__ import annotations
+import argparse
+import os
 import re
 import sys
 
@@ -59,7 +63,20 @@ def normalize_hist_line(line: str) -> str | None:
     return s
 
 
-def main() -> int:
+def binary_writer():
+    """BinaryRecordWriter on stdout, from the installed LatencyMap or the repo checkout."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    from LatencyMap import BinaryRecordWriter
+    return BinaryRecordWriter(sys.stdout.buffer)
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Connector: SystemTap @hist_log output → PyLatencyMap records")
+    p.add_argument("--binary", action="store_true",
+                   help="Emit records in the PyLatencyMap binary format (default: text)")
+    args = p.parse_args(argv)
+    emit = binary_writer().write_text_line if args.binary else print
+
     try:
         for raw in sys.stdin:
             line = raw.rstrip("\n")
@@ -69,21 +86,21 @@ def main() -> int:
 
             # Pass-through record structure and known metadata lines as-is
             if line.startswith("<begin record>"):
-                print("<begin record>")
+                emit("<begin record>")
                 continue
             if line.startswith("<end record>"):
-                print("<end record>")
+                emit("<end record>")
                 sys.stdout.flush()
                 continue
             if line.startswith(("timestamp", "datasource", "label", "latencyunit")):
-                print(line)
+                emit(line)
                 continue
 
             # Try to normalize a histogram line
             norm = normalize_hist_line(line)
             if norm is None:
                 continue
-            print(norm)
+            emit(norm)
 
     except BrokenPipeError:
         # Downstream closed the pipe (e.g., viewer exited) — exit quietly
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+bench_parser.py — Compare the LatencyMap input parsers on the SampleData files
+Author: Luca.Canali@cern.ch
+
+Times the legacy line-by-line reader (--parser=line) against the chunked bytes-level
+RecordStreamParser (--parser=stream, default). Raw DTrace/SystemTap captures are first
+normalized with their connector, as in the Example*.sh scripts.
+
+Usage
+  python3 benchmarks/bench_parser.py [--repeat N]
+"""
+
+from __future__ import annotations
+import argparse
+import glob
+import io
+import os
+import subprocess
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+import LatencyMap  # noqa: E402
+
+CONNECTORS = {
+    'test_DTrace_data.txt': 'DTrace/dtrace_connector.py',
+    'test_SystemTap_data.txt': 'SystemTap/systemtap_connector.py',
+}
+
+
+def load_sample(path: str) -> bytes:
+    connector = CONNECTORS.get(os.path.basename(path))
+    if connector is None:
+        with open(path, 'rb') as f:
+            return f.read()
+    with open(path, 'rb') as f:
+        return subprocess.run([sys.executable, os.path.join(REPO, connector)],
+                              stdin=f, capture_output=True, check=True).stdout
+
+
+def time_line_parser(data: bytes) -> tuple[int, float]:
+    saved = sys.stdin
+    sys.stdin = io.TextIOWrapper(io.BytesIO(data))
+    try:
+        start = time.perf_counter()
+        n = sum(1 for _ in LatencyMap.read_line_records())
+        return n, time.perf_counter() - start
+    finally:
+        sys.stdin = saved
+
+
+def time_stream_parser(data: bytes) -> tuple[int, float]:
+    start = time.perf_counter()
+    n = sum(1 for _ in LatencyMap.RecordStreamParser(io.BytesIO(data)))
+    return n, time.perf_counter() - start
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark LatencyMap input parsers on SampleData")
+    p.add_argument("--repeat", type=int, default=200,
+                   help="Concatenate each sample this many times (default: 200)")
+    args = p.parse_args(argv)
+
+    print(f"{'file':32} {'records':>8} {'line rec/s':>12} {'stream rec/s':>13} {'speedup':>8}")
+    for path in sorted(glob.glob(os.path.join(REPO, 'SampleData', '*.txt'))):
+        data = load_sample(path) * args.repeat
+        n_line, t_line = time_line_parser(data)
+        n_stream, t_stream = time_stream_parser(data)
+        if n_line != n_stream:
+            print(f"ERROR: {os.path.basename(path)}: parsers disagree ({n_line} vs {n_stream} records)")
+            return 1
+        print(f"{os.path.basename(path):32} {n_stream:8} {n_line / t_line:12.0f} "
+              f"{n_stream / t_stream:13.0f} {t_line / t_stream:7.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+bench_suite.py — LatencyMap performance benchmarks with synthetic records and JSON results
+Author: Luca.Canali@cern.ch
+
+Times the three stages of LatencyMap separately, for the text and the binary input format
+and for the datasource/unit of each connector:
+  - parse:  RecordStreamParser on the encoded records            (records/sec)
+  - deltas: LatencyRecord.compute_deltas on consecutive records  (records/sec)
+  - render: LatencyMapDisplay.render of a full window            (frames/sec, bytes/frame),
+            full repaint and --diff_repaint
+It also runs the connectors on the SampleData captures (records/sec, subprocess included).
+
+Records come from a seeded synthetic generator: number of buckets, record rate (spacing of
+the timestamps), window width, datasource and unit are configurable. Results are written as
+JSON; --baseline compares them with a stored run and fails on throughput regressions.
+
+Usage
+  python3 benchmarks/bench_suite.py --json /tmp/bench.json
+  python3 benchmarks/bench_suite.py --baseline /tmp/bench.json --tolerance 15
+  python3 benchmarks/bench_suite.py --profile dtrace --buckets 24 --window 200 --records 5000
+"""
+
+from __future__ import annotations
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Tuple
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+import LatencyMap  # noqa: E402
+
+# Datasource and latency unit of the records emitted by each connector
+PROFILES = {
+    'bpf': ('bpf', 'microsec'),
+    'systemtap': ('systemtap', 'microsec'),
+    'dtrace': ('dtrace', 'nanosec'),
+    'oracle': ('oracle', 'microsec'),
+}
+
+# Connector scripts and the SampleData capture each one reads on stdin
+CONNECTORS = {
+    'systemtap': ('SystemTap/systemtap_connector.py', 'test_SystemTap_data.txt'),
+    'dtrace': ('DTrace/dtrace_connector.py', 'test_DTrace_data.txt'),
+    '10046': ('10046_trace_oracle/10046_connector.py', 'test_10046_tracefile.trc'),
+}
+
+# Lowest bucket exponent of the synthetic histograms, per unit (as LatencyMap autotunes)
+MIN_EXPONENT = {'millisec': 0, 'microsec': 7, 'nanosec': 17}
+
+Histogram = Tuple[int, Dict[int, int]]  # (timestamp microsec, {exponent: cumulative count})
+
+
+# ------------------------------ Generator --------------------------------- #
+
+def synthetic_records(count: int, buckets: int, rate: float, unit: str, seed: int = 42) -> Iterator[Histogram]:
+    """
+    `count` cumulative histograms `1/rate` seconds apart, over `buckets` consecutive exponents
+    from the unit's default lower bucket: a bell-shaped latency distribution whose center and
+    event rate drift slowly, so that the heat maps are not constant.
+    """
+    rnd = random.Random(seed)
+    low = MIN_EXPONENT[unit]
+    step = int(1_000_000 / rate)
+    ts = 1_700_000_000_000_000
+    totals = {low + b: 0 for b in range(buckets)}
+    center = buckets / 3
+    for _ in range(count):
+        ts += step
+        center = min(max(center + rnd.uniform(-0.3, 0.3), 0.0), buckets - 1.0)
+        events = rnd.randint(500, 5000) * step / 1_000_000
+        for b in range(buckets):
+            weight = 2.0 ** -((b - center) ** 2)
+            totals[low + b] += int(events * weight * rnd.uniform(0.8, 1.2))
+        yield ts, dict(totals)
+
+
+def encode_text(histograms: List[Histogram], unit: str, datasource: str) -> bytes:
+    out: List[str] = []
+    for ts, buckets in histograms:
+        date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts / 1_000_000))
+        out.append(f"<begin record>\ntimestamp,microsec,{ts},{date}\nlabel,synthetic benchmark data\n"
+                   f"latencyunit,{unit}\ndatasource,{datasource}\n")
+        out.extend(f"{1 << exp},{count}\n" for exp, count in sorted(buckets.items()))
+        out.append("<end record>\n")
+    return ''.join(out).encode()
+
+
+def encode_binary(histograms: List[Histogram], unit: str, datasource: str) -> bytes:
+    out = io.BytesIO()
+    writer = LatencyMap.BinaryRecordWriter(out)
+    for ts, buckets in histograms:
+        writer.write_record(ts, buckets, 'synthetic benchmark data', unit, datasource)
+    return out.getvalue()
+
+
+# ------------------------------- Stages ----------------------------------- #
+
+class _Sink:
+    """Stands in for the terminal: render() output is discarded (its size is in frame_bytes)."""
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+def parse(data: bytes) -> List[LatencyMap.LatencyRecord]:
+    return list(LatencyMap.RecordStreamParser(io.BytesIO(data)))
+
+
+def best_of(rounds: int, setup: Callable[[], object], run: Callable[[object], object]) -> Tuple[float, object]:
+    """Fastest of `rounds` timed runs, each on a fresh untimed setup(); and the last result."""
+    best, result = float('inf'), None
+    for _ in range(rounds):
+        arg = setup()
+        start = time.perf_counter()
+        result = run(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_parse(data: bytes, rounds: int) -> Dict[str, float]:
+    elapsed, records = best_of(rounds, lambda: data, parse)
+    return {'records': len(records), 'seconds': elapsed, 'records_per_sec': len(records) / elapsed,
+            'input_bytes': len(data)}
+
+
+def bench_deltas(data: bytes, rounds: int) -> Dict[str, float]:
+    """compute_deltas only: records are parsed and the bucket range autotuned before timing."""
+    def setup() -> Tuple[List[LatencyMap.LatencyRecord], int, int]:
+        records = parse(data)
+        chart = LatencyMap.ArrayOfLatencyRecords()
+        chart.latency_unit = records[0].latency_unit
+        chart._autotune_latency_buckets()
+        return records, chart.min_latency_bkt, chart.max_latency_bkt
+
+    def run(arg) -> int:
+        records, min_bkt, max_bkt = arg
+        for previous, record in zip(records, records[1:]):
+            record.compute_deltas(previous, min_bkt, max_bkt)
+        return len(records) - 1
+
+    elapsed, n = best_of(rounds, setup, run)
+    return {'records': n, 'seconds': elapsed, 'records_per_sec': n / elapsed}
+
+
+def bench_render(data: bytes, rounds: int, frames: int, diff_repaint: bool) -> Dict[str, float]:
+    """
+    render() of `frames` consecutive frames of a full window: the window is filled, untimed,
+    then each frame scrolls in one more record (ingest untimed) and is rendered (timed).
+    """
+    LatencyMap.g_params.diff_repaint = diff_repaint
+    records = parse(data)
+    width = LatencyMap.g_params.num_latency_records + 1
+    if len(records) < width + frames:
+        raise ValueError(f"render needs {width + frames} records, got {len(records)}: raise --records")
+
+    best, frame_bytes = float('inf'), 0.0
+    saved = sys.stdout
+    try:
+        for _ in range(rounds):
+            fresh = parse(data)
+            display = LatencyMap.LatencyMapDisplay()
+            sys.stdout = _Sink()
+            for rec in fresh[:width]:
+                display.ingest(rec)
+            display.render()  # first frame: a full paint also with --diff_repaint
+            elapsed, total_bytes = 0.0, 0
+            for rec in fresh[width:width + frames]:
+                display.ingest(rec)
+                start = time.perf_counter()
+                display.render()
+                elapsed += time.perf_counter() - start
+                total_bytes += display.frame_bytes
+            best = min(best, elapsed)
+            frame_bytes = total_bytes / frames
+    finally:
+        sys.stdout = saved
+        LatencyMap.g_params.diff_repaint = False
+    return {'frames': frames, 'seconds': best, 'frames_per_sec': frames / best,
+            'ms_per_frame': best * 1000 / frames, 'bytes_per_frame': frame_bytes}
+
+
+TRACE_TIM = re.compile(rb'tim=(\d+)')
+
+
+def repeat_capture(data: bytes, repeat: int) -> bytes:
+    """
+    `repeat` copies of a capture. The tim= values of a 10046 trace are shifted by the span of
+    the trace at each copy, as the connector rejects timestamps going back in time.
+    """
+    tims = [int(t) for t in TRACE_TIM.findall(data)]
+    if not tims:
+        return data * repeat
+    span = max(tims) - min(tims) + 1_000_000
+    return b''.join(TRACE_TIM.sub(lambda m: b'tim=%d' % (int(m.group(1)) + copy * span), data)
+                    for copy in range(repeat))
+
+
+def bench_connector(script: str, sample: str, repeat: int, rounds: int, binary: bool) -> Dict[str, float]:
+    """Connector subprocess on `repeat` copies of the sample capture, startup included."""
+    with open(os.path.join(REPO, 'SampleData', sample), 'rb') as f:
+        data = repeat_capture(f.read(), repeat)
+    cmd = [sys.executable, os.path.join(REPO, script)] + (['--binary'] if binary else [])
+
+    def run(_) -> bytes:
+        return subprocess.run(cmd, input=data, capture_output=True, check=True).stdout
+
+    elapsed, output = best_of(rounds, lambda: None, run)
+    n = len(parse(output))
+    return {'records': n, 'seconds': elapsed, 'records_per_sec': n / elapsed,
+            'input_bytes': len(data), 'output_bytes': len(output)}
+
+
+# ------------------------------ Reporting ---------------------------------- #
+
+# Metric compared with the baseline per stage (higher is better)
+THROUGHPUT = {'parse': 'records_per_sec', 'deltas': 'records_per_sec', 'render': 'frames_per_sec',
+              'connector': 'records_per_sec'}
+
+
+def print_results(results: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'benchmark':36} {'throughput':>14} {'unit':12} {'bytes/frame':>12}")
+    for name, metrics in results.items():
+        key = THROUGHPUT[name.split('/')[0]]
+        frame = f"{metrics['bytes_per_frame']:12.0f}" if 'bytes_per_frame' in metrics else ''
+        print(f"{name:36} {metrics[key]:14.0f} {key.replace('_per_sec', '/s'):12} {frame}")
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> int:
+    """Print the change of each throughput against the baseline; number of regressions."""
+    regressions = 0
+    print(f"\n{'benchmark':36} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, metrics in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:36} {'-':>14} (not in baseline)")
+            continue
+        key = THROUGHPUT[name.split('/')[0]]
+        change = (metrics[key] / old[key] - 1) * 100 if old[key] else 0.0
+        flag = ''
+        if change < -tolerance:
+            regressions += 1
+            flag = '  REGRESSION'
+        elif 'bytes_per_frame' in old and metrics['bytes_per_frame'] > old['bytes_per_frame'] * (1 + tolerance / 100):
+            regressions += 1
+            flag = '  FRAME SIZE'
+        print(f"{name:36} {old[key]:14.0f} {metrics[key]:14.0f} {change:+7.1f}%{flag}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark LatencyMap parse/deltas/render stages and the connectors")
+    p.add_argument("--records", type=int, default=2000,
+                   help="Synthetic records per profile and format (default: 2000)")
+    p.add_argument("--buckets", type=int, default=12,
+                   help="Buckets per synthetic record (default: 12)")
+    p.add_argument("--rate", type=float, default=1.0,
+                   help="Synthetic records per second of source time, sets the timestamps (default: 1.0)")
+    p.add_argument("--window", type=int, default=90,
+                   help="Window width in columns, as --num_records (default: 90)")
+    p.add_argument("--frames", type=int, default=200,
+                   help="Frames rendered per render benchmark (default: 200)")
+    p.add_argument("--profile", action="append", choices=sorted(PROFILES),
+                   help="Datasource/unit profile of a connector; repeatable (default: all)")
+    p.add_argument("--datasource", choices=LatencyMap.BinaryRecordFormat.DATASOURCES, default=None,
+                   help="Override the datasource of the profiles")
+    p.add_argument("--unit", choices=LatencyMap.BinaryRecordFormat.UNITS, default=None,
+                   help="Override the latency unit of the profiles")
+    p.add_argument("--repeat", type=int, default=50,
+                   help="Copies of each SampleData capture fed to the connectors (default: 50)")
+    p.add_argument("--no_connectors", action="store_true",
+                   help="Skip the connector benchmarks")
+    p.add_argument("--rounds", type=int, default=3,
+                   help="Timed runs per benchmark, the fastest is kept (default: 3)")
+    p.add_argument("--json", metavar="FILE", default=None,
+                   help="Write the results as JSON to FILE")
+    p.add_argument("--baseline", metavar="FILE", default=None,
+                   help="Compare with the results of a previous --json run; exit status 1 on regressions")
+    p.add_argument("--tolerance", type=float, default=10.0,
+                   help="Percent slowdown (or frame size growth) reported as a regression (default: 10)")
+    args = p.parse_args(argv)
+
+    LatencyMap.g_params.parse_cli(["--num_records", str(args.window)])
+    config = {k: v for k, v in vars(args).items() if k not in ('json', 'baseline', 'tolerance')}
+    results: Dict[str, Dict[str, float]] = {}
+
+    for profile in args.profile or sorted(PROFILES):
+        datasource, unit = PROFILES[profile]
+        datasource, unit = args.datasource or datasource, args.unit or unit
+        histograms = list(synthetic_records(args.records, args.buckets, args.rate, unit))
+        for fmt, encode in (('text', encode_text), ('binary', encode_binary)):
+            data = encode(histograms, unit, datasource)
+            results[f"parse/{fmt}/{profile}"] = bench_parse(data, args.rounds)
+            if fmt == 'text':
+                # Deltas and render do not depend on the input format
+                results[f"deltas/{profile}"] = bench_deltas(data, args.rounds)
+                results[f"render/full/{profile}"] = bench_render(data, args.rounds, args.frames, False)
+                results[f"render/diff/{profile}"] = bench_render(data, args.rounds, args.frames, True)
+
+    if not args.no_connectors:
+        for name, (script, sample) in CONNECTORS.items():
+            for fmt in ('text', 'binary'):
+                results[f"connector/{fmt}/{name}"] = bench_connector(script, sample, args.repeat,
+                                                                     args.rounds, fmt == 'binary')
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'version': 1, 'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+                       'python': platform.python_version(), 'platform': platform.platform(),
+                       'config': config, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print("\nWARNING: the baseline was run with different options")
+        if compare(results, baseline['results'], args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
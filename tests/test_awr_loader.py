@@ -0,0 +1,91 @@
+"""AWR_oracle/awr_loader.py against a stand-in dba_hist_event_histogram table."""
+
+import datetime
+import importlib.util
+import io
+import os
+import sys
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+import LatencyMap  # noqa: E402
+
+spec = importlib.util.spec_from_file_location("awr_loader", os.path.join(ROOT, "AWR_oracle", "awr_loader.py"))
+awr_loader = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(awr_loader)
+
+DBID, INST = 1234, 1
+STARTUP_1 = datetime.datetime(2025, 9, 1, 8, 0)
+STARTUP_2 = datetime.datetime(2025, 9, 1, 11, 30)
+
+# snap_id, startup_time, {wait_time_milli: wait_count}, cumulative since instance startup
+SNAPSHOTS = [
+    (100, STARTUP_1, {1: 100, 2: 40, 8: 5}),
+    (101, STARTUP_1, {1: 250, 2: 90, 8: 9}),
+    (102, STARTUP_1, {1: 400, 2: 130, 8: 12}),
+    (103, STARTUP_2, {1: 30, 2: 10, 8: 1}),    # instance restart: new startup_time
+    (104, STARTUP_2, {1: 80, 2: 25, 8: 2}),
+    (105, STARTUP_2, {1: 20, 2: 25, 8: 2}),    # counter reset with the same startup_time
+    (106, STARTUP_2, {1: 70, 2: 35, 8: 4}),
+]
+
+
+def table_rows():
+    rows = []
+    for snap_id, startup_time, buckets in SNAPSHOTS:
+        end_time = datetime.datetime(2025, 9, 1, 9, 0) + datetime.timedelta(hours=snap_id - 100)
+        for wait_time_milli in sorted(buckets):
+            rows.append((snap_id, DBID, INST, end_time, startup_time, wait_time_milli, buckets[wait_time_milli]))
+    return rows
+
+
+class FakeCursor:
+    def __init__(self) -> None:
+        self.rows = []
+        self.arraysize = 1
+
+    def execute(self, sql, binds) -> None:
+        assert binds["event"] == "db file sequential read"
+        self.rows = table_rows()
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+class FakeConnection:
+    def cursor(self) -> FakeCursor:
+        return FakeCursor()
+
+    def close(self) -> None:
+        pass
+
+
+def test_restarts_keep_counts_cumulative(monkeypatch, capsys):
+    driver = types.ModuleType("fake_awr_dbapi")
+    driver.connect = lambda **kwargs: FakeConnection()
+    monkeypatch.setitem(sys.modules, "fake_awr_dbapi", driver)
+
+    assert awr_loader.main(["--driver", "fake_awr_dbapi"]) == 0
+    captured = capsys.readouterr()
+    assert "1 instance(s), 2 restart(s) handled" in captured.err
+
+    records = list(LatencyMap.RecordStreamParser(io.BytesIO(captured.out.encode())))
+    assert len(records) == len(SNAPSHOTS)
+    assert {rec.stream for rec in records} == {f"dbid {DBID} inst {INST}"}
+
+    # The counts carried over the restarts: cumulative, so every delta is non-negative
+    for previous, rec in zip(records, records[1:]):
+        rec.compute_deltas(previous, 0, 11)
+        assert all(frequency >= 0 for frequency in rec.frequency_histogram)
+    assert {k: v for k, v in records[-1].data.items() if k != "timestamp"} == {
+        0: 400 + 80 + 70, 1: 130 + 25 + 35, 3: 12 + 2 + 4}
+
+
+def test_first_snapshot_is_passed_through():
+    counts = awr_loader.RestartSafeCounts()
+    assert counts.adjust(STARTUP_1, {1: 5}) == {1: 5}
+    assert counts.adjust(STARTUP_1, {1: 8}) == {1: 8}
+    assert counts.restarts == 0
@@ -0,0 +1,87 @@
+"""BinaryRecordWriter and session files against the text protocol: records read back unchanged."""
+
+import io
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+import LatencyMap  # noqa: E402
+
+# llquantize-style record: log-linear values, a power of two with a line of its own first
+LOG_LINEAR = """<begin record>
+timestamp,microsec,1377520998000000,2013 Aug 26 12:43:18
+label, pread latency measured with DTrace llquantize
+latencyunit, nanosec
+datasource, dtrace
+8192,4
+9000,7
+10000,3
+20000,5
+30000,1
+<end record>
+"""
+
+
+def text_record(text: str) -> LatencyMap.LatencyRecord:
+    (rec,) = LatencyMap.RecordStreamParser(io.BytesIO(text.encode()))
+    return rec
+
+
+def assert_same_record(rec: LatencyMap.LatencyRecord, expected: LatencyMap.LatencyRecord) -> None:
+    assert rec.data == expected.data
+    assert rec.fine == expected.fine
+    assert rec.bucket_value_counts() == expected.bucket_value_counts()
+    assert (rec.date, rec.label, rec.latency_unit, rec.data_source) == \
+        (expected.date, expected.label, expected.latency_unit, expected.data_source)
+
+
+def test_binary_frames_carry_the_log_linear_values():
+    expected = text_record(LOG_LINEAR)
+    assert expected.fine == {8192: 4, 9000: 7, 10000: 3, 20000: 5, 30000: 1}
+
+    out = io.BytesIO()
+    writer = LatencyMap.BinaryRecordWriter(out)
+    for line in LOG_LINEAR.splitlines():
+        writer.write_text_line(line)
+    (rec,) = LatencyMap.RecordStreamParser(io.BytesIO(out.getvalue()))
+    assert_same_record(rec, expected)
+
+
+def test_power_of_two_records_have_no_values():
+    out = io.BytesIO()
+    LatencyMap.BinaryRecordWriter(out).write_record(1_700_000_000_000_000, {3: 5, 4: 9})
+    (rec,) = LatencyMap.RecordStreamParser(io.BytesIO(out.getvalue()))
+    assert rec.fine == {}
+    assert {k: v for k, v in rec.data.items() if k != "timestamp"} == {3: 5, 4: 9}
+
+
+def test_sessions_keep_the_log_linear_values(tmp_path):
+    expected = text_record(LOG_LINEAR)
+    path = str(tmp_path / "session.lms")
+    session = LatencyMap.SessionWriter(path)
+    session.append(expected)
+    session.close()
+    (rec,) = LatencyMap.SessionReader(path)
+    assert_same_record(rec, expected)
+
+
+def test_session_end_keeps_the_interleaved_records_in_range(tmp_path, monkeypatch):
+    # two streams, the second one 60 sec behind: blocks and records are not in time order
+    monkeypatch.setattr(LatencyMap.SessionFormat, "BLOCK_RECORDS", 2)
+    base = 1_700_000_000_000_000
+    path = str(tmp_path / "session.lms")
+    session = LatencyMap.SessionWriter(path)
+    for i in range(6):
+        for stream, lag in (("inst_id 1", 0), ("inst_id 2", 60)):
+            rec = LatencyMap.LatencyRecord()
+            rec.data = {"timestamp": base + (100 + 10 * i - lag) * 10**6, 0: i}
+            rec.stream = stream
+            session.append(rec)
+    session.close()
+
+    records = LatencyMap.SessionReader(path, base + 45 * 10**6, base + 125 * 10**6)
+    assert [(rec.stream, (rec.data["timestamp"] - base) // 10**6) for rec in records] == \
+        [("inst_id 1", 100), ("inst_id 1", 110), ("inst_id 2", 50), ("inst_id 1", 120),
+         ("inst_id 2", 60), ("inst_id 2", 70), ("inst_id 2", 80), ("inst_id 2", 90)]
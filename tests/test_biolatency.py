@@ -0,0 +1,127 @@
+"""BPF-bcc/pylatencymap-biolatency.py against stand-in BCC tables (plain dicts, ctypes keys)."""
+
+import ctypes as ct
+import importlib.util
+import io
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+import LatencyMap  # noqa: E402
+
+spec = importlib.util.spec_from_file_location(
+    "biolatency", os.path.join(ROOT, "BPF-bcc", "pylatencymap-biolatency.py"))
+biolatency = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(biolatency)
+
+
+class disk_key_t(ct.Structure):
+    _fields_ = [("dev", ct.c_uint32), ("slot", ct.c_uint64)]
+
+
+class flag_key_t(ct.Structure):
+    _fields_ = [("flags", ct.c_uint64), ("slot", ct.c_uint64)]
+
+
+class FakeTable(dict):
+    """
+    The dist map: (ctypes key, ctypes leaf) pairs in a dict indexed by the key bytes (ctypes
+    objects are not hashable), with items() and the batched lookup of bcc tables.
+    """
+
+    def __init__(self, items, batch_supported=True) -> None:
+        super().__init__((bytes(k), (k, v)) for k, v in items)
+        self.batch_supported = batch_supported
+        self.batch_calls = 0
+
+    def items(self):
+        return list(self.values())
+
+    def items_lookup_batch(self):
+        self.batch_calls += 1
+        if not self.batch_supported:
+            raise Exception("BPF_MAP_LOOKUP_BATCH failed")
+        return iter(self.items())
+
+
+def dev(major: int, minor: int) -> int:
+    return major << 20 | minor
+
+
+def percpu(*counts: int) -> ct.Array:
+    return (ct.c_ulonglong * len(counts))(*counts)
+
+
+def histograms(items, **kwargs):
+    counts, _ = biolatency.read_dist(FakeTable(items), False)
+    return biolatency.histograms_by_stream(counts, **kwargs)
+
+
+def test_plain_histogram_folds_slot_0_into_exponent_0():
+    items = [(ct.c_int(0), ct.c_ulonglong(2)), (ct.c_int(1), ct.c_ulonglong(3)),
+             (ct.c_int(4), ct.c_ulonglong(5)), (ct.c_int(5), ct.c_ulonglong(0))]
+    # slot n counts latencies in [2^(n-1), 2^n): exponent n - 1; slot 0 (< 1 unit) joins slot 1
+    assert histograms(items) == {"": {0: 5, 3: 5}}
+
+
+def test_empty_map_still_emits_the_default_stream():
+    assert histograms([]) == {"": {}}
+    assert histograms([], disks=True) == {}
+    assert histograms([], flags=True) == {}
+
+
+def test_disks_are_grouped_through_disklookup():
+    disklookup = {"8,0": "sda", "259,1": "nvme0n1"}
+    items = [(disk_key_t(dev(8, 0), 3), ct.c_ulonglong(4)),
+             (disk_key_t(dev(8, 0), 0), ct.c_ulonglong(1)),
+             (disk_key_t(dev(259, 1), 7), ct.c_ulonglong(9)),
+             (disk_key_t(dev(7, 3), 2), ct.c_ulonglong(6))]
+    assert histograms(items, disks=True, disklookup=disklookup) == \
+        {"sda": {2: 4, 0: 1}, "nvme0n1": {6: 9}, "?": {1: 6}}
+
+
+def test_flags_are_labelled_through_flags_print():
+    write_sync = 1 | biolatency.REQ_SYNC
+    items = [(flag_key_t(0, 2), ct.c_ulonglong(3)),
+             (flag_key_t(write_sync, 2), ct.c_ulonglong(1)),
+             (flag_key_t(write_sync, 6), ct.c_ulonglong(2))]
+    assert histograms(items, flags=True) == {"Read": {1: 3}, "Sync-Write": {1: 1, 5: 2}}
+
+
+def test_percpu_leaves_are_summed_in_a_batched_read():
+    dist = FakeTable([(ct.c_int(1), percpu(1, 0, 2, 3)), (ct.c_int(3), percpu(0, 0, 0, 0)),
+                      (ct.c_int(10), percpu(0, 5, 0, 1))])
+    counts, batch = biolatency.read_dist(dist, True)
+    assert batch and dist.batch_calls == 1
+    assert [(k.value, n) for k, n in counts] == [(1, 6), (3, 0), (10, 6)]
+    assert biolatency.histograms_by_stream(counts) == {"": {0: 6, 9: 6}}
+
+
+def test_batched_read_falls_back_to_items():
+    dist = FakeTable([(ct.c_int(2), percpu(1, 1))], batch_supported=False)
+    counts, batch = biolatency.read_dist(dist, True)
+    assert not batch
+    assert [(k.value, n) for k, n in counts] == [(2, 2)]
+
+
+def test_records_round_trip_through_latencymap():
+    disklookup = {"8,0": "sda", "8,16": "sdb"}
+    hist = histograms([(disk_key_t(dev(8, 0), 3), ct.c_ulonglong(4)),
+                       (disk_key_t(dev(8, 16), 5), ct.c_ulonglong(2))],
+                      disks=True, disklookup=disklookup)
+
+    text = io.StringIO()
+    biolatency.print_text_records(hist, 1_700_000_000_000_000, "microsec", out=text)
+    binary = io.BytesIO()
+    biolatency.write_binary_records(LatencyMap.BinaryRecordWriter(binary), hist,
+                                    1_700_000_000_000_000, "microsec")
+
+    for data in (text.getvalue().encode(), binary.getvalue()):
+        records = list(LatencyMap.RecordStreamParser(io.BytesIO(data)))
+        assert [rec.stream for rec in records] == ["sda", "sdb"]
+        assert all(rec.data_source == "bpf" and rec.latency_unit == "microsec" for rec in records)
+        assert {k: v for k, v in records[0].data.items() if k != "timestamp"} == {2: 4}
+        assert {k: v for k, v in records[1].data.items() if k != "timestamp"} == {4: 2}
+        assert records[1].label.endswith(" - sdb")
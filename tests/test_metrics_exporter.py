@@ -0,0 +1,79 @@
+"""MetricsExporter (--metrics_port) scraped on 127.0.0.1."""
+
+import io
+import os
+import sys
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import LatencyMap  # noqa: E402
+
+RECORDS = b"""<begin record>
+timestamp,microsec,1700000000000000,2023-11-14 22:13:20
+label,test
+latencyunit,microsec
+datasource,bpf
+stream,sda
+1,5
+4,3
+<end record>
+<begin record>
+timestamp,microsec,52011653754,26-AUG-13 04.26.51.653754 PM +02:00
+label,test
+latencyunit,millisec
+datasource,oracle
+stream,inst "1"
+1,10
+8,2
+<end record>
+"""
+
+
+@pytest.fixture
+def exporter():
+    metrics = LatencyMap.MetricsExporter(0, '127.0.0.1')
+    for rec in LatencyMap.RecordStreamParser(io.BytesIO(RECORDS)):
+        metrics.publish(rec)
+    yield metrics
+    metrics.server.shutdown()
+    metrics.server.server_close()
+
+
+def scrape(port: int, path: str = '/metrics'):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as response:
+        return response.headers['Content-Type'], response.read().decode('utf-8')
+
+
+def test_scrape_is_openmetrics(exporter):
+    assert exporter.port != 0
+    content_type, body = scrape(exporter.port)
+    assert content_type == LatencyMap.MetricsExporter.CONTENT_TYPE
+    lines = body.splitlines()
+    assert lines[0] == "# TYPE latencymap_latency_seconds histogram"
+    assert lines[1] == "# UNIT latencymap_latency_seconds seconds"
+    assert lines[-1] == "# EOF"
+    assert body.endswith("# EOF\n")
+
+    # bpf, microsec: 2^b is the lower bound of the bucket, counts cumulative over the buckets
+    sda = 'stream="sda",source="bpf"'
+    assert f'latencymap_latency_seconds_bucket{{{sda},le="2e-06"}} 5' in lines
+    assert f'latencymap_latency_seconds_bucket{{{sda},le="8e-06"}} 8' in lines
+    assert f'latencymap_latency_seconds_bucket{{{sda},le="+Inf"}} 8' in lines
+    assert f'latencymap_latency_seconds_count{{{sda}}} 8' in lines
+    assert f'latencymap_latency_seconds_sum{{{sda}}} {1.5 * (5 * 1 + 3 * 4) * 1e-6:.9g}' in lines
+
+    # oracle, millisec: 2^b is the upper bound; label values are escaped
+    inst = 'stream="inst \\"1\\"",source="oracle"'
+    assert f'latencymap_latency_seconds_bucket{{{inst},le="0.001"}} 10' in lines
+    assert f'latencymap_latency_seconds_bucket{{{inst},le="0.008"}} 12' in lines
+    assert f'latencymap_latency_seconds_count{{{inst}}} 12' in lines
+
+
+def test_other_paths_are_not_found(exporter):
+    with pytest.raises(urllib.error.HTTPError) as err:
+        scrape(exporter.port, '/')
+    assert err.value.code == 404
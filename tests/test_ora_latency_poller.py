@@ -0,0 +1,102 @@
+"""Event_histograms_oracle/ora_latency_poller.py against a stand-in DB-API driver."""
+
+import argparse
+import importlib.util
+import io
+import os
+import sys
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+import LatencyMap  # noqa: E402
+
+spec = importlib.util.spec_from_file_location(
+    "ora_latency_poller", os.path.join(ROOT, "Event_histograms_oracle", "ora_latency_poller.py"))
+poller = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(poller)
+
+ROWS = [(1, 1, 10), (1, 2, 5), (1, 1024, 1), (2, 1, 7), (2, 8, 3)]
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeCursor:
+    def __init__(self, conn) -> None:
+        self.conn = conn
+        self.arraysize = 1
+
+    def execute(self, query, binds) -> None:
+        self.conn.executed.append((query, dict(binds), self.conn.clock.now))
+        self.conn.clock.now += self.conn.query_seconds.pop(0) if self.conn.query_seconds else 0.5
+
+    def fetchall(self):
+        return list(ROWS)
+
+
+class FakeConnection:
+    def __init__(self, clock=None, query_seconds=None) -> None:
+        self.clock = clock or FakeClock()
+        self.query_seconds = list(query_seconds or [])
+        self.executed = []
+        self.cursors = 0
+        self.closed = False
+
+    def cursor(self) -> FakeCursor:
+        self.cursors += 1
+        return FakeCursor(self)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def poll_args(**kwargs) -> argparse.Namespace:
+    return argparse.Namespace(**dict(dict(event="db file sequential read", interval=3.0, count=4), **kwargs))
+
+
+def test_poll_is_drift_free(capsys):
+    clock = FakeClock()
+    conn = FakeConnection(clock)
+    assert poller.poll(conn, poll_args(), clock=clock, sleep=clock.sleep) == 4
+    # one cursor, one statement with a bind variable, samples on the 3 sec grid despite the query time
+    assert conn.cursors == 1
+    assert {query for query, _, _ in conn.executed} == {poller.QUERY}
+    assert [binds for _, binds, _ in conn.executed] == [{"event": "db file sequential read"}] * 4
+    assert [at for _, _, at in conn.executed] == [0.0, 3.0, 6.0, 9.0]
+
+
+def test_poll_skips_ticks_missed_by_a_slow_query(capsys):
+    clock = FakeClock()
+    conn = FakeConnection(clock, query_seconds=[0.5, 7.0, 0.5])
+    poller.poll(conn, poll_args(count=3), clock=clock, sleep=clock.sleep)
+    # the sample at 3 sec takes until 10 sec: the ticks at 6 and 9 are skipped, not bunched up
+    assert [at for _, _, at in conn.executed] == [0.0, 3.0, 12.0]
+
+
+def test_main_emits_one_stream_per_instance(monkeypatch, capsys):
+    conn = FakeConnection()
+    driver = types.ModuleType("fake_dbapi")
+    driver.connect = lambda **kwargs: conn
+    monkeypatch.setitem(sys.modules, "fake_dbapi", driver)
+
+    assert poller.main(["--driver", "fake_dbapi", "--count", "1", "-e", "log file sync"]) == 0
+    assert conn.closed
+
+    records = list(LatencyMap.RecordStreamParser(io.BytesIO(capsys.readouterr().out.encode())))
+    assert [rec.stream for rec in records] == ["inst_id 1", "inst_id 2"]
+    assert all(rec.data_source == "oracle" and rec.latency_unit == "microsec" for rec in records)
+    assert {k: v for k, v in records[0].data.items() if k != "timestamp"} == {0: 10, 1: 5, 10: 1}
+    assert {k: v for k, v in records[1].data.items() if k != "timestamp"} == {0: 7, 3: 3}
+    assert "log file sync" in records[0].label